@@ -1,21 +1,34 @@
+import asyncio
+import atexit
 import os
 from dotenv import dotenv_values
-from langchain_community.graphs import Neo4jGraph
-from langchain_community.llms import HuggingFaceEndpoint
-from langchain.memory import ConversationBufferMemory
 
 import chainlit as cl
-from chainlit.input_widget import Select, Slider, TextInput
+from chainlit.input_widget import Select, Slider, Switch, TextInput
 from chainlit.playground.config import add_llm_provider
 from chainlit.playground.providers.langchain import LangchainGenericProvider
+from langchain_core.runnables import RunnableLambda
 
 #from langfuse import Langfuse
 #from langfuse.callback import CallbackHandler
 
-from src.genaiti.callbacks import PostMessageHandler
+from src.genaiti.cache import AnswerCache, QueryResultCache
+from src.genaiti.callbacks import PostMessageHandler, StreamingAnswerHandler
+from src.genaiti.context import ContextCompactor
+from src.genaiti.examples import ExampleStore
 from src.genaiti.graph_chain import GraphCypherQAChain
-from src.genaiti.prompts_template import *
-from src.genaiti.utils import parse_conversation_history
+from src.genaiti.graphs import graph_registry
+from src.genaiti.hedging import HedgedLLM
+from src.genaiti.history import (ConversationHistory, llm_summarizer, steps_page_loader,
+                                 thread_messages)
+from src.genaiti.llms import configure_http_pool, llm_registry
+from src.genaiti.local_llm import LOCAL_PREFIX, configure_local_models
+from src.genaiti.metrics import build_metrics
+from src.genaiti.prompt_registry import prompt_registry
+from src.genaiti.router import QuestionRouter
+from src.genaiti.scheduler import LLMScheduler, unwrap_llm
+from src.genaiti.schema import SchemaIndex, SchemaSnapshot
+from src.genaiti.singleflight import SingleFlight
 
 
 env_config = {
@@ -24,10 +37,81 @@ env_config = {
     **os.environ,  # override loaded values with environment variables
 }
 
-CYPHER_GENERATION_PROMPT = build_prompt_cypher_generator()
-CYPHER_QA_PROMPT = build_prompt_cypher_qa_generator()
-QUESTION_VALIDATION_PROMPT = build_question_validation_prompt()
-SAFETY_PROMPT = build_safety_prompt()
+# built once, without the indentation whitespace of the templates
+CYPHER_GENERATION_PROMPT = prompt_registry.get("cypher_generation", with_examples=True)
+CYPHER_QA_PROMPT = prompt_registry.get("qa")
+QUESTION_VALIDATION_PROMPT = prompt_registry.get("validation")
+SAFETY_PROMPT = prompt_registry.get("safety")
+
+# HuggingFace models offered in the settings (and used as hedging alternates)
+HF_MODELS = ["databricks/dbrx-instruct",
+             "mistralai/Mixtral-8x7B-Instruct-v0.1",
+             "stabilityai/stable-code-instruct-3b",
+             "mistralai/Mistral-7B-Instruct-v0.2"]
+
+# quantized GGUF models run offline on CPU (e.g. for the checker and cypher stages)
+LOCAL_MODEL_PATHS = [path.strip() for path in
+                     env_config.get('LOCAL_LLM_MODELS', '').split(',') if path.strip()]
+LOCAL_MODELS = [f"{LOCAL_PREFIX}{path}" for path in LOCAL_MODEL_PATHS]
+
+# shared by every chat session: repeated questions skip the LLM and Neo4j calls
+ANSWER_CACHE = AnswerCache()
+QUERY_CACHE = QueryResultCache()
+# sessions asking the same question at the same moment share one chain run
+SINGLE_FLIGHT = SingleFlight()
+
+# graph schema persisted on disk: no APOC introspection when a session opens
+SCHEMA_SNAPSHOT = SchemaSnapshot(
+    path=env_config.get('NEO4J_SCHEMA_SNAPSHOT', 'schema_snapshot.json')
+)
+SCHEMA_SNAPSHOT.load()
+
+# cypher prompt restricted to the labels a question is about
+SCHEMA_INDEX = SchemaIndex(SCHEMA_SNAPSHOT)
+
+# verified question/cypher pairs: prompt examples and cypher LLM bypass
+EXAMPLE_STORE = ExampleStore(
+    path=env_config.get('CYPHER_EXAMPLES_PATH', 'cypher_examples.json')
+)
+EXAMPLE_STORE.load()
+atexit.register(EXAMPLE_STORE.flush)
+
+# QA prompt context without the heavy node properties (html, xml, raw data)
+CONTEXT_COMPACTOR = ContextCompactor(
+    SCHEMA_SNAPSHOT,
+    max_tokens=int(env_config.get('QA_CONTEXT_MAX_TOKENS', 1024))
+)
+
+# local classifier skipping the checker LLM call for obvious questions
+QUESTION_ROUTER = QuestionRouter.from_snapshot(SCHEMA_SNAPSHOT)
+
+# per-stage latency, token and row metrics (prometheus endpoint or opentelemetry)
+METRICS = build_metrics(
+    env_config.get('GENAITI_METRICS'),
+    port=int(env_config.get('GENAITI_METRICS_PORT', 9464)),
+    otlp_endpoint=env_config.get('OTEL_EXPORTER_OTLP_ENDPOINT'),
+)
+
+# process-wide admission control of the endpoint calls (checker calls first,
+# 429 responses retried with backoff)
+LLM_SCHEDULER = LLMScheduler(
+    max_concurrency=int(env_config.get('LLM_MAX_CONCURRENCY', 4)),
+    rate=float(env_config.get('LLM_RATE_LIMIT', 0)) or None,
+    burst=int(env_config.get('LLM_RATE_BURST', 4)),
+    metrics=METRICS,
+)
+
+# keep-alive connections to the inference API shared by every LLM client
+configure_http_pool()
+
+# local models are loaded once, in the background, before the first question
+configure_local_models(
+    LOCAL_MODEL_PATHS,
+    instances=int(env_config.get('LOCAL_LLM_INSTANCES', 1)),
+    n_ctx=int(env_config.get('LOCAL_LLM_N_CTX', 4096)),
+    n_threads=int(env_config.get('LOCAL_LLM_THREADS', 0)) or None,
+    prompt_cache_bytes=int(env_config.get('LOCAL_LLM_PROMPT_CACHE_MB', 256)) * 2**20,
+)
 
 #langfuse = Langfuse()
 # Initialize Langfuse CallbackHandler for Langchain (tracing)
@@ -44,35 +128,89 @@ def rename(orig_author):
     }
     return mapping.get(orig_author, orig_author)
 
-@cl.cache
-def get_chat_memory():
-    return ConversationBufferMemory(memory_key="chat_history")
+async def session_qa_llm(prompt):
+    # LLM of the current session chain (rebuilt when the settings change)
+    return await cl.user_session.get("chain").qa_chain.llm.ainvoke(prompt)
+
+# evicted history turns folded into a summary by the session QA LLM
+HISTORY_SUMMARIZER = (
+    llm_summarizer(RunnableLambda(session_qa_llm))
+    if env_config.get('CHAT_HISTORY_SUMMARY', 'false').lower() == 'true' else None
+)
+
+def new_conversation_history():
+    """Token bounded history of a chat session, older turns summarized if enabled."""
+    return ConversationHistory(
+        max_tokens=int(env_config.get('CHAT_HISTORY_MAX_TOKENS', 512)),
+        summarizer=HISTORY_SUMMARIZER
+    )
+
+# messages loaded when a chat is resumed, older ones are paged in afterwards
+CHAT_RESUME_TURNS = int(env_config.get('CHAT_RESUME_TURNS', 20))
+
 
 @cl.on_chat_resume
 async def on_chat_resume(thread):
-    memory = ConversationBufferMemory(return_messages=True)
-    root_messages = [m for m in thread["steps"] if m["parentId"] == None]
-    for message in root_messages:
-        if message["type"] == "human":
-            memory.chat_memory.add_user_message(message["content"])
+    # only the last turns are walked: resuming does not depend on the thread length
+    messages, cursor = thread_messages(thread["steps"], count=CHAT_RESUME_TURNS)
+    # older pages come from the steps already given, not from the data layer again
+    history = new_conversation_history().resume(
+        messages, cursor, loader=steps_page_loader(thread["steps"])
+    )
+    if history.has_older:
+        # stops as soon as the window is full
+        await history.aload_older(CHAT_RESUME_TURNS)
+
+    cl.user_session.set("history", history)
+
+
+def release_chain_llms(chain):
+    """Give back the LLM clients acquired by `build_graph_chain`."""
+    if chain is None:
+        return
+    for llm_chain in (chain.qa_chain, chain.cypher_generation_chain, chain.checker_chain):
+        llm = unwrap_llm(llm_chain.llm)
+        if isinstance(llm, HedgedLLM):
+            for hedged_llm in llm.llms:
+                llm_registry.release(hedged_llm)
         else:
-            memory.chat_memory.add_ai_message(message["content"])
-
-    #cl.user_session.set("memory", memory)
+            llm_registry.release(llm)
+
+
+def acquire_stage_llm(settings, repo_id, **llm_params):
+    """Borrow the LLM of a stage, hedged by the other models if enabled."""
+    llm = llm_registry.acquire(repo_id=repo_id, **llm_params)
+    if not settings.get('hedged'):
+        return llm
+    # a slow or cold endpoint is raced by the other models after `hedge_delay`
+    alternates = [llm_registry.acquire(repo_id=other, **llm_params)
+                  for other in HF_MODELS if other != repo_id]
+    return HedgedLLM(
+        llms=[llm, *alternates],
+        hedge_delay=settings.get('hedge_delay', 2.0),
+        streaming=llm_params.get('streaming', False),
+    )
 
 
 async def build_graph_chain(settings, CYPHER_QA_PROMPT, CYPHER_GENERATION_PROMPT,
-                            SAFETY_PROMPT, QUESTION_VALIDATION_PROMPT):
+                            SAFETY_PROMPT, QUESTION_VALIDATION_PROMPT, graph=None):
     llm = None
 
-    graph = Neo4jGraph(
-        url=env_config['NEO4J_URI'], 
-        username=env_config['NEO4J_USERNAME'], 
-        password=env_config['NEO4J_PASSWORD']
-    )
+    # borrow the process-wide graph: no new driver nor schema scan per session
+    if graph is None:
+        graph = graph_registry.acquire(
+            url=env_config['NEO4J_URI'], 
+            username=env_config['NEO4J_USERNAME'], 
+            password=env_config['NEO4J_PASSWORD'],
+            refresh_schema=False
+        )
+        SCHEMA_SNAPSHOT.attach(graph)
+        SCHEMA_SNAPSHOT.start_background_refresh(
+            graph, interval=float(env_config.get('NEO4J_SCHEMA_REFRESH_INTERVAL', 3600))
+        )
 
-    llm = HuggingFaceEndpoint(
-        repo_id=settings['qa_llm'],
+    # clients are shared between sessions using the same model and parameters
+    llm_params = dict(
         task=settings['model_task'].strip(),
         max_new_tokens=settings['max_new_token'],
         top_k=settings['top_k'],
@@ -80,28 +218,19 @@ async def build_graph_chain(settings, CYPHER_QA_PROMPT, CYPHER_GENERATION_PROMPT
         repetition_penalty=settings['repetition_penalty'],
         #model_kwargs={"add_to_git_credential":True} 
     )
+    llm = acquire_stage_llm(
+        settings,
+        settings['qa_llm'],
+        # final answer tokens are streamed to the user
+        streaming=True,
+        **llm_params
+    )
     if settings['cypher_llm']:
-        llm_cypher = HuggingFaceEndpoint(
-            repo_id=settings['cypher_llm'],
-            task=settings['model_task'].strip(),
-            max_new_tokens=settings['max_new_token'],
-            top_k=settings['top_k'],
-            temperature=settings['temperature'],
-            repetition_penalty=settings['repetition_penalty'],
-            #model_kwargs={"add_to_git_credential":True} 
-        )
-    else: llm_cypher = llm
+        llm_cypher = acquire_stage_llm(settings, settings['cypher_llm'], **llm_params)
+    else: llm_cypher = acquire_stage_llm(settings, settings['qa_llm'], streaming=True, **llm_params)
     if settings['validate_llm']:
-        llm_checker = HuggingFaceEndpoint(
-            repo_id=settings['validate_llm'],
-            task=settings['model_task'].strip(),
-            max_new_tokens=settings['max_new_token'],
-            top_k=settings['top_k'],
-            temperature=settings['temperature'],
-            repetition_penalty=settings['repetition_penalty'],
-            #model_kwargs={"add_to_git_credential":True} 
-        )
-    else: llm_checker = llm
+        llm_checker = acquire_stage_llm(settings, settings['validate_llm'], **llm_params)
+    else: llm_checker = acquire_stage_llm(settings, settings['qa_llm'], streaming=True, **llm_params)
 
     chain = GraphCypherQAChain.from_llm(
         llm=llm, 
@@ -116,6 +245,17 @@ async def build_graph_chain(settings, CYPHER_QA_PROMPT, CYPHER_GENERATION_PROMPT
         exclude_types=[],
         include_types=[],
         verbose=False,
+        answer_cache=ANSWER_CACHE,
+        query_cache=QUERY_CACHE,
+        schema_snapshot=SCHEMA_SNAPSHOT,
+        question_router=QUESTION_ROUTER,
+        speculative=settings.get('speculative', False),
+        schema_index=SCHEMA_INDEX,
+        example_store=EXAMPLE_STORE,
+        context_compactor=CONTEXT_COMPACTOR,
+        metrics=METRICS,
+        single_flight=SINGLE_FLIGHT,
+        scheduler=LLM_SCHEDULER,
         cypher_llm_kwargs={
             "prompt": CYPHER_GENERATION_PROMPT,
             #"stop":4,
@@ -181,28 +321,19 @@ async def on_chat_start():
             Select(
                 id="qa_llm",
                 label="HuggingFace LLM for final generation",
-                values=["databricks/dbrx-instruct",
-                        "mistralai/Mixtral-8x7B-Instruct-v0.1",  
-                        "stabilityai/stable-code-instruct-3b",
-                        "mistralai/Mistral-7B-Instruct-v0.2"],
+                values=HF_MODELS + LOCAL_MODELS,
                 initial_index=3,
             ),
             Select(
                 id="cypher_llm",
                 label="HuggingFace LLM for cypher extraction and generation",
-                values=["databricks/dbrx-instruct",
-                        "mistralai/Mixtral-8x7B-Instruct-v0.1", 
-                        "stabilityai/stable-code-instruct-3b",
-                        "mistralai/Mistral-7B-Instruct-v0.2"],
+                values=HF_MODELS + LOCAL_MODELS,
                 initial_index=3,
             ),
             Select(
                 id="validate_llm",
                 label="HuggingFace LLM to validate cypher command generated",
-                values=["databricks/dbrx-instruct",
-                        "mistralai/Mixtral-8x7B-Instruct-v0.1", 
-                        "stabilityai/stable-code-instruct-3b",
-                        "mistralai/Mistral-7B-Instruct-v0.2"],
+                values=HF_MODELS + LOCAL_MODELS,
                 initial_index=3,
             ),
             Select(
@@ -243,6 +374,24 @@ async def on_chat_start():
                 max=10,
                 step=0.1,
             ),
+            Switch(
+                id="speculative",
+                label="Generate cypher while validating the question (speculative)",
+                initial=False,
+            ),
+            Switch(
+                id="hedged",
+                label="Race a slow model with the other models (hedged requests)",
+                initial=False,
+            ),
+            Slider(
+                id="hedge_delay",
+                label="Seconds before hedging a request",
+                initial=2,
+                min=0.5,
+                max=10,
+                step=0.5,
+            ),
             TextInput(id="AgentName", label="Agent Name", 
                       initial="NTeALan Bot"),
         ]
@@ -264,8 +413,7 @@ async def on_chat_start():
     handler_langfuse = trace.get_langchain_handler()
     """
 
-    #chat_memory = get_chat_memory()
-    #await chat_memory.chat_memory.aclear()
+    history = new_conversation_history()
 
     # Add the LLM provider
     add_llm_provider(
@@ -283,7 +431,7 @@ async def on_chat_start():
     
     #cl.user_session.set("handler_langfuse", handler_langfuse)
     cl.user_session.set("chain", chain)
-    #cl.user_session.set("chat_memory", chat_memory) 
+    cl.user_session.set("history", history)
     cl.user_session.set("settings", settings)
     cl.user_session.set("neo4j_graph", graph)
     cl.user_session.set("cypher_qa_prompt", CYPHER_QA_PROMPT) 
@@ -297,14 +445,17 @@ async def update_setup_agent(settings):
     CYPHER_GENERATION_PROMPT = cl.user_session.get("cypher_generation_prompt")
     QUESTION_VALIDATION_PROMPT = cl.user_session.get("validation_prompt")
     SAFETY_PROMPT = cl.user_session.get("safety_prompt")
-    # graph = cl.user_session.get("graph")
+    graph = cl.user_session.get("neo4j_graph")
+    previous_chain = cl.user_session.get("chain")
 
     _,_, graph, chain = await build_graph_chain(settings,
                                         CYPHER_QA_PROMPT,
                                         CYPHER_GENERATION_PROMPT,
                                         SAFETY_PROMPT,
-                                        QUESTION_VALIDATION_PROMPT)
+                                        QUESTION_VALIDATION_PROMPT,
+                                        graph=graph)
     # chain.return_intermediate_steps = False
+    release_chain_llms(previous_chain)
     cl.user_session.set("neo4j_graph", graph)
     cl.user_session.set("chain", chain) 
     cl.user_session.set("settings", settings)
@@ -313,46 +464,44 @@ async def update_setup_agent(settings):
 @cl.on_message
 async def on_message(message: cl.Message):
     chain = cl.user_session.get("chain")
-    #memory = cl.user_session.get("chat_memory")
+    history = cl.user_session.get("history")
     #handler_langfuse = cl.user_session.get("handler_langfuse")
     msg = cl.Message(content="")
 
-    #conversation_history = parse_conversation_history(memory.chat_memory.json())
-    #conversation_history = "" if len(conversation_history) == 0 else f"\n{conversation_history}\n\n"
+    # pre-rendered, O(1) per turn (the prompts do not take it yet)
+    #conversation_history = history.prompt_history()
     
-    #memory.chat_memory.add_user_message(message.content)
+    history.add_user_message(message.content)
     
-    """
-    res = ""
-    async for chunk in chain.astream(
-            input=message.content, 
-            #history=conversation_history,
-            callbacks=[cl.LangchainCallbackHandler()]
-        ):
-        res += chunk
-        await msg.stream_token(chunk)
-    """   
+    # the final answer is streamed into msg while it is generated
     res = await chain.arun(
             query=message.content, 
             #history=conversation_history,
             callbacks=[
                 cl.LangchainCallbackHandler(),
                 PostMessageHandler(msg),
+                StreamingAnswerHandler(msg),
                 #langfuse_callback_handler,
                 #handler_langfuse
             ]
     )
 
+    # replace the streamed text by the exact answer (markers fully removed)
     msg.content = res
     await msg.send()
     
-    #memory.chat_memory.add_ai_message(res)
+    history.add_ai_message(res)
+    if history.needs_summary:
+        # older turns are summarized after the answer is sent
+        asyncio.create_task(history.asummarize())
 
     
 
 
 @cl.on_chat_end
 def on_chat_end():
+    graph_registry.release(cl.user_session.get("neo4j_graph"))
+    release_chain_llms(cl.user_session.get("chain"))
     print("The user disconnected!")
 
 
@@ -0,0 +1,23 @@
+"""Offline benchmarks of the GraphCypherQAChain pipeline.
+
+Run them from the repository root:
+
+    python -m src.benchmarks --output results.json
+    python -m src.benchmarks --compare results.json
+
+Everything runs without Neo4j nor HuggingFace: `FixtureGraph` serves data
+shaped like `src/docs/cypher_dictionary_structure.md` and `FakePipelineLLM`
+answers every stage with a configurable latency. `FakeInferenceServer`
+serves the text-generation-inference protocol on a local port, to run the
+real HuggingFace clients (e.g. behind `HedgedLLM`) offline.
+"""
+from .fake_endpoints import FakeInferenceServer, fake_endpoint_llm
+from .fake_llms import FakePipelineLLM
+from .fixtures import BENCHMARK_QUESTIONS, FixtureGraph, load_docs_schema
+from .micro import MICRO_BENCHMARKS, micro_benchmark, run_micro_benchmarks
+from .scenarios import SCENARIOS, build_chain, run_scenarios, scenario
+
+__all__ = ["FakePipelineLLM", "FakeInferenceServer", "fake_endpoint_llm",
+           "FixtureGraph", "load_docs_schema", "BENCHMARK_QUESTIONS",
+           "MICRO_BENCHMARKS", "micro_benchmark", "run_micro_benchmarks",
+           "SCENARIOS", "scenario", "run_scenarios", "build_chain"]
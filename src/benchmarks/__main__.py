@@ -0,0 +1,92 @@
+"""Offline benchmarks of the chain: micro-benchmarks and end-to-end scenarios."""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import warnings
+from typing import Any, Dict, Optional
+
+from .micro import run_micro_benchmarks
+from .scenarios import run_scenarios
+
+# metric -> True if higher is better
+_COMPARED_METRICS = {"median_us": False, "p50_ms": False, "p95_ms": False, "p99_ms": False,
+                     "elapsed_ms": False, "throughput_qps": True}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(base: Dict[str, Any], current: Dict[str, Any]) -> str:
+    """Table of the relative change of each metric between two result files."""
+    lines = [f"{'benchmark':45} {'metric':15} {'base':>12} {'current':>12} {'change':>8}"]
+    for section in ("micro", "scenarios"):
+        for name, metrics in current.get(section, {}).items():
+            base_metrics = base.get(section, {}).get(name, {})
+            for metric, higher_is_better in _COMPARED_METRICS.items():
+                if metric not in metrics or metric not in base_metrics:
+                    continue
+                before, after = base_metrics[metric], metrics[metric]
+                change = (after - before) / before * 100 if before else 0.0
+                better = change > 0 if higher_is_better else change < 0
+                flag = "+" if better and abs(change) >= 5 else "-" if abs(change) >= 5 else " "
+                lines.append(f"{name:45} {metric:15} {before:12.2f} {after:12.2f} "
+                             f"{change:7.1f}% {flag}")
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.benchmarks",
+                                     description=__doc__)
+    parser.add_argument("--only", nargs="*", help="run the benchmarks whose name contains one of these")
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--skip-scenarios", action="store_true")
+    parser.add_argument("--rounds", type=int, default=3, help="passes over the question set")
+    parser.add_argument("--llm-latency", type=float, default=0.02, help="seconds per fake LLM call")
+    parser.add_argument("--graph-latency", type=float, default=0.002, help="seconds per graph query")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=5, help="repetitions of each micro-benchmark")
+    parser.add_argument("--output", help="JSON file receiving the results (default: stdout)")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare with")
+    args = parser.parse_args(argv)
+    # langchain 0.1 deprecation notices of run/arun/acall
+    warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+    results: Dict[str, Any] = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+    }
+    if not args.skip_micro:
+        results["micro"] = run_micro_benchmarks(args.only, repeat=args.repeat)
+    if not args.skip_scenarios:
+        results["scenarios"] = run_scenarios(
+            args.only, rounds=args.rounds, llm_latency=args.llm_latency,
+            graph_latency=args.graph_latency, concurrency=args.concurrency,
+        )
+
+    output = json.dumps(results, indent=1, default=str)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print(compare(json.load(f), results), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+from langchain_community.llms import HuggingFaceEndpoint
+
+__all__ = ["FakeInferenceServer", "fake_endpoint_llm"]
+
+
+class FakeInferenceServer:
+    """Local HTTP server speaking the text-generation-inference protocol.
+
+    Each request waits `latency` seconds, or `slow_latency` for a fraction
+    `slow_rate` of them (a cold or overloaded endpoint), and fails with an
+    HTTP 500 for a fraction `error_rate`. Streamed requests send one
+    server-sent event per word of `text`, `token_latency` seconds apart.
+    With `capacity`, requests beyond `capacity` concurrent ones are
+    rejected at once with an HTTP 429 (rate limited endpoint).
+    """
+
+    def __init__(self, latency: float = 0.05, slow_latency: float = 1.0,
+                 slow_rate: float = 0.0, error_rate: float = 0.0,
+                 token_latency: float = 0.0, text: str = "Le mot mbwa signifie chien.",
+                 capacity: Optional[int] = None, seed: int = 0):
+        self.latency = latency
+        self.slow_latency = slow_latency
+        self.slow_rate = slow_rate
+        self.error_rate = error_rate
+        self.token_latency = token_latency
+        self.text = text
+        self.capacity = capacity
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        self.active = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _admit(self) -> bool:
+        with self._lock:
+            if self.capacity is not None and self.active >= self.capacity:
+                self.rejected += 1
+                return False
+            self.active += 1
+            return True
+
+    def _leave(self) -> None:
+        with self._lock:
+            self.active -= 1
+
+    def _draw(self) -> "tuple[float, bool]":
+        with self._lock:
+            self.requests += 1
+            slow = self._random.random() < self.slow_rate
+            failed = self._random.random() < self.error_rate
+            self.errors += failed
+        return (self.slow_latency if slow else self.latency), failed
+
+    def _handler(self) -> type:
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self) -> None:
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if not server._admit():
+                    self._send(429, {"error": "Rate limit reached"})
+                    return
+                try:
+                    latency, failed = server._draw()
+                    time.sleep(latency)
+                    if failed:
+                        self._send(500, {"error": "fake endpoint failure"})
+                    elif payload.get("stream"):
+                        self._stream(server.text)
+                    else:
+                        self._send(200, [{"generated_text": server.text}])
+                except ConnectionError:
+                    # the client gave up, e.g. a cancelled hedged request
+                    self.close_connection = True
+                finally:
+                    server._leave()
+
+            def _send(self, status: int, body: Any) -> None:
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, text: str) -> None:
+                words = text.split(" ")
+                events = []
+                for i, word in enumerate(words):
+                    token = {"id": i, "text": word if i == 0 else f" {word}",
+                             "logprob": 0.0, "special": False}
+                    last = i == len(words) - 1
+                    events.append({"token": token, "index": i,
+                                   "generated_text": text if last else None, "details": None})
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for i, event in enumerate(events):
+                    if i and server.token_latency:
+                        time.sleep(server.token_latency)
+                    data = f"data:{json.dumps(event)}\n\n".encode("utf-8")
+                    self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        return _Handler
+
+
+def fake_endpoint_llm(server: FakeInferenceServer, streaming: bool = False,
+                      timeout: float = 30, **kwargs: Any) -> HuggingFaceEndpoint:
+    """`HuggingFaceEndpoint` posting to a fake server, without Hub login."""
+    from huggingface_hub import AsyncInferenceClient, InferenceClient
+
+    params: Dict[str, Optional[Any]] = dict(
+        endpoint_url=server.url, model=server.url, task="text-generation",
+        streaming=streaming, timeout=timeout, max_new_tokens=64,
+        client=InferenceClient(model=server.url, timeout=timeout),
+        async_client=AsyncInferenceClient(model=server.url, timeout=timeout),
+    )
+    params.update(kwargs)
+    # `construct` skips the validator logging in to the Hub
+    return HuggingFaceEndpoint.construct(**params)
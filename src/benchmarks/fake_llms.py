@@ -0,0 +1,122 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models.llms import LLM
+
+__all__ = ["FakePipelineLLM", "detect_stage", "DEFAULT_CYPHER_BY_KEYWORD"]
+
+# question keyword -> Cypher statement returned by the fake Cypher LLM
+DEFAULT_CYPHER_BY_KEYWORD = {
+    "radica": "MATCH (r:NeoRadical) WHERE r.value CONTAINS 'mba' RETURN r",
+    "traduction": "MATCH (t:NeoTranslation) RETURN t",
+    "exemple": "MATCH (e:NeoExample) RETURN e",
+    "variante": "MATCH (v:NeoVariant)<-[:WORD_IS_USED_IN]-(w:NeoWord) RETURN w",
+    "language": "MATCH (l:NeoLanguage) RETURN l",
+    "combien": "MATCH (d:NeoDictionary) RETURN count(d) AS dictionaries",
+    "dictionna": "MATCH (d:NeoDictionary) RETURN d",
+}
+_DEFAULT_CYPHER = "MATCH (d:NeoDictionary)<-[:ARTICLE_IS_USED_IN]-(a:NeoArticle) RETURN a"
+
+_SMALL_TALK = ("bonjour", "merci", "salut", "hello", "thanks", "qui est")
+
+
+def detect_stage(prompt: str) -> str:
+    """Pipeline stage of a prompt built from `prompts_template`."""
+    if "Generate only Cypher statement" in prompt:
+        return "cypher"
+    if "translated into cypher valid command" in prompt:
+        return "validation"
+    if "Safety bot" in prompt:
+        return "safety"
+    return "qa"
+
+
+def _question(prompt: str, stage: str) -> str:
+    marker = "Based on this question:" if stage == "validation" else "Question:"
+    tail = prompt.rsplit(marker, 1)[-1].strip()
+    return tail.splitlines()[0].strip() if tail else ""
+
+
+class FakePipelineLLM(LLM):
+    """Deterministic LLM answering every stage of the chain offline.
+
+    The output depends only on the prompt: validation answers `True` unless
+    the question is small talk, Cypher generation picks a statement from
+    `cypher_by_keyword` and the QA stage answers with a marker and
+    `answer_tokens` words. Each call waits `latency` seconds plus
+    `token_latency` per generated word, and is recorded in `stage_seconds`.
+    """
+
+    latency: float = 0.0
+    token_latency: float = 0.0
+    answer_tokens: int = 20
+    cypher_by_keyword: Dict[str, str] = DEFAULT_CYPHER_BY_KEYWORD
+    calls: Dict[str, int] = {}
+    stage_seconds: Dict[str, float] = {}
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-pipeline"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"latency": self.latency, "token_latency": self.token_latency,
+                "answer_tokens": self.answer_tokens}
+
+    def reset(self) -> None:
+        self.calls = {}
+        self.stage_seconds = {}
+
+    def _output(self, prompt: str) -> str:
+        stage = detect_stage(prompt)
+        question = _question(prompt, stage).lower()
+        if stage in ("validation", "safety"):
+            return "False" if any(w in question for w in _SMALL_TALK) else "True"
+        if stage == "cypher":
+            for keyword, cypher in self.cypher_by_keyword.items():
+                if keyword in question:
+                    return cypher
+            return _DEFAULT_CYPHER
+        words = " ".join(f"mot{i}" for i in range(self.answer_tokens))
+        return f">Réponse utile: {words}"
+
+    def _record(self, prompt: str, seconds: float) -> None:
+        stage = detect_stage(prompt)
+        self.calls[stage] = self.calls.get(stage, 0) + 1
+        self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+
+    def _delay(self, output: str) -> float:
+        return self.latency + self.token_latency * len(output.split())
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        started = time.perf_counter()
+        output = self._output(prompt)
+        if self._delay(output):
+            time.sleep(self._delay(output))
+        self._record(prompt, time.perf_counter() - started)
+        return output
+
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        started = time.perf_counter()
+        output = self._output(prompt)
+        if self._delay(output):
+            await asyncio.sleep(self._delay(output))
+        self._record(prompt, time.perf_counter() - started)
+        return output
@@ -0,0 +1,202 @@
+import asyncio
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from langchain_community.graphs.graph_store import GraphStore
+
+from ..genaiti.cypher import BATCH_ROW, alias_return_items
+
+__all__ = ["DOCS_SCHEMA_PATH", "load_docs_schema", "FixtureGraph", "BENCHMARK_QUESTIONS",
+           "CORRECTOR_QUERIES"]
+
+DOCS_SCHEMA_PATH = Path(__file__).resolve().parents[1] / "docs" / "cypher_dictionary_structure.md"
+
+# properties holding whole documents in the real graph
+HEAVY_PROPERTIES = {"html_version": 1800, "xml_version": 2200, "raw_data": 1500,
+                    "search_vector": 600, "description": 400}
+
+# (question, is data question) in the proportions seen by the chat
+BENCHMARK_QUESTIONS = [
+    ("Bonjour, comment tu vas ?", False),
+    ("combien de dictionnaires as-tu ?", True),
+    ("liste les dictionnaires", True),
+    ("Donne moi les radicaux qui contiennent mba", True),
+    ("Quelle est la traduction du mot mbwa ?", True),
+    ("Merci beaucoup pour ton aide", False),
+    ("Affiche les exemples du mot ngando", True),
+    ("List all the words of the ghomala dictionary", True),
+    ("Quelles sont les variantes du mot bato ?", True),
+    ("Which languages are in the database?", True),
+]
+
+# Cypher statements as generated by the Cypher LLM: valid, reversed (to be
+# corrected), impossible (rejected) and long multi-hop patterns
+CORRECTOR_QUERIES = [
+    "MATCH (r:NeoRadical) WHERE r.value CONTAINS 'mba' RETURN r",
+    "MATCH (a:NeoArticle)-[:ARTICLE_IS_USED_IN]->(d:NeoDictionary) RETURN a LIMIT 10",
+    "MATCH (d:NeoDictionary)-[:ARTICLE_IS_USED_IN]->(a:NeoArticle) RETURN a LIMIT 10",
+    "MATCH (w:NeoWord)<-[:RADICAL_IS_FOUND_IN]-(r:NeoRadical) WHERE r.value = 'mba' RETURN w",
+    "MATCH (w:NeoWord)-[:RADICAL_IS_FOUND_IN]->(r:NeoRadical) RETURN w, r",
+    "MATCH (l:NeoLanguage)-[:WORD_IS_USED_IN]->(w:NeoWord) RETURN l",
+    "MATCH (e:NeoExample)-[:EXAMPLE_USE_LANGUAGE]-(l:NeoLanguage) RETURN e.value, l.name",
+    "MATCH (s:NeoSingularClass)-[:SG_CLASS_IS_USED_IN|PL_CLASS_IS_USED_IN]->(p:NeoNominalPair) "
+    "RETURN s, p",
+    "MATCH (r:NeoRadical)-[:RADICAL_IS_FOUND_IN]->(w:NeoWord)-[:WORD_IS_USED_IN]->(v:NeoVariant)"
+    "<-[:ENTRY_USE_DV]-(e:NeoEntry)<-[:ARTICLE_USE_ENTRY]-(a:NeoArticle)"
+    "-[:ARTICLE_IS_USED_IN]->(d:NeoDictionary)-[:RESOURCE_HAVE_TAG]->(t:NeoTag) "
+    "WHERE r.value = 'mba' RETURN d.name, t.value",
+    "MATCH (t:NeoTag)<-[:RESOURCE_HAVE_TAG]-(d:NeoDictionary)-[:ARTICLE_IS_USED_IN]->(a:NeoArticle)"
+    "-[:ARTICLE_USE_ENTRY]->(e:NeoEntry)-[:ENTRY_USE_DV]->(v:NeoVariant)"
+    "-[:WORD_IS_USED_IN]->(w:NeoWord)-[:RADICAL_IS_FOUND_IN]->(r:NeoRadical) RETURN r",
+    "MATCH (a:NeoArticle)-[:ARTICLE_USE_TRANSLATIONS]->(ts:NeoTranslations)"
+    "<-[:WT_IS_USED_IN]-(t:NeoTranslation), (a)-[:ARTICLE_USE_EXAMPLES]->(xs:NeoExamples)"
+    "<-[:CONTEXTUALISATION]-(x:NeoExample)<-[:EXAMPLE_USE_LANGUAGE]-(l:NeoLanguage), "
+    "(a)-[:ARTICLE_USE_CATEGORIES]->(cs:NeoCategories)<-[:GC_IS_USED_IN]-(c:NeoCategory) "
+    "RETURN t.value, x.value, c.value LIMIT 10",
+    "MATCH (ts:NeoTranslations)-[:WT_IS_USED_IN]->(t:NeoTranslation), "
+    "(xs:NeoExamples)-[:CONTEXTUALISATION]->(x:NeoExample)-[:EXAMPLE_USE_LANGUAGE]->(l:NeoLanguage), "
+    "(cs:NeoCategories)-[:GC_IS_USED_IN]->(c:NeoCategory)-[:ARTICLE_USE_CATEGORIES]-(a:NeoArticle) "
+    "RETURN t.value, x.value, c.value LIMIT 10",
+]
+
+_rel_re = re.compile(r"\(:(\w+)\)-\[:(\w+)\]->\(:(\w+)\)")
+_token_re = re.compile(r"(\w+)\s*\{|(\w+)\s*:\s*(\w+)|\}")
+_node_re = re.compile(r"\((\w+):(\w+)")
+_limit_re = re.compile(r"\bLIMIT\s+(\d+)\s*$", re.IGNORECASE)
+_return_re = re.compile(r"\bRETURN\b(.*?)(\bORDER\b|\bSKIP\b|\bLIMIT\b|$)",
+                        re.IGNORECASE | re.DOTALL)
+
+
+def load_docs_schema(path: Path = DOCS_SCHEMA_PATH) -> Dict[str, Any]:
+    """Structured schema (as given by `Neo4jGraph`) of the documented graph model."""
+    text = path.read_text(encoding="utf-8")
+    nodes_part, _, rels_part = text.partition("# Cypher relations between nodes")
+
+    node_props: Dict[str, List[Dict[str, str]]] = {}
+    # labels may be nested by mistake in the docs: keep a stack of open labels
+    stack: List[str] = []
+    for match in _token_re.finditer(nodes_part):
+        label, prop, prop_type = match.groups()
+        if label:
+            stack.append(label)
+            node_props.setdefault(label, [])
+        elif prop and stack:
+            node_props[stack[-1]].append({"property": prop, "type": prop_type})
+        elif match.group(0) == "}" and stack:
+            stack.pop()
+
+    relationships = [{"start": start, "type": rel_type, "end": end}
+                     for start, rel_type, end in _rel_re.findall(rels_part)]
+    return {"node_props": node_props, "rel_props": {}, "relationships": relationships,
+            "metadata": {"constraint": [], "index": []}}
+
+
+def _fixture_value(label: str, prop: str, prop_type: str, index: int) -> Any:
+    if prop in HEAVY_PROPERTIES:
+        unit = f"<div class='{label}-{prop}'>entry {index} </div>"
+        return (unit * (HEAVY_PROPERTIES[prop] // len(unit) + 1))[: HEAVY_PROPERTIES[prop]]
+    if prop_type == "INTEGER":
+        return index
+    if prop_type == "BOOLEAN":
+        return index % 2 == 0
+    if prop_type == "LIST":
+        return [f"{prop}-{index}-{i}" for i in range(3)]
+    if prop == "uid":
+        return f"{label.lower()}-{index:06d}"
+    return f"{prop} {index}"
+
+
+class FixtureGraph(GraphStore):
+    """Offline graph serving deterministic nodes of the documented schema.
+
+    Queries are not interpreted: the labels bound to the returned variables
+    give the shape of the rows, `count(` returns a count and a trailing
+    `LIMIT` (or `query_head`) caps the rows. `latency` simulates the
+    database round trip.
+    """
+
+    def __init__(self, nodes_per_label: int = 200, latency: float = 0.0,
+                 schema: Optional[Dict[str, Any]] = None):
+        self.structured_schema = schema or load_docs_schema()
+        self.latency = latency
+        self.nodes_per_label = nodes_per_label
+        self.queries = 0
+        self.rows_served = 0
+        self._nodes: Dict[str, List[Dict[str, Any]]] = {
+            label: [{p["property"]: _fixture_value(label, p["property"], p["type"], i)
+                     for p in props}
+                    for i in range(nodes_per_label)]
+            for label, props in self.structured_schema["node_props"].items()
+        }
+
+    @property
+    def get_schema(self) -> str:
+        return ""
+
+    @property
+    def get_structured_schema(self) -> Dict[str, Any]:
+        return self.structured_schema
+
+    def refresh_schema(self) -> None:
+        pass
+
+    def add_graph_documents(self, graph_documents: List[Any],
+                            include_source: bool = False) -> None:
+        raise NotImplementedError("FixtureGraph is read only")
+
+    def _rows(self, query: str, params: Dict[str, Any],
+              limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        self.queries += 1
+        if "UNWIND $batch" in query:
+            # merged lookups: one row per batch row
+            inner = query.split("CALL {", 1)[1].rsplit("}", 1)[0]
+            body = inner.strip()
+            if alias_return_items(body) != body:
+                # as Neo4j does
+                raise ValueError("Expression in CALL { RETURN ... } must be aliased")
+            rows = []
+            for batch_row in params.get("batch", []):
+                for row in self._rows(inner, {}):
+                    rows.append({BATCH_ROW: batch_row, **row})
+            return rows
+
+        variables = dict(_node_re.findall(query))
+        returned = _return_re.search(query)
+        columns = returned.group(1) if returned else ""
+        if "count(" in columns.lower():
+            rows = [{"count": self.nodes_per_label}]
+        else:
+            names = [v for v in re.findall(r"\w+", columns) if v in variables]
+            nodes = [self._nodes.get(variables[name], []) for name in names[:2]]
+            rows = [{name: column[i] for name, column in zip(names, nodes)}
+                    for i in range(min(map(len, nodes), default=0))]
+        match = _limit_re.search(query)
+        if match:
+            rows = rows[: int(match.group(1))]
+        if limit is not None:
+            rows = rows[:limit]
+        self.rows_served += len(rows)
+        return rows
+
+    def query(self, query: str, params: dict = {}) -> List[Dict[str, Any]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._rows(query, params)
+
+    def query_head(self, query: str, params: dict = {}, limit: int = 10) -> List[Dict[str, Any]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._rows(query, params, limit)
+
+    async def aquery(self, query: str, params: dict = {}) -> List[Dict[str, Any]]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._rows(query, params)
+
+    async def aquery_head(self, query: str, params: dict = {},
+                          limit: int = 10) -> List[Dict[str, Any]]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._rows(query, params, limit)
@@ -0,0 +1,118 @@
+import statistics
+import timeit
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain.chains.graph_qa.cypher_utils import CypherQueryCorrector, Schema
+
+from ..genaiti.corrector import MemoizedCypherQueryCorrector
+from ..genaiti.cypher import enforce_limit, parameterize_cypher
+from ..genaiti.utils import construct_schema, extract_cypher, get_response_from_generator, qa_re
+from .fixtures import CORRECTOR_QUERIES, load_docs_schema
+
+__all__ = ["MICRO_BENCHMARKS", "micro_benchmark", "run_micro_benchmarks"]
+
+_GENERATIONS = {
+    "plain": " Il y a 12 dictionnaires dans la base.",
+    "marker": "Information:\n[...]\n>Réponse utile: Il y a 12 dictionnaires.\n\n\nQuestion: ...",
+    "long": ">Helpful Answer: " + "Le mot mbwa signifie chien. " * 40 + "<br/>\n\nNote Information",
+}
+
+_CYPHERS = {
+    "backticks": "Voici la requête:\n```\nMATCH (r:NeoRadical) WHERE r.value CONTAINS 'mba' RETURN r\n```",
+    "plain": "MATCH (d:NeoDictionary)<-[:ARTICLE_IS_USED_IN]-(a:NeoArticle) RETURN a LIMIT 10",
+}
+
+# name -> factory returning the function to time (setup is not timed)
+MICRO_BENCHMARKS: Dict[str, Callable[[], Callable[[], Any]]] = {}
+
+
+def micro_benchmark(name: str) -> Callable:
+    """Register a micro-benchmark factory under `name`."""
+    def decorator(factory: Callable[[], Callable[[], Any]]) -> Callable:
+        MICRO_BENCHMARKS[name] = factory
+        return factory
+    return decorator
+
+
+@micro_benchmark("construct_schema")
+def _construct_schema() -> Callable[[], Any]:
+    schema = load_docs_schema()
+    return lambda: construct_schema(schema, [], [])
+
+
+@micro_benchmark("construct_schema_include")
+def _construct_schema_include() -> Callable[[], Any]:
+    schema = load_docs_schema()
+    include = ["NeoRadical", "NeoWord", "RADICAL_IS_FOUND_IN"]
+    return lambda: construct_schema(schema, include, [])
+
+
+for _name, _text in _GENERATIONS.items():
+    micro_benchmark(f"get_response_from_generator_{_name}")(
+        lambda text=_text: (lambda: get_response_from_generator(text, qa_re))
+    )
+
+for _name, _text in _CYPHERS.items():
+    micro_benchmark(f"extract_cypher_{_name}")(
+        lambda text=_text: (lambda: extract_cypher(text))
+    )
+
+
+@micro_benchmark("enforce_limit")
+def _enforce_limit() -> Callable[[], Any]:
+    return lambda: enforce_limit(_CYPHERS["plain"], 10)
+
+
+@micro_benchmark("parameterize_cypher")
+def _parameterize_cypher() -> Callable[[], Any]:
+    return lambda: parameterize_cypher(CORRECTOR_QUERIES[3])
+
+
+def _corrector_schema() -> List[Schema]:
+    return [Schema(el["start"], el["type"], el["end"])
+            for el in load_docs_schema()["relationships"]]
+
+
+def _correct_all(corrector: CypherQueryCorrector) -> Callable[[], Any]:
+    return lambda: [corrector(query) for query in CORRECTOR_QUERIES]
+
+
+# each run corrects the whole corpus
+@micro_benchmark("cypher_corrector_stock")
+def _cypher_corrector_stock() -> Callable[[], Any]:
+    return _correct_all(CypherQueryCorrector(_corrector_schema()))
+
+
+@micro_benchmark("cypher_corrector_memoized")
+def _cypher_corrector_memoized() -> Callable[[], Any]:
+    schemas = _corrector_schema()
+    corrector = MemoizedCypherQueryCorrector(schemas)
+    if _correct_all(corrector)() != _correct_all(CypherQueryCorrector(schemas))():
+        raise AssertionError("MemoizedCypherQueryCorrector differs from CypherQueryCorrector")
+    return _correct_all(corrector)
+
+
+def _time(fn: Callable[[], Any], repeat: int, min_time: float) -> Dict[str, float]:
+    timer = timeit.Timer(fn)
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    runs = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "median_us": statistics.median(runs) * 1e6,
+        "min_us": min(runs) * 1e6,
+        "max_us": max(runs) * 1e6,
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def run_micro_benchmarks(
+    names: Optional[List[str]] = None, repeat: int = 5, min_time: float = 0.2
+) -> Dict[str, Dict[str, float]]:
+    """Time each micro-benchmark; durations are per call, in microseconds."""
+    results = {}
+    for name, factory in MICRO_BENCHMARKS.items():
+        if names and not any(n in name for n in names):
+            continue
+        results[name] = _time(factory(), repeat, min_time)
+    return results
@@ -0,0 +1,89 @@
+"""Token report of the prompt templates, failing on size regressions."""
+import argparse
+import json
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+from ..genaiti.context import estimate_tokens
+from ..genaiti.prompt_registry import prompt_registry, tokenizer_counter
+
+__all__ = ["PROMPT_VARIANTS", "prompt_token_report", "check_regressions", "DEFAULT_BASELINE"]
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "prompt_tokens.json")
+
+# report name -> prompt of the registry and its options
+PROMPT_VARIANTS: Dict[str, Dict[str, Any]] = {
+    "cypher_generation": {"name": "cypher_generation"},
+    "cypher_generation_examples": {"name": "cypher_generation", "with_examples": True},
+    "qa": {"name": "qa"},
+    "validation": {"name": "validation"},
+    "safety": {"name": "safety"},
+    "history_summary": {"name": "history_summary"},
+}
+
+
+def prompt_token_report(tokenizer: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+    """Tokens of each template (without its variables), raw and as sent."""
+    counter = tokenizer_counter(tokenizer) if tokenizer else estimate_tokens
+    return prompt_registry.token_counts(counter, PROMPT_VARIANTS)
+
+
+def check_regressions(report: Dict[str, Dict[str, int]], baseline: Dict[str, Dict[str, int]],
+                      tolerance: float = 0.02) -> List[str]:
+    """Prompts whose minified size grew more than `tolerance` over the baseline."""
+    regressions = []
+    for name, counts in report.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["minified"], counts["minified"]
+        if after > before * (1 + tolerance):
+            regressions.append(f"{name}: {before} -> {after} tokens")
+    return regressions
+
+
+def _table(report: Dict[str, Dict[str, int]], baseline: Dict[str, Dict[str, int]]) -> str:
+    lines = [f"{'prompt':30} {'raw':>8} {'minified':>9} {'saved':>7} {'baseline':>9}"]
+    for name, counts in report.items():
+        saved = 1 - counts["minified"] / counts["raw"] if counts["raw"] else 0.0
+        before = baseline.get(name, {}).get("minified", "-")
+        lines.append(f"{name:30} {counts['raw']:8} {counts['minified']:9} "
+                     f"{saved:6.1%} {before:>9}")
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.benchmarks.prompt_report",
+                                     description=__doc__)
+    parser.add_argument("--tokenizer", help="tokenizer.json path or Hub model "
+                                            "(default: 4 characters per token estimate)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.02,
+                        help="relative growth allowed before failing")
+    parser.add_argument("--check", action="store_true", help="exit with 1 on a regression")
+    parser.add_argument("--update", action="store_true", help="write the report as baseline")
+    args = parser.parse_args(argv)
+
+    key = args.tokenizer or "estimate"
+    baselines: Dict[str, Any] = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baselines = json.load(f)
+    baseline = baselines.get(key, {})
+    report = prompt_token_report(args.tokenizer)
+    print(_table(report, baseline))
+
+    if args.update:
+        baselines[key] = report
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=1, sort_keys=True)
+            f.write("\n")
+        return 0
+    regressions = check_regressions(report, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"prompt size regression: {regression}", file=sys.stderr)
+    return 1 if args.check and regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
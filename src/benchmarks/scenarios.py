@@ -0,0 +1,306 @@
+import asyncio
+import os
+import statistics
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..genaiti.cache import AnswerCache, QueryResultCache
+from ..genaiti.graph_chain import GraphCypherQAChain
+from ..genaiti.hedging import HedgedLLM, LatencyTracker
+from ..genaiti.local_llm import LocalLLM, LocalModelPool
+from ..genaiti.prompts_template import build_question_validation_prompt
+from ..genaiti.scheduler import LLMScheduler, ScheduledLLM
+from ..genaiti.singleflight import SingleFlight
+from .fake_endpoints import FakeInferenceServer, fake_endpoint_llm
+from .fake_llms import FakePipelineLLM
+from .fixtures import BENCHMARK_QUESTIONS, FixtureGraph
+
+__all__ = ["SCENARIOS", "scenario", "run_scenarios", "build_chain"]
+
+SCENARIOS: Dict[str, Callable[..., Dict[str, Any]]] = {}
+
+
+def scenario(name: str) -> Callable:
+    """Register an end-to-end scenario under `name`."""
+    def decorator(fn: Callable[..., Dict[str, Any]]) -> Callable:
+        SCENARIOS[name] = fn
+        return fn
+    return decorator
+
+
+def build_chain(llm_latency: float, graph_latency: float,
+                **chain_kwargs: Any) -> GraphCypherQAChain:
+    """Chain wired to the offline fixture graph and fake LLM."""
+    graph = FixtureGraph(latency=graph_latency)
+    llm = FakePipelineLLM(latency=llm_latency)
+    return GraphCypherQAChain.from_llm(llm=llm, graph=graph, validate_cypher=True,
+                                       **chain_kwargs)
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(percentile / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def _latency_summary(latencies: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(latencies),
+        "mean_ms": statistics.mean(latencies) * 1e3,
+        "p50_ms": _percentile(latencies, 50) * 1e3,
+        "p95_ms": _percentile(latencies, 95) * 1e3,
+        "p99_ms": _percentile(latencies, 99) * 1e3,
+        "max_ms": max(latencies) * 1e3,
+    }
+
+
+def _stage_summary(chain: GraphCypherQAChain, runs: int) -> Dict[str, Any]:
+    llm = chain.qa_chain.llm
+    graph = chain.graph
+    return {
+        "llm_calls": dict(llm.calls),
+        "llm_ms_per_question": {stage: seconds * 1e3 / runs
+                                for stage, seconds in llm.stage_seconds.items()},
+        "graph_queries": graph.queries,
+        "graph_rows": graph.rows_served,
+    }
+
+
+def _questions(rounds: int) -> List[str]:
+    return [question for _ in range(rounds) for question, _ in BENCHMARK_QUESTIONS]
+
+
+@scenario("sequential")
+def sequential(rounds: int, llm_latency: float, graph_latency: float,
+               **kwargs: Any) -> Dict[str, Any]:
+    """One question at a time through `_call`, no cache."""
+    chain = build_chain(llm_latency, graph_latency)
+    latencies = []
+    for question in _questions(rounds):
+        started = time.perf_counter()
+        chain.run(question)
+        latencies.append(time.perf_counter() - started)
+    return {**_latency_summary(latencies), **_stage_summary(chain, len(latencies))}
+
+
+@scenario("concurrent")
+def concurrent(rounds: int, llm_latency: float, graph_latency: float,
+               concurrency: int = 8, **kwargs: Any) -> Dict[str, Any]:
+    """`concurrency` chat sessions sharing one event loop through `_acall`."""
+    chain = build_chain(llm_latency, graph_latency)
+    questions = _questions(rounds)
+    latencies: List[float] = []
+
+    async def _session(session_questions: List[str]) -> None:
+        for question in session_questions:
+            started = time.perf_counter()
+            await chain.arun(question)
+            latencies.append(time.perf_counter() - started)
+
+    async def _main() -> None:
+        await asyncio.gather(*[_session(questions[i::concurrency])
+                               for i in range(concurrency)])
+
+    started = time.perf_counter()
+    asyncio.run(_main())
+    elapsed = time.perf_counter() - started
+    return {**_latency_summary(latencies), "concurrency": concurrency,
+            "throughput_qps": len(latencies) / elapsed,
+            **_stage_summary(chain, len(latencies))}
+
+
+@scenario("cached")
+def cached(rounds: int, llm_latency: float, graph_latency: float,
+           **kwargs: Any) -> Dict[str, Any]:
+    """Repeated questions with the answer and query result caches."""
+    chain = build_chain(llm_latency, graph_latency, answer_cache=AnswerCache(),
+                        query_cache=QueryResultCache())
+    latencies = []
+    for question in _questions(max(rounds, 2)):
+        started = time.perf_counter()
+        chain.run(question)
+        latencies.append(time.perf_counter() - started)
+    return {**_latency_summary(latencies), **_stage_summary(chain, len(latencies))}
+
+
+@scenario("single_flight")
+def single_flight(rounds: int, llm_latency: float, graph_latency: float,
+                  concurrency: int = 8, **kwargs: Any) -> Dict[str, Any]:
+    """`concurrency` sessions asking each question at the same time, sharing one run."""
+    group = SingleFlight()
+    chain = build_chain(llm_latency, graph_latency, single_flight=group)
+    latencies: List[float] = []
+
+    async def _ask(question: str) -> None:
+        started = time.perf_counter()
+        await chain.arun(question)
+        latencies.append(time.perf_counter() - started)
+
+    async def _main() -> None:
+        for question in _questions(rounds):
+            await asyncio.gather(*[_ask(question) for _ in range(concurrency)])
+
+    asyncio.run(_main())
+    return {**_latency_summary(latencies), "concurrency": concurrency,
+            **group.stats(), **_stage_summary(chain, len(latencies))}
+
+
+@scenario("batch")
+def batch(rounds: int, llm_latency: float, graph_latency: float,
+          concurrency: int = 8, **kwargs: Any) -> Dict[str, Any]:
+    """`batch_questions` over the benchmark questions."""
+    chain = build_chain(llm_latency, graph_latency)
+    questions = [f"{question} ({i})" for i, question in enumerate(_questions(rounds))]
+    started = time.perf_counter()
+    results = chain.batch_questions(questions, max_concurrency=concurrency)
+    elapsed = time.perf_counter() - started
+    return {"count": len(results), "elapsed_ms": elapsed * 1e3,
+            "throughput_qps": len(results) / elapsed,
+            "errors": sum(1 for result in results if "error" in result),
+            **_stage_summary(chain, len(results))}
+
+
+@scenario("hedged")
+def hedged(rounds: int, llm_latency: float, graph_latency: float,
+           concurrency: int = 8, **kwargs: Any) -> Dict[str, Any]:
+    """Local HTTP endpoints with a slow tail: primary alone, then hedged."""
+    servers = [FakeInferenceServer(latency=llm_latency, slow_latency=llm_latency * 25,
+                                   slow_rate=0.05, seed=1),
+               FakeInferenceServer(latency=llm_latency * 1.5, slow_latency=llm_latency * 25,
+                                   slow_rate=0.05, seed=2)]
+    tracker = LatencyTracker()
+    single = fake_endpoint_llm(servers[0])
+    hedged_llm = HedgedLLM(llms=[fake_endpoint_llm(server) for server in servers],
+                           hedge_delay=llm_latency * 5, tracker=tracker)
+    requests = 40 * rounds
+
+    async def _run(llm: Any) -> List[float]:
+        # cancelled hedges leave the aiohttp sessions of huggingface_hub unclosed
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: None)
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies: List[float] = []
+
+        async def _request(i: int) -> None:
+            async with semaphore:
+                started = time.perf_counter()
+                await llm.ainvoke(f"question {i}")
+                latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*[_request(i) for i in range(requests)])
+        return latencies
+
+    try:
+        single_summary = _latency_summary(asyncio.run(_run(single)))
+        summary = _latency_summary(asyncio.run(_run(hedged_llm)))
+    finally:
+        for server in servers:
+            server.close()
+    return {**summary,
+            **{f"single_{key}": value for key, value in single_summary.items()},
+            "hedged_requests": tracker.hedged, "alternate_wins": tracker.alternate_wins,
+            "endpoint_requests": [server.requests for server in servers]}
+
+
+@scenario("admission")
+def admission(rounds: int, llm_latency: float, graph_latency: float,
+              concurrency: int = 8, **kwargs: Any) -> Dict[str, Any]:
+    """Bursts of 4x`concurrency` calls to an endpoint rejecting more than `concurrency`
+    concurrent ones (HTTP 429), sent directly then through the scheduler."""
+    server = FakeInferenceServer(latency=llm_latency, capacity=concurrency)
+    scheduler = LLMScheduler(max_concurrency=concurrency)
+    direct = fake_endpoint_llm(server)
+    scheduled = ScheduledLLM(llm=fake_endpoint_llm(server), scheduler=scheduler)
+    requests = 4 * concurrency * rounds
+
+    async def _run(llm: Any) -> Tuple[List[float], int]:
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: None)
+        latencies: List[float] = []
+
+        async def _request(i: int) -> bool:
+            started = time.perf_counter()
+            try:
+                await llm.ainvoke(f"question {i}")
+            except Exception:
+                return False
+            latencies.append(time.perf_counter() - started)
+            return True
+
+        results = await asyncio.gather(*[_request(i) for i in range(requests)])
+        return latencies, results.count(False)
+
+    try:
+        direct_latencies, direct_errors = asyncio.run(_run(direct))
+        latencies, errors = asyncio.run(_run(scheduled))
+    finally:
+        server.close()
+    return {**_latency_summary(latencies), "errors": errors,
+            "direct_errors": direct_errors, "direct_count": len(direct_latencies),
+            "rejected": server.rejected, **scheduler.stats()[scheduled.endpoint]}
+
+
+@scenario("local")
+def local(rounds: int, llm_latency: float, graph_latency: float,
+          concurrency: int = 8, **kwargs: Any) -> Dict[str, Any]:
+    """Checker prompts answered by a local GGUF model, then by the remote path.
+
+    Needs llama-cpp-python and a model file in `GENAITI_BENCH_GGUF`. The
+    remote path is the endpoint at `GENAITI_BENCH_REMOTE_URL` if set, a
+    local fake endpoint answering in `llm_latency` seconds otherwise.
+    """
+    model_path = os.environ.get("GENAITI_BENCH_GGUF")
+    if not model_path:
+        return {"skipped": "GENAITI_BENCH_GGUF is not set"}
+    prompt = build_question_validation_prompt()
+    prompts = [prompt.format(question=question) for question in _questions(rounds)]
+    pool = LocalModelPool(instances=int(os.environ.get("GENAITI_BENCH_INSTANCES", 1)),
+                          prompt_cache_bytes=256 * 2**20)
+    started = time.perf_counter()
+    pool.warm([model_path])
+    load_seconds = time.perf_counter() - started
+    local_llm = LocalLLM(model_path=model_path, pool=pool, max_tokens=4)
+
+    server = None
+    remote_url = os.environ.get("GENAITI_BENCH_REMOTE_URL")
+    if remote_url:
+        from langchain_community.llms import HuggingFaceEndpoint
+        remote_llm = HuggingFaceEndpoint(endpoint_url=remote_url, max_new_tokens=4)
+    else:
+        server = FakeInferenceServer(latency=llm_latency, text="True")
+        remote_llm = fake_endpoint_llm(server, max_new_tokens=4)
+
+    async def _run(llm: Any) -> List[float]:
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: None)
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies: List[float] = []
+
+        async def _request(text: str) -> None:
+            async with semaphore:
+                started = time.perf_counter()
+                await llm.ainvoke(text)
+                latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*[_request(text) for text in prompts])
+        return latencies
+
+    try:
+        summary = _latency_summary(asyncio.run(_run(local_llm)))
+        remote_summary = _latency_summary(asyncio.run(_run(remote_llm)))
+    finally:
+        if server is not None:
+            server.close()
+    return {**summary,
+            **{f"remote_{key}": value for key, value in remote_summary.items()},
+            "remote": remote_url or "fake", "load_s": load_seconds,
+            "pool": pool.stats()[model_path]}
+
+
+def run_scenarios(names: Optional[List[str]] = None, rounds: int = 3,
+                  llm_latency: float = 0.02, graph_latency: float = 0.002,
+                  concurrency: int = 8) -> Dict[str, Dict[str, Any]]:
+    results = {}
+    for name, fn in SCENARIOS.items():
+        if names and not any(n in name for n in names):
+            continue
+        results[name] = fn(rounds=rounds, llm_latency=llm_latency,
+                           graph_latency=graph_latency, concurrency=concurrency)
+    return results
@@ -0,0 +1,365 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from .utils import aquery_graph, query_graph
+
+__all__ = ["normalize_question", "canonicalize_cypher", "fingerprint",
+           "llm_chain_fingerprint", "LRUCache", "AnswerCache", "QueryResultCache",
+           "GRAPH_VERSION_QUERY"]
+
+logger = logging.getLogger(__name__)
+
+_punct_re = re.compile(r"[^\w\s]")
+_space_re = re.compile(r"\s+")
+_cypher_token_re = re.compile(
+    r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|`[^`]*`)|\s+"""
+)
+_MISSING = object()
+
+# Cheap marker changing whenever a dictionary is created, deleted or updated
+GRAPH_VERSION_QUERY = (
+    "MATCH (d:NeoDictionary) "
+    "RETURN count(d) AS total, max(d.last_update) AS last_update"
+)
+
+
+def normalize_question(question: str) -> str:
+    """Normalize a user question so that trivial variations share a cache key.
+
+    Args:
+        question: Raw question typed by the user.
+
+    Returns:
+        Lowercased question without accents, punctuation and extra whitespace.
+    """
+    text = unicodedata.normalize("NFKD", question.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = _punct_re.sub(" ", text)
+    return _space_re.sub(" ", text).strip()
+
+
+def canonicalize_cypher(query: str) -> str:
+    """Canonicalize a Cypher statement so that formatting does not change its key.
+
+    Whitespace runs outside string literals and quoted identifiers collapse
+    into one space and trailing semicolons are removed.
+
+    Args:
+        query: Cypher statement.
+
+    Returns:
+        Canonical form of the statement.
+    """
+    query = _cypher_token_re.sub(lambda m: m.group(1) or " ", query)
+    return query.strip().rstrip(";").strip()
+
+
+def fingerprint(*parts: Any) -> str:
+    """Hash several identity parts into one short, stable key."""
+    payload = "\x1f".join(str(part) for part in parts)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def llm_chain_fingerprint(llm_chain: Any) -> str:
+    """Build a stable identity for an LLMChain from its model and prompt.
+
+    Args:
+        llm_chain: LLMChain (or any object exposing `llm` and `prompt`).
+
+    Returns:
+        Hex digest changing whenever the model, its generation parameters
+        or the prompt template change.
+    """
+    llm = llm_chain.llm
+    identity = {
+        "type": getattr(llm, "_llm_type", type(llm).__name__),
+        "model": getattr(llm, "model", None),
+        "params": getattr(llm, "_default_params", None) or dict(llm._identifying_params),
+        "prompt": getattr(llm_chain.prompt, "template", repr(llm_chain.prompt)),
+    }
+    return fingerprint(json.dumps(identity, sort_keys=True, default=str))
+
+
+class LRUCache:
+    """Thread-safe LRU cache with per-entry time to live and hit/miss counters."""
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: Optional[float] = None,
+        max_weight: Optional[int] = None,
+        weigher: Optional[Callable[[Any], int]] = None,
+    ):
+        """
+        Args:
+            maxsize: maximum number of entries kept before evicting the least
+                recently used one.
+            ttl: default time to live of an entry in seconds (None: never expires).
+            max_weight: optional cap on the summed weight of the stored values.
+            weigher: function returning the weight of a value (required with
+                `max_weight`).
+        """
+        if max_weight is not None and weigher is None:
+            raise ValueError("`weigher` must be provided along with `max_weight`")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_weight = max_weight
+        self.weigher = weigher
+        self.weight = 0
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value, weight = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.weight -= weight
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> bool:
+        """Store a value and return whether it was kept.
+
+        Values heavier than `max_weight` on their own are never stored.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        weight = self.weigher(value) if self.weigher is not None else 0
+        if self.max_weight is not None and weight > self.max_weight:
+            self.pop(key)
+            return False
+        with self._lock:
+            previous = self._data.pop(key, _MISSING)
+            if previous is not _MISSING:
+                self.weight -= previous[2]
+            self._data[key] = (expires_at, value, weight)
+            self.weight += weight
+            while len(self._data) > self.maxsize or (
+                self.max_weight is not None and self.weight > self.max_weight
+            ):
+                _, (_, _, evicted_weight) = self._data.popitem(last=False)
+                self.weight -= evicted_weight
+                self.evictions += 1
+        return True
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            self.weight -= entry[2]
+        return entry[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "weight": self.weight,
+            "max_weight": self.max_weight,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class AnswerCache:
+    """Tiered cache for the GraphCypherQAChain pipeline.
+
+    Each tier stores the output of one stage, keyed on the normalized question
+    and the identity (model, generation parameters, prompt) of that stage:
+
+    - `checker`: the True/False verdict of the question validation LLM.
+    - `cypher`: the generated (and corrected) Cypher statement.
+    - `answer`: the final chain result.
+
+    Validation verdicts and Cypher statements only depend on the question,
+    so they can live long. Answers depend on the graph content and use a
+    shorter time to live by default.
+    """
+
+    TIERS = ("checker", "cypher", "answer")
+
+    def __init__(
+        self,
+        checker_maxsize: int = 4096,
+        cypher_maxsize: int = 2048,
+        answer_maxsize: int = 1024,
+        checker_ttl: Optional[float] = 24 * 3600,
+        cypher_ttl: Optional[float] = 24 * 3600,
+        answer_ttl: Optional[float] = 600,
+    ):
+        self.tiers: Dict[str, LRUCache] = {
+            "checker": LRUCache(checker_maxsize, checker_ttl),
+            "cypher": LRUCache(cypher_maxsize, cypher_ttl),
+            "answer": LRUCache(answer_maxsize, answer_ttl),
+        }
+
+    @staticmethod
+    def make_key(question: str, identity: str) -> str:
+        return f"{identity}:{normalize_question(question)}"
+
+    def get(self, tier: str, question: str, identity: str, default: Any = None) -> Any:
+        return self.tiers[tier].get(self.make_key(question, identity), default)
+
+    def set(self, tier: str, question: str, identity: str, value: Any) -> None:
+        self.tiers[tier].set(self.make_key(question, identity), value)
+
+    def clear(self, tier: Optional[str] = None) -> None:
+        for name, cache in self.tiers.items():
+            if tier is None or name == tier:
+                cache.clear()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: cache.stats() for name, cache in self.tiers.items()}
+
+
+def _rows_weight(rows: List[Dict[str, Any]]) -> int:
+    """Approximate memory footprint of query rows (size of their JSON form)."""
+    return len(json.dumps(rows, default=str, ensure_ascii=False))
+
+
+class QueryResultCache:
+    """Cache of Cypher query results invalidated by a graph version marker.
+
+    Results are keyed on the canonicalized statement, its parameters and the
+    current graph version. The version combines a manual counter (see `bump`)
+    with the output of `version_query`, which is run against the graph at
+    most once every `version_check_interval` seconds. When the version
+    changes, every stored result is dropped.
+
+    The memory cap (`max_bytes`) counts the size of the stored rows, so a
+    few large results cannot grow the cache without bound.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 4096,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: Optional[float] = None,
+        version_query: Optional[str] = GRAPH_VERSION_QUERY,
+        version_check_interval: float = 30.0,
+    ):
+        """
+        Args:
+            maxsize: maximum number of cached statements.
+            max_bytes: maximum summed size of the cached rows.
+            ttl: optional time to live of a result in seconds.
+            version_query: Cypher statement returning the graph version
+                marker (None: only manual `bump` invalidates).
+            version_check_interval: minimal delay in seconds between two
+                runs of `version_query`.
+        """
+        self.results = LRUCache(maxsize, ttl, max_weight=max_bytes, weigher=_rows_weight)
+        self.version_query = version_query
+        self.version_check_interval = version_check_interval
+        self._manual_version = 0
+        self._graph_version: Optional[str] = None
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def bump(self) -> None:
+        """Invalidate every cached result, e.g. after a dictionary import."""
+        with self._lock:
+            self._manual_version += 1
+        self.results.clear()
+
+    def _version_check_due(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if not self.version_query or now - self._checked_at < self.version_check_interval:
+                return False
+            self._checked_at = now
+            return True
+
+    def _set_graph_version(self, rows: List[Dict[str, Any]]) -> None:
+        marker = fingerprint(json.dumps(rows, sort_keys=True, default=str))
+        with self._lock:
+            if marker != self._graph_version:
+                if self._graph_version is not None:
+                    self.results.clear()
+                self._graph_version = marker
+
+    def version(self, graph: Any) -> str:
+        """Return the current graph version, refreshing the marker if due."""
+        if self._version_check_due():
+            try:
+                self._set_graph_version(graph.query(self.version_query))
+            except Exception as e:
+                logger.warning("Could not read graph version marker: %s", e)
+        return f"{self._manual_version}:{self._graph_version}"
+
+    async def aversion(self, graph: Any) -> str:
+        """Async version of `version`."""
+        if self._version_check_due():
+            try:
+                self._set_graph_version(await aquery_graph(graph, self.version_query))
+            except Exception as e:
+                logger.warning("Could not read graph version marker: %s", e)
+        return f"{self._manual_version}:{self._graph_version}"
+
+    def make_key(self, version: str, query: str, params: Optional[Dict[str, Any]],
+                 limit: Optional[int] = None) -> str:
+        return fingerprint(version, canonicalize_cypher(query),
+                           json.dumps(params or {}, sort_keys=True, default=str), limit)
+
+    def query(
+        self, graph: Any, query: str, params: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Run `query` against `graph` unless an up to date result is cached.
+
+        With `limit`, at most `limit` records are read (see `query_graph`).
+        """
+        key = self.make_key(self.version(graph), query, params, limit)
+        rows = self.results.get(key)
+        if rows is None:
+            rows = query_graph(graph, query, params, limit)
+            self.results.set(key, rows)
+        return list(rows)
+
+    async def aquery(
+        self, graph: Any, query: str, params: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Async version of `query`."""
+        key = self.make_key(await self.aversion(graph), query, params, limit)
+        rows = self.results.get(key)
+        if rows is None:
+            rows = await aquery_graph(graph, query, params, limit)
+            self.results.set(key, rows)
+        return list(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.results.stats(), "graph_version": self._graph_version,
+                "manual_version": self._manual_version}
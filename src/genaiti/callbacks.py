@@ -1,7 +1,9 @@
 from langchain.callbacks.base import BaseCallbackHandler
 import chainlit as cl
 
-__all__ = ['PostMessageHandler']
+from .streaming import QA_STREAM_TAG, ResponseStreamParser
+
+__all__ = ['PostMessageHandler', 'StreamingAnswerHandler']
 
 class PostMessageHandler(BaseCallbackHandler):
     """
@@ -24,4 +26,30 @@ class PostMessageHandler(BaseCallbackHandler):
             sources_text = "\n".join([f"{source}#page={page}" for source, page in self.sources])
             self.msg.elements.append(
                 cl.Text(name="Sources", content=sources_text, display="inline")
-            )
\ No newline at end of file
+            )
+
+
+class StreamingAnswerHandler(BaseCallbackHandler):
+    """
+    Callback handler streaming the final answer tokens into a Chainlit message.
+    Only the LLM runs tagged with `QA_STREAM_TAG` are streamed, the answer
+    markers and trailers being dropped on the fly by `ResponseStreamParser`.
+    """
+
+    def __init__(self, msg: cl.Message, tag: str = QA_STREAM_TAG):
+        BaseCallbackHandler.__init__(self)
+        self.msg = msg
+        self.tag = tag
+        self.parser = ResponseStreamParser()
+
+    def _stream(self, text):
+        if text:
+            cl.run_sync(self.msg.stream_token(text))
+
+    def on_llm_new_token(self, token, *, run_id, parent_run_id=None, tags=None, **kwargs):
+        if tags and self.tag in tags:
+            self._stream(self.parser.feed(token))
+
+    def on_llm_end(self, response, *, run_id, parent_run_id=None, tags=None, **kwargs):
+        if tags and self.tag in tags:
+            self._stream(self.parser.close())
@@ -0,0 +1,217 @@
+import json
+import math
+import threading
+from typing import Any, Callable, Dict, FrozenSet, List, Mapping, Optional, Tuple, Union
+
+from .schema import SchemaSnapshot
+
+__all__ = ["ContextCompactor", "DEFAULT_HEAVY_PROPERTIES", "estimate_tokens"]
+
+# property -> maximal length in characters (0: dropped), per label ("*": any label)
+DEFAULT_HEAVY_PROPERTIES: Dict[str, Dict[str, int]] = {
+    "*": {
+        "search_vector": 0, "html_version": 0, "xml_version": 0, "raw_data": 0,
+        "uid": 0, "ref_parent": 0,
+    },
+    "NeoDictionary": {"description": 300, "authors_ref": 120},
+    "NeoLanguage": {"alternate_names": 160},
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of a text (about 4 characters per token)."""
+    return math.ceil(len(text) / 4) if text else 0
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    return text if len(text) <= max_chars else text[: max_chars - 1] + "…"
+
+
+class ContextCompactor:
+    """Serializer of the graph rows given as context to the QA prompt.
+
+    Rows returned by Neo4j hold whole nodes (dictionaries of properties,
+    without their labels), e.g. `NeoArticle` with its HTML, XML and raw
+    versions. The compactor:
+
+    - infers the label of each node from the schema properties and drops or
+      truncates its heavy properties (`heavy_properties`),
+    - removes duplicated rows and prints once the columns holding the same
+      value in every row (e.g. the dictionary of all the returned articles),
+    - renders the rows as a compact `|` separated table,
+    - stops adding rows when the `max_tokens` budget is reached; the
+      constant columns use at most `constants_share` of it and the first
+      row is always given, truncated if it does not fit.
+
+    `compact` returns the text with a report of the tokens saved compared
+    to `str(rows)`; the totals are kept in `stats`.
+    """
+
+    def __init__(
+        self,
+        schema: Optional[Union[Dict[str, Any], SchemaSnapshot]] = None,
+        heavy_properties: Mapping[str, Mapping[str, int]] = DEFAULT_HEAVY_PROPERTIES,
+        max_tokens: int = 1024,
+        max_value_chars: int = 200,
+        constants_share: float = 0.5,
+        token_counter: Callable[[str], int] = estimate_tokens,
+    ):
+        """
+        Args:
+            schema: structured schema (or snapshot) used to infer node labels.
+            heavy_properties: per label, property -> maximal length (0: drop).
+            max_tokens: token budget of the rendered context.
+            max_value_chars: maximal length of any rendered value.
+            constants_share: part of the budget the constant columns may use.
+            token_counter: function counting the tokens of a text.
+        """
+        self.schema = schema
+        self.heavy_properties = heavy_properties
+        self.max_tokens = max_tokens
+        self.max_value_chars = max_value_chars
+        self.constants_share = constants_share
+        self.token_counter = token_counter
+        self._labels: Dict[Tuple[Optional[str], FrozenSet[str]], Optional[str]] = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.raw_tokens = 0
+        self.tokens = 0
+
+    def _node_props(self) -> Tuple[Optional[str], Dict[str, Any]]:
+        if isinstance(self.schema, SchemaSnapshot):
+            return self.schema.fingerprint, self.schema.structured_schema.get("node_props", {})
+        return None, (self.schema or {}).get("node_props", {})
+
+    def infer_label(self, properties: Mapping[str, Any]) -> Optional[str]:
+        """Label whose schema properties best cover the node properties."""
+        version, node_props = self._node_props()
+        keys = frozenset(properties)
+        cache_key = (version, keys)
+        if cache_key in self._labels:
+            return self._labels[cache_key]
+        best_label, best_score = None, 0.0
+        for label, props in node_props.items():
+            names = {prop["property"] for prop in props}
+            union = len(keys | names)
+            score = len(keys & names) / union if union else 0.0
+            if keys <= names:
+                score += 1.0
+            if score > best_score:
+                best_label, best_score = label, score
+        label = best_label if best_score >= 0.5 else None
+        self._labels[cache_key] = label
+        return label
+
+    def _property_limit(self, label: Optional[str], name: str) -> Optional[int]:
+        limits = self.heavy_properties.get(label or "", {})
+        if name in limits:
+            return limits[name]
+        return self.heavy_properties.get("*", {}).get(name)
+
+    def compact_node(self, node: Mapping[str, Any]) -> Dict[str, Any]:
+        """Node properties without the heavy ones, long ones truncated."""
+        label = self.infer_label(node)
+        compacted = {}
+        for name, value in node.items():
+            limit = self._property_limit(label, name)
+            if limit == 0 or value is None or value == "":
+                continue
+            if limit is not None and isinstance(value, str):
+                value = _truncate(value, limit)
+            compacted[name] = value
+        return compacted
+
+    def _format_value(self, value: Any) -> str:
+        if isinstance(value, (list, tuple)):
+            text = ", ".join(self._format_value(v) for v in value)
+        elif isinstance(value, dict):
+            text = json.dumps(value, ensure_ascii=False, default=str)
+        elif value is None:
+            text = ""
+        else:
+            text = str(value)
+        text = " ".join(text.split()).replace("|", "/")
+        return _truncate(text, self.max_value_chars)
+
+    def _flatten(self, row: Mapping[str, Any]) -> Dict[str, str]:
+        flat = {}
+        for column, value in row.items():
+            if isinstance(value, dict):
+                for name, prop in self.compact_node(value).items():
+                    flat[f"{column}.{name}"] = self._format_value(prop)
+            else:
+                flat[column] = self._format_value(value)
+        return flat
+
+    def compact(self, rows: List[Dict[str, Any]]) -> Tuple[str, Dict[str, int]]:
+        """Render `rows` within the token budget; return the text and a report."""
+        raw_tokens = self.token_counter(str(rows))
+        flat_rows, seen = [], set()
+        for row in rows:
+            flat = self._flatten(row)
+            key = tuple(sorted(flat.items()))
+            if key not in seen:
+                seen.add(key)
+                flat_rows.append(flat)
+
+        columns: List[str] = []
+        for flat in flat_rows:
+            columns.extend(c for c in flat if c not in columns)
+        # columns with one value in every row are printed once
+        constants = [c for c in columns if len(flat_rows) > 1
+                     and len({flat.get(c, "") for flat in flat_rows}) == 1]
+        columns = [c for c in columns if c not in constants]
+
+        lines: List[str] = []
+        budget = self.max_tokens
+        constants_budget = int(self.max_tokens * self.constants_share)
+        for shown, column in enumerate(constants):
+            line = f"{column}: {flat_rows[0].get(column, '')}"
+            cost = self.token_counter(line) + 1
+            if cost > constants_budget:
+                lines.append(f"({len(constants) - shown} more constant columns not shown)")
+                budget -= self.token_counter(lines[-1]) + 1
+                break
+            lines.append(line)
+            constants_budget -= cost
+            budget -= cost
+        if columns:
+            lines.append(" | ".join(columns))
+            budget -= self.token_counter(lines[-1]) + 1
+        kept = 0
+        for flat in flat_rows if columns else []:
+            line = " | ".join(flat.get(c, "") for c in columns)
+            cost = self.token_counter(line) + 1
+            if cost > budget:
+                if kept == 0:
+                    # rows were returned: the prompt must not be left without data
+                    line = _truncate(line, max(budget - 1, 16) * 4)
+                    lines.append(line)
+                    budget -= self.token_counter(line) + 1
+                    kept += 1
+                break
+            lines.append(line)
+            budget -= cost
+            kept += 1
+        if columns and kept < len(flat_rows):
+            lines.append(f"({len(flat_rows) - kept} more rows not shown)")
+        text = "\n".join(lines)
+
+        tokens = self.token_counter(text)
+        report = {
+            "rows": len(rows),
+            "rows_kept": kept if columns else len(flat_rows),
+            "duplicates": len(rows) - len(flat_rows),
+            "raw_tokens": raw_tokens,
+            "tokens": tokens,
+            "saved_tokens": raw_tokens - tokens,
+        }
+        with self._lock:
+            self.requests += 1
+            self.raw_tokens += raw_tokens
+            self.tokens += tokens
+        return text, report
+
+    def stats(self) -> Dict[str, int]:
+        return {"requests": self.requests, "raw_tokens": self.raw_tokens,
+                "tokens": self.tokens, "saved_tokens": self.raw_tokens - self.tokens}
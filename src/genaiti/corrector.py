@@ -0,0 +1,40 @@
+from typing import Any, Dict, List, Optional
+
+from langchain.chains.graph_qa.cypher_utils import CypherQueryCorrector, Schema
+
+from .cache import LRUCache
+
+__all__ = ["MemoizedCypherQueryCorrector"]
+
+_MISSING = object()
+
+
+class MemoizedCypherQueryCorrector(CypherQueryCorrector):
+    """`CypherQueryCorrector` memoizing the corrected statements per query text.
+
+    Nearly all the time of a correction goes to parsing the query with
+    regular expressions, not to checking its relationships against the
+    schema, so repeated statements (cached questions, retries, batches) are
+    what is worth saving. The output is the same as the stock corrector.
+    """
+
+    def __init__(self, schemas: List[Schema], maxsize: int = 1024):
+        """
+        Args:
+            schemas: list of schemas
+            maxsize: number of memoized corrections (0 disables the memo).
+        """
+        super().__init__(schemas)
+        self._memo: Optional[LRUCache] = LRUCache(maxsize) if maxsize > 0 else None
+
+    def correct_query(self, query: str) -> str:
+        if self._memo is None:
+            return super().correct_query(query)
+        corrected = self._memo.get(query, _MISSING)
+        if corrected is _MISSING:
+            corrected = super().correct_query(query)
+            self._memo.set(query, corrected)
+        return corrected
+
+    def stats(self) -> Dict[str, Any]:
+        return self._memo.stats() if self._memo is not None else {}
@@ -0,0 +1,325 @@
+import itertools
+import re
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+__all__ = ["enforce_limit", "mask_cypher", "lift_string_literals", "parameterize_cypher",
+           "alias_return_items", "build_unwind_query", "BATCH_ROW", "BATCH_INDEX"]
+
+# names used by the UNWIND queries merging several lookups
+BATCH_ROW = "genaiti_row"
+BATCH_INDEX = "genaiti_index"
+
+_literal_re = re.compile(
+    r"'(?:\\.|[^'\\])*'|\"(?:\\.|[^\"\\])*\"|`[^`]*`|//[^\n]*|/\*.*?\*/",
+    re.DOTALL,
+)
+_clause_re = re.compile(
+    r"(?<![.$\w])(RETURN|WITH|MATCH|UNWIND|CALL|UNION|CREATE|MERGE|DELETE|DETACH|SET|REMOVE|"
+    r"FOREACH|LOAD|ORDER|SKIP|LIMIT|WHERE|YIELD)\b",
+    re.IGNORECASE,
+)
+_string_re = re.compile(r"'(?:\\.|[^'\\])*'|\"(?:\\.|[^\"\\])*\"")
+_escape_re = re.compile(r"\\(u[0-9a-fA-F]{4}|U[0-9a-fA-F]{8}|.)", re.DOTALL)
+_number_re = re.compile(r"(?<![\w$.])\d+(?:\.\d+)?(?:[eE][+-]?\d+)?(?![\w.])")
+_space_re = re.compile(r"`[^`]*`|\s+")
+_ESCAPES = {"t": "\t", "b": "\b", "n": "\n", "r": "\r", "f": "\f"}
+_limit_re = re.compile(r"\bLIMIT\s+(\S+)\s*$", re.IGNORECASE)
+_OPENING, _CLOSING = "([{", ")]}"
+_variable_re = re.compile(r"(?:[A-Za-z_]\w*|`[^`]*`)")
+_alias_re = re.compile(r"\sAS\s+(?:[A-Za-z_]\w*|`[^`]*`)\s*$", re.IGNORECASE)
+_distinct_re = re.compile(r"DISTINCT\b", re.IGNORECASE)
+_parameter_re = re.compile(r"\$(\w+)")
+
+
+def mask_cypher(query: str) -> str:
+    """Blank out string literals, escaped names and comments.
+
+    The masked statement has the same length as `query`, so positions found
+    in it are valid in the original statement, but keywords and brackets
+    inside literals can no longer be mistaken for Cypher syntax.
+    """
+    return _literal_re.sub(lambda m: " " * len(m.group(0)), query)
+
+
+def _top_level_clauses(masked: str) -> Optional[List[Tuple[str, int]]]:
+    """(keyword, position) of the clauses outside brackets; None if unbalanced."""
+    depths = []
+    depth = 0
+    for char in masked:
+        if char in _OPENING:
+            depth += 1
+        elif char in _CLOSING:
+            depth -= 1
+            if depth < 0:
+                return None
+        depths.append(depth)
+    if depth != 0:
+        return None
+    return [(m.group(1).upper(), m.start()) for m in _clause_re.finditer(masked)
+            if depths[m.start()] == 0]
+
+
+def enforce_limit(query: str, limit: int) -> Optional[str]:
+    """Rewrite a read query so that the server returns at most `limit` rows.
+
+    A `LIMIT limit` is appended to the final `RETURN`, or an existing
+    literal `LIMIT` is lowered to `limit`. Returns None when the statement
+    cannot be rewritten safely (several statements, `UNION`, no final
+    `RETURN`, `LIMIT` given by a parameter or an expression): the caller
+    must then cap the rows while reading the result.
+    """
+    query = query.strip().rstrip(";").rstrip()
+    masked = mask_cypher(query)
+    if ";" in masked:
+        return None
+    clauses = _top_level_clauses(masked)
+    if not clauses:
+        return None
+    keywords = [keyword for keyword, _ in clauses]
+    if "UNION" in keywords or "RETURN" not in keywords:
+        return None
+    last_return = len(keywords) - 1 - keywords[::-1].index("RETURN")
+    if any(keyword not in ("ORDER", "SKIP", "LIMIT")
+           for keyword in keywords[last_return + 1:]):
+        return None
+
+    if "LIMIT" in keywords[last_return + 1:]:
+        match = _limit_re.search(masked)
+        if match is None or not match.group(1).isdigit():
+            return None
+        current = int(match.group(1))
+        if current <= limit:
+            return query
+        return f"{query[:match.start(1)]}{limit}"
+    return f"{query}\nLIMIT {limit}"
+
+
+def _unescape(body: str) -> str:
+    """Value of a string literal body.
+
+    Raises:
+        ValueError: for a `\\U` escape outside the unicode range.
+    """
+    def _char(match: "re.Match") -> str:
+        escaped = match.group(1)
+        if len(escaped) > 1:
+            code = int(escaped[1:], 16)
+            if code > sys.maxunicode:
+                raise ValueError(f"invalid unicode escape \\{escaped}")
+            return chr(code)
+        return _ESCAPES.get(escaped, escaped)
+
+    return _escape_re.sub(_char, body)
+
+
+def _inline_spans(masked: str) -> List[Tuple[int, int]]:
+    """(start, end) of the top level parts whose literals are kept inline.
+
+    These are the `SKIP`/`LIMIT` expressions and the unaliased `RETURN`
+    items, whose text is the name of their column.
+    """
+    clauses = _top_level_clauses(masked)
+    if not clauses:
+        return []
+    spans = []
+    for index, (keyword, position) in enumerate(clauses):
+        end = clauses[index + 1][1] if index + 1 < len(clauses) else len(masked)
+        if keyword in ("SKIP", "LIMIT"):
+            spans.append((position, end))
+        if keyword != "RETURN":
+            continue
+        start = position + len("RETURN")
+        clause = masked[start:end]
+        distinct = _distinct_re.match(masked, start + len(clause) - len(clause.lstrip()))
+        if distinct:
+            start = distinct.end()
+        spans.extend((item_start, item_end)
+                     for item_start, item_end in _split_items(masked, start, end)
+                     if not _alias_re.search(masked[item_start:item_end]))
+    return spans
+
+
+def _number(text: str) -> Any:
+    return float(text) if any(c in text for c in ".eE") else int(text)
+
+
+def _is_number_literal(masked: str, start: int) -> bool:
+    """Whether the number at `start` is a value (not a bound, a LIMIT or a SKIP)."""
+    before = masked[:start].rstrip()
+    if before.endswith("*"):
+        # variable length relationship `[*2]`
+        return False
+    words = before.rsplit(None, 1)
+    return not (words and words[-1].upper() in ("LIMIT", "SKIP"))
+
+
+def _lift(query: str, prefix: str, numbers: bool,
+          normalize: bool) -> Tuple[str, Dict[str, Any]]:
+    masked = mask_cypher(query)
+    inline = _inline_spans(masked)
+
+    def _inline(position: int) -> bool:
+        return any(start <= position < end for start, end in inline)
+
+    # (start, end, replacement or None to keep the text, parameter value)
+    spans: List[Tuple[int, int, Optional[str], Any]] = []
+    for match in _literal_re.finditer(query):
+        literal = match.group(0)
+        if _string_re.fullmatch(literal):
+            if _inline(match.start()):
+                continue
+            try:
+                spans.append((match.start(), match.end(), None, _unescape(literal[1:-1])))
+            except ValueError:
+                # invalid escape: Neo4j reports it on the statement as written
+                continue
+        elif normalize and not literal.startswith("`"):
+            # comments
+            spans.append((match.start(), match.end(), " ", None))
+    if numbers:
+        for match in _number_re.finditer(masked):
+            if _is_number_literal(masked, match.start()) and not _inline(match.start()):
+                spans.append((match.start(), match.end(), None, _number(match.group(0))))
+        spans.sort(key=lambda span: span[0])
+
+    # parameters already in the statement keep their name
+    taken = set(_parameter_re.findall(masked))
+    numbering = (f"{prefix}{n}" for n in itertools.count())
+    params: Dict[str, Any] = {}
+    names: Dict[Tuple[type, Any], str] = {}
+    parts: List[str] = []
+    position = 0
+    for start, end, replacement, value in spans:
+        parts.append(query[position:start])
+        if replacement is None:
+            # identical values share a parameter (1 and 1.0 do not)
+            key = (type(value), value)
+            if key not in names:
+                names[key] = next(name for name in numbering if name not in taken)
+                params[names[key]] = value
+            replacement = f"${names[key]}"
+        parts.append(replacement)
+        position = end
+    parts.append(query[position:])
+    template = "".join(parts)
+    if normalize:
+        # collapse the whitespace, except in escaped names
+        template = _space_re.sub(
+            lambda m: m.group(0) if m.group(0).startswith("`") else " ", template
+        ).strip()
+    return template, params
+
+
+def lift_string_literals(query: str, prefix: str = "lit") -> Tuple[str, Dict[str, Any]]:
+    """Replace the string literals of a statement by parameters.
+
+    `WHERE w.value = 'mbwa'` becomes `WHERE w.value = $lit0` with
+    `{"lit0": "mbwa"}`: statements differing only by their strings share
+    the same template.
+    """
+    return _lift(query, prefix, numbers=False, normalize=False)
+
+
+def parameterize_cypher(query: str, prefix: str = "lit") -> Tuple[str, Dict[str, Any]]:
+    """Normalized template of a statement, with its literals as parameters.
+
+    String and number literals become `$lit0`, `$lit1`... (one parameter
+    per distinct value), comments are dropped and whitespace is collapsed,
+    so statements differing only by their values or their layout share the
+    same template: Neo4j plans it once and caches keyed on it hit more
+    often. Numbers which cannot be parameters (variable length bounds), the
+    `LIMIT`/`SKIP` values and the literals of unaliased `RETURN` items
+    (their text is the column name) are kept inline.
+    """
+    return _lift(query, prefix, numbers=True, normalize=True)
+
+
+def _split_items(masked: str, start: int, end: int) -> List[Tuple[int, int]]:
+    """(start, end) of the comma separated items of `masked[start:end]`."""
+    items = []
+    depth = 0
+    item_start = start
+    for position in range(start, end):
+        char = masked[position]
+        if char in _OPENING:
+            depth += 1
+        elif char in _CLOSING:
+            depth -= 1
+        elif char == "," and depth == 0:
+            items.append((item_start, position))
+            item_start = position + 1
+    items.append((item_start, end))
+    return items
+
+
+def alias_return_items(query: str) -> Optional[str]:
+    """Alias the expressions of the final `RETURN` with their own text.
+
+    `RETURN w.translation` becomes ``RETURN w.translation AS `w.translation` ``:
+    the column names do not change, and the statement may be the body of a
+    `CALL {}` subquery, where Neo4j refuses unaliased expressions. Plain
+    variables, `*` and aliased items are kept. Returns None when the final
+    `RETURN` cannot be found, or when an expression to alias holds a
+    parameter (its column name would depend on the value).
+    """
+    masked = mask_cypher(query)
+    clauses = _top_level_clauses(masked)
+    if not clauses:
+        return None
+    returns = [i for i, (keyword, _) in enumerate(clauses) if keyword == "RETURN"]
+    if not returns:
+        return None
+    index = returns[-1]
+    start = clauses[index][1] + len("RETURN")
+    end = next((position for keyword, position in clauses[index + 1:]
+                if keyword in ("ORDER", "SKIP", "LIMIT")), len(query))
+    distinct = _distinct_re.match(masked, start + len(masked[start:]) - len(masked[start:].lstrip()))
+    if distinct:
+        start = distinct.end()
+
+    parts = []
+    position = 0
+    for item_start, item_end in _split_items(masked, start, end):
+        item = masked[item_start:item_end].strip()
+        if item == "*" or _variable_re.fullmatch(item) or _alias_re.search(item):
+            continue
+        if "$" in item:
+            return None
+        item_end = item_start + len(query[item_start:item_end].rstrip())
+        text = query[item_start:item_end].strip()
+        parts.append(query[position:item_end])
+        parts.append(f" AS `{text.replace('`', '``')}`")
+        position = item_end
+    parts.append(query[position:])
+    return "".join(parts)
+
+
+def build_unwind_query(template: str, param_names: List[str]) -> str:
+    """Run a parameterized template once per row of `$batch`.
+
+    Each row holds the template parameters and its index
+    (`BATCH_INDEX`); the records of a row are returned with that row
+    (`BATCH_ROW`), so they can be split back per lookup. The expressions
+    returned by the template are aliased (see `alias_return_items`).
+
+    Raises:
+        ValueError: if they cannot be.
+    """
+    def _param(match: "re.Match") -> str:
+        name = match.group(1)
+        return f"{BATCH_ROW}.{name}" if name in param_names else match.group(0)
+
+    def _params(text: str) -> str:
+        # parameters outside string literals, escaped names and comments
+        masked = mask_cypher(text)
+        return "".join(
+            _param(m) if masked[m.start()] == "$" else m.group(0)
+            for m in re.finditer(r"\$(\w+)|[^$]+|\$", text)
+        )
+
+    aliased = alias_return_items(template)
+    if aliased is None:
+        raise ValueError("the RETURN items of the template cannot be aliased")
+    body = _params(aliased)
+    return f"UNWIND $batch AS {BATCH_ROW}\nCALL {{\nWITH {BATCH_ROW}\n{body}\n}}\nRETURN *"
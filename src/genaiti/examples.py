@@ -0,0 +1,316 @@
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .cache import normalize_question
+
+__all__ = ["ExampleStore"]
+
+logger = logging.getLogger(__name__)
+
+# words ignored when checking that two questions ask for the same thing
+_STOP_WORDS = {
+    "le", "la", "les", "un", "une", "des", "du", "de", "d", "l", "au", "aux", "et", "ou",
+    "est", "sont", "quel", "quelle", "quels", "quelles", "moi", "me", "tu", "as", "il",
+    "y", "a", "qui", "que", "quoi", "dans", "pour", "sur", "avec", "tous", "toutes",
+    "the", "an", "of", "in", "on", "for", "to", "is", "are", "what", "which", "all",
+    "me", "please", "you", "your", "do", "does", "s", "svp",
+}
+
+
+def _content_words(normalized: str) -> frozenset:
+    return frozenset(w for w in normalized.split() if w not in _STOP_WORDS)
+
+
+class ExampleStore:
+    """Verified (question, Cypher) pairs retrieved by question similarity.
+
+    Questions are embedded as TF-IDF vectors of hashed character n-grams
+    (NumPy only). The store is used in two ways by the chain:
+
+    - `format_examples` renders the `k` nearest examples for the
+      `{examples}` variable of the Cypher prompt,
+    - `direct_hit` returns the stored Cypher of a question close enough to
+      a verified one (same content words, similarity above
+      `direct_hit_threshold`), skipping the Cypher LLM.
+
+    Examples come from successful runs (`source="run"`) and from operator
+    curation (`verified=True`), either through `add` or by editing the JSON
+    file at `path`. Run examples only feed the prompt: a wrong Cypher which
+    happened to return rows must not answer every later paraphrase. When
+    the store is full the oldest unverified examples are dropped first.
+
+    The index is updated in place when an example is added or removed (its
+    row and the document frequencies), so recording an example never
+    rebuilds it; a search weighs the rows with the current idf.
+
+    Changes are written to `path` by a timer thread, at most once per
+    `flush_interval` seconds, so recording an example does not block the
+    caller (nor the event loop); `flush` writes pending changes at once.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        k: int = 3,
+        min_similarity: float = 0.3,
+        direct_hit_threshold: float = 0.9,
+        ngram_range: Tuple[int, int] = (2, 4),
+        dim: int = 4096,
+        max_examples: int = 2000,
+        flush_interval: float = 5.0,
+    ):
+        """
+        Args:
+            path: optional JSON file used to persist the examples.
+            k: number of examples given to the Cypher prompt.
+            min_similarity: minimal cosine similarity of a prompt example.
+            direct_hit_threshold: minimal cosine similarity to reuse a Cypher.
+            ngram_range: sizes of the character n-grams.
+            dim: number of hashed n-gram features.
+            max_examples: maximal number of stored examples.
+            flush_interval: seconds before changes are written to `path`.
+        """
+        self.path = path
+        self.k = k
+        self.min_similarity = min_similarity
+        self.direct_hit_threshold = direct_hit_threshold
+        self.ngram_range = ngram_range
+        self.dim = dim
+        self.max_examples = max_examples
+        self.flush_interval = flush_interval
+        self._reset()
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._timer: Optional[threading.Timer] = None
+        self.lookups = 0
+        self.direct_hits = 0
+
+    def _reset(self) -> None:
+        self.examples: List[Dict[str, Any]] = []
+        self._keys: List[str] = []
+        # index rows: sublinear tf and its square (for the norms), free rows zeroed
+        self._rows: List[int] = []
+        self._tf = np.zeros((0, self.dim), dtype=np.float32)
+        self._tf2 = np.zeros((0, self.dim), dtype=np.float32)
+        self._df = np.zeros(self.dim, dtype=np.float32)
+        self._free: List[int] = []
+        self._row_examples: List[Optional[Dict[str, Any]]] = []
+
+    def __len__(self) -> int:
+        return len(self.examples)
+
+    def _term_counts(self, normalized: str) -> np.ndarray:
+        text = f" {normalized} "
+        counts = np.zeros(self.dim, dtype=np.float32)
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for i in range(len(text) - n + 1):
+                counts[zlib.crc32(text[i:i + n].encode("utf-8")) % self.dim] += 1
+        return counts
+
+    @staticmethod
+    def _sublinear(counts: np.ndarray) -> np.ndarray:
+        tf = np.zeros_like(counts)
+        np.log1p(counts, out=tf, where=counts > 0)
+        return tf
+
+    def _scores(self, query_tf: np.ndarray) -> np.ndarray:
+        """Cosine similarity of the tf-idf vectors of the query and of each row.
+
+        With w = tf * idf, cos = tf . (q * idf^2) / (|tf * idf| |q * idf|) and
+        |tf * idf|^2 = tf^2 . idf^2: no weighted copy of the index is needed.
+        """
+        idf = (np.log((1 + len(self.examples)) / (1 + self._df)) + 1).astype(np.float32)
+        idf2 = idf * idf
+        query_norm = float(np.linalg.norm(query_tf * idf))
+        dots = self._tf @ (query_tf * idf2)
+        norms = np.sqrt(self._tf2 @ idf2) * query_norm
+        return dots / np.maximum(norms, 1e-12)
+
+    def search(self, question: str, k: Optional[int] = None,
+               min_similarity: Optional[float] = None) -> List[Tuple[float, Dict[str, Any]]]:
+        """The `k` stored examples most similar to the question, best first."""
+        k = self.k if k is None else k
+        min_similarity = self.min_similarity if min_similarity is None else min_similarity
+        query = self._sublinear(self._term_counts(normalize_question(question)))
+        with self._lock:
+            if not len(self.examples) or k <= 0:
+                return []
+            scores = self._scores(query)
+            best = np.argsort(-scores)[:k]
+            return [(float(scores[i]), self._row_examples[i]) for i in best
+                    if self._row_examples[i] is not None and scores[i] >= min_similarity]
+
+    def direct_hit(self, question: str) -> Optional[str]:
+        """Stored Cypher of an equivalent verified question, if any."""
+        self.lookups += 1
+        matches = self.search(question, k=1, min_similarity=self.direct_hit_threshold)
+        if not matches:
+            return None
+        _, example = matches[0]
+        if not example["verified"]:
+            return None
+        words = _content_words(normalize_question(question))
+        # similar questions on another word or name need another Cypher
+        if words != _content_words(normalize_question(example["question"])):
+            return None
+        with self._lock:
+            example["hits"] = example.get("hits", 0) + 1
+        self.direct_hits += 1
+        return example["cypher"]
+
+    def format_examples(self, question: str, k: Optional[int] = None) -> str:
+        """Prompt block with the nearest examples, empty if there is none."""
+        matches = self.search(question, k)
+        if not matches:
+            return ""
+        lines = ["Verified examples of questions with their Cypher statement:"]
+        for _, example in matches:
+            lines.append(f"- Question: {example['question']}")
+            lines.append(f"  Cypher: {' '.join(example['cypher'].split())}")
+        return "\n".join(lines)
+
+    def _find(self, normalized: str) -> Optional[int]:
+        try:
+            return self._keys.index(normalized)
+        except ValueError:
+            return None
+
+    def _append(self, example: Dict[str, Any]) -> None:
+        normalized = normalize_question(example["question"])
+        tf = self._sublinear(self._term_counts(normalized))
+        if not self._free:
+            # grow by doubling: amortized constant time per example
+            size = len(self._row_examples)
+            grown = max(16, 2 * size)
+            self._tf = np.resize(self._tf, (grown, self.dim))
+            self._tf2 = np.resize(self._tf2, (grown, self.dim))
+            self._tf[size:] = 0
+            self._tf2[size:] = 0
+            self._row_examples.extend([None] * (grown - size))
+            self._free.extend(range(grown - 1, size - 1, -1))
+        row = self._free.pop()
+        self._tf[row] = tf
+        self._tf2[row] = tf * tf
+        self._df += tf > 0
+        self._row_examples[row] = example
+        self.examples.append(example)
+        self._keys.append(normalized)
+        self._rows.append(row)
+
+    def _delete(self, index: int) -> None:
+        row = self._rows[index]
+        self._df -= self._tf[row] > 0
+        self._tf[row] = 0
+        self._tf2[row] = 0
+        self._row_examples[row] = None
+        self._free.append(row)
+        del self.examples[index]
+        del self._keys[index]
+        del self._rows[index]
+
+    def add(self, question: str, cypher: str, verified: bool = False,
+            source: str = "run", save: bool = True) -> bool:
+        """Store an example; return False if it was already stored as is.
+
+        A verified example is never replaced by an unverified one. With
+        `save`, the store is written to disk by the next flush.
+        """
+        normalized = normalize_question(question)
+        with self._lock:
+            index = self._find(normalized)
+            if index is not None:
+                example = self.examples[index]
+                if example["cypher"] == cypher and example["verified"] >= verified:
+                    return False
+                if example["verified"] and not verified:
+                    return False
+                example.update(cypher=cypher, verified=verified, source=source)
+            else:
+                self._append({"question": question, "cypher": cypher,
+                              "verified": verified, "source": source,
+                              "hits": 0, "added_at": time.time()})
+                self._evict()
+        if save:
+            self._schedule_flush()
+        return True
+
+    def remove(self, question: str, save: bool = True) -> bool:
+        with self._lock:
+            index = self._find(normalize_question(question))
+            if index is None:
+                return False
+            self._delete(index)
+        if save:
+            self._schedule_flush()
+        return True
+
+    def _evict(self) -> None:
+        while len(self.examples) > self.max_examples:
+            unverified = [i for i, e in enumerate(self.examples) if not e["verified"]]
+            self._delete(unverified[0] if unverified else 0)
+
+    def load(self, path: Optional[str] = None) -> bool:
+        """Load the examples from disk; return False if there are none."""
+        path = path or self.path
+        if not path or not os.path.exists(path):
+            return False
+        with open(path, encoding="utf-8") as f:
+            examples = json.load(f)
+        with self._lock:
+            self._reset()
+            for example in examples:
+                example.setdefault("verified", False)
+                example.setdefault("source", "operator" if example["verified"] else "run")
+                example.setdefault("hits", 0)
+                self._append(example)
+            self._evict()
+        return True
+
+    def _schedule_flush(self) -> None:
+        with self._lock:
+            self._dirty = True
+            if self.path and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self) -> None:
+        """Write the pending changes to `path` (e.g. at shutdown)."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+        try:
+            self.save()
+        except OSError:
+            logger.warning("examples could not be saved to %s", self.path, exc_info=True)
+            with self._lock:
+                self._dirty = True
+
+    def save(self, path: Optional[str] = None) -> None:
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            examples = [dict(example) for example in self.examples]
+            if path == self.path:
+                self._dirty = False
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(examples, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"examples": len(self.examples),
+                "verified": sum(1 for e in self.examples if e["verified"]),
+                "lookups": self.lookups, "direct_hits": self.direct_hits}
@@ -1,8 +1,15 @@
 
-from typing import Any, Dict, List, Optional
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
 
 from langchain_community.graphs.graph_store import GraphStore
-from langchain_core.callbacks import CallbackManagerForChainRun
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForChainRun,
+    CallbackManagerForChainRun,
+    Callbacks,
+)
 from langchain_core.language_models import BaseLanguageModel
 from langchain_core.prompts import BasePromptTemplate
 from langchain_core.pydantic_v1 import Field
@@ -12,13 +19,55 @@ from langchain.chains.graph_qa.cypher_utils import CypherQueryCorrector, Schema
 from langchain.chains.llm import LLMChain
 from langchain.chains import ConversationChain
 
+from .cache import (
+    AnswerCache,
+    QueryResultCache,
+    fingerprint,
+    llm_chain_fingerprint,
+    normalize_question,
+)
+from .context import ContextCompactor, estimate_tokens
+from .corrector import MemoizedCypherQueryCorrector
+from .cypher import (
+    BATCH_INDEX,
+    BATCH_ROW,
+    alias_return_items,
+    build_unwind_query,
+    enforce_limit,
+    parameterize_cypher,
+)
+from .examples import ExampleStore
+from .metrics import (
+    BATCH_FALLBACKS,
+    CACHE_HITS,
+    GRAPH_ROWS,
+    QUESTIONS,
+    ROUTE_DECISIONS,
+    TOKENS,
+    Metrics,
+    NoopMetrics,
+)
+from .router import QuestionRouter
+from .scheduler import (
+    PRIORITY_CHECKER,
+    PRIORITY_INTERACTIVE,
+    LLMScheduler,
+    batch_priority,
+    schedule_llm,
+)
+from .schema import SchemaIndex, SchemaSnapshot
+from .singleflight import SingleFlight
+from .speculation import AsyncSpeculation, Speculation
+from .streaming import QA_STREAM_TAG
 from .utils import *
-from .prompts_template import *
+from .prompt_registry import prompt_registry
 
-CYPHER_GENERATION_PROMPT = build_prompt_cypher_generator()
-CYPHER_QA_PROMPT = build_prompt_cypher_qa_generator()
-QUESTION_VALIDATION_PROMPT = build_question_validation_prompt()
-SAFETY_PROMPT = build_safety_prompt()
+CYPHER_GENERATION_PROMPT = prompt_registry.get("cypher_generation")
+CYPHER_QA_PROMPT = prompt_registry.get("qa")
+QUESTION_VALIDATION_PROMPT = prompt_registry.get("validation")
+SAFETY_PROMPT = prompt_registry.get("safety")
+
+logger = logging.getLogger(__name__)
 
 
 class GraphCypherQAChain(Chain):
@@ -56,6 +105,28 @@ class GraphCypherQAChain(Chain):
     """Whether or not to return the result of querying the graph directly."""
     cypher_query_corrector: Optional[CypherQueryCorrector] = None
     """Optional cypher validation tool"""
+    answer_cache: Optional[AnswerCache] = None
+    """Optional tiered cache for validation verdicts, Cypher statements and answers"""
+    query_cache: Optional[QueryResultCache] = None
+    """Optional graph-versioned cache of Cypher query results"""
+    schema_snapshot: Optional[SchemaSnapshot] = Field(default=None, exclude=True)
+    """Optional persistent schema snapshot the graph schema was built from"""
+    question_router: Optional[QuestionRouter] = None
+    """Optional local router answering the question validation without the checker LLM"""
+    speculative: bool = False
+    """Whether to generate the Cypher statement while the checker LLM validates the question"""
+    schema_index: Optional[SchemaIndex] = Field(default=None, exclude=True)
+    """Optional index giving the Cypher prompt only the schema part a question is about"""
+    example_store: Optional[ExampleStore] = Field(default=None, exclude=True)
+    """Optional store of verified question/Cypher examples (prompt examples and direct hits)"""
+    context_compactor: Optional[ContextCompactor] = None
+    """Optional serializer keeping the QA prompt context within a token budget"""
+    parameterize: bool = True
+    """Whether to send the generated Cypher as a normalized template with its literals as parameters"""
+    metrics: Metrics = Field(default_factory=NoopMetrics, exclude=True)
+    """Sink of the per-stage spans, histograms and counters (disabled by default)"""
+    single_flight: Optional[SingleFlight] = Field(default=None, exclude=True)
+    """Optional group sharing one execution between concurrent identical questions"""
 
     @property
     def input_keys(self) -> List[str]:
@@ -105,9 +176,15 @@ class GraphCypherQAChain(Chain):
         cypher_llm_kwargs: Optional[Dict[str, Any]] = None,
         checker_llm_kwargs: Optional[Dict[str, Any]] = None,
         safety_llm_kwargs: Optional[Dict[str, Any]] = None,
+        schema_snapshot: Optional[SchemaSnapshot] = None,
+        scheduler: Optional[LLMScheduler] = None,
         **kwargs: Any,
     ):
-        """Initialize from LLM."""
+        """Initialize from LLM.
+
+        With a `scheduler`, every LLM call goes through its admission control,
+        the checker calls first.
+        """
         #if not safety_prompt and not validate_prompt:
         #    raise ValueError("Either `validate_prompt` or `safety_prompt` parameters must be provided")
         if not cypher_llm and not llm:
@@ -161,17 +238,23 @@ class GraphCypherQAChain(Chain):
                 safety_prompt if safety_prompt is not None else SAFETY_PROMPT
             )
 
-        qa_chain = LLMChain(llm=qa_llm or llm,
+        qa_llm, cypher_llm, checker_llm = qa_llm or llm, cypher_llm or llm, checker_llm or llm
+        if scheduler is not None:
+            qa_llm = schedule_llm(qa_llm, scheduler, PRIORITY_INTERACTIVE)
+            cypher_llm = schedule_llm(cypher_llm, scheduler, PRIORITY_INTERACTIVE)
+            checker_llm = schedule_llm(checker_llm, scheduler, PRIORITY_CHECKER)
+
+        qa_chain = LLMChain(llm=qa_llm,
                             **use_qa_llm_kwargs)
 
-        checker_chain = LLMChain(llm=checker_llm or llm,
+        checker_chain = LLMChain(llm=checker_llm,
                                 **use_checker_llm_kwargs)
         
-        safety_chain = LLMChain(llm=checker_llm or llm,
+        safety_chain = LLMChain(llm=checker_llm,
                                 **use_safety_llm_kwargs)
 
         cypher_generation_chain = LLMChain(
-            llm=cypher_llm or llm,
+            llm=cypher_llm,
             **use_cypher_llm_kwargs
         )
 
@@ -181,18 +264,24 @@ class GraphCypherQAChain(Chain):
                 "can be provided, but not both"
             )
 
-        graph_schema = construct_schema(
-            kwargs["graph"].get_structured_schema, 
-            include_types, exclude_types
-        )
+        # a snapshot memoizes the formatted schema and the corrector
+        if schema_snapshot is not None:
+            graph_schema = schema_snapshot.formatted(include_types, exclude_types)
+        else:
+            graph_schema = construct_schema(
+                kwargs["graph"].get_structured_schema, 
+                include_types, exclude_types
+            )
 
         cypher_query_corrector = None
-        if validate_cypher:
+        if validate_cypher and schema_snapshot is not None:
+            cypher_query_corrector = schema_snapshot.corrector()
+        elif validate_cypher:
             corrector_schema = [
                 Schema(el["start"], el["type"], el["end"])
                 for el in kwargs["graph"].structured_schema.get("relationships")
             ]
-            cypher_query_corrector = CypherQueryCorrector(corrector_schema)
+            cypher_query_corrector = MemoizedCypherQueryCorrector(corrector_schema)
 
         return cls(
             graph_schema=graph_schema,
@@ -201,9 +290,243 @@ class GraphCypherQAChain(Chain):
             safety_chain=safety_chain,
             cypher_generation_chain=cypher_generation_chain,
             cypher_query_corrector=cypher_query_corrector,
+            schema_snapshot=schema_snapshot,
             **kwargs
         )
 
+    def _cache_identity(self, tier: str, graph_version: Optional[str] = None) -> str:
+        """Identity of the pipeline stages a cache tier depends on."""
+        if tier == "checker":
+            return llm_chain_fingerprint(self.checker_chain)
+        parts = [llm_chain_fingerprint(self.cypher_generation_chain), self.graph_schema,
+                 self.cypher_query_corrector is not None,
+                 self.schema_index.fingerprint if self.schema_index is not None else None]
+        if tier == "answer":
+            # answers built from an outdated graph must not be served
+            parts += [llm_chain_fingerprint(self.checker_chain),
+                      llm_chain_fingerprint(self.qa_chain),
+                      self.top_k, self.return_direct, self.return_intermediate_steps,
+                      getattr(self.context_compactor, "max_tokens", None), graph_version]
+        return fingerprint(*parts)
+
+    def _cache_get(self, tier: str, question: str, graph_version: Optional[str] = None) -> Any:
+        if self.answer_cache is None:
+            return None
+        identity = self._cache_identity(tier, graph_version)
+        return self.answer_cache.get(tier, question, identity)
+
+    def _cache_set(self, tier: str, question: str, value: Any,
+                   graph_version: Optional[str] = None) -> None:
+        if self.answer_cache is not None:
+            identity = self._cache_identity(tier, graph_version)
+            self.answer_cache.set(tier, question, identity, value)
+
+    def _flight_key(self, question: str, graph_version: Optional[str]) -> str:
+        return fingerprint(self._cache_identity("answer", graph_version),
+                           normalize_question(question))
+
+    def _route_question(self, question: str) -> Optional[str]:
+        """Validate the question locally (router, cache); None if the LLM must decide."""
+        # obvious questions (greetings, dictionary lookups) skip the checker LLM
+        if self.question_router is not None:
+            routed = self.question_router.route(question)
+            if routed is not None:
+                self.metrics.increment(ROUTE_DECISIONS, source="router", verdict=str(routed))
+                return str(routed)
+        verdict = self._cache_get("checker", question)
+        if verdict is not None:
+            self.metrics.increment(ROUTE_DECISIONS, source="cache", verdict=verdict.strip())
+        return verdict
+
+    def _finalize_verdict(self, question: str, verdict: str) -> str:
+        """Parse the checker LLM output and remember the verdict."""
+        verdict = get_response_from_generator(verdict, qa_re)
+
+        if self.question_router is not None and verdict.strip() in ("True", "False"):
+            self.question_router.observe(question, verdict.strip() == "True")
+        self._cache_set("checker", question, verdict)
+        self.metrics.increment(ROUTE_DECISIONS, source="llm", verdict=verdict.strip())
+        return verdict
+
+    def _ask_checker(self, question: str, callbacks: Callbacks) -> str:
+        """Ask the checker LLM whether the question can be answered with Cypher."""
+        with self.metrics.span("checker"):
+            verdict = self.checker_chain.run(
+                {"question": question}, 
+                callbacks=callbacks
+            )
+        return self._finalize_verdict(question, verdict)
+
+    async def _aask_checker(self, question: str, callbacks: Callbacks) -> str:
+        with self.metrics.span("checker"):
+            verdict = await self.checker_chain.arun(
+                {"question": question}, 
+                callbacks=callbacks
+            )
+        return self._finalize_verdict(question, verdict)
+
+    def _cypher_inputs(self, question: str) -> Dict[str, Any]:
+        if self.schema_index is not None:
+            inputs = {"question": question, "schema": self.schema_index.schema_for(question)}
+        else:
+            inputs = {"question": question, "schema": self.graph_schema}
+        if "examples" in self.cypher_generation_chain.prompt.input_variables:
+            inputs["examples"] = (self.example_store.format_examples(question)
+                                  if self.example_store is not None else "")
+        return inputs
+
+    def _known_cypher(self, question: str) -> Optional[str]:
+        """Cypher of the question found without the LLM (cache, verified examples)."""
+        generated_cypher = self._cache_get("cypher", question)
+        if generated_cypher is not None:
+            self.metrics.increment(CACHE_HITS, tier="cypher")
+        elif self.example_store is not None:
+            generated_cypher = self.example_store.direct_hit(question)
+            if generated_cypher is not None:
+                logger.debug("Example store hit: %s", generated_cypher)
+                self.metrics.increment(CACHE_HITS, tier="example")
+                self._cache_set("cypher", question, generated_cypher)
+        return generated_cypher
+
+    def _record_example(self, question: str, cypher: str, context: List[Dict[str, Any]]) -> None:
+        """Keep the Cypher of a question which returned results as an example."""
+        if self.example_store is not None and context:
+            self.example_store.add(question, cypher)
+
+    def _finalize_cypher(self, question: str, generated_cypher: str) -> str:
+        """Extract and optionally correct the generated Cypher, then remember it."""
+        generated_cypher = get_response_from_generator(generated_cypher)
+        # Extract Cypher code if it is wrapped in backticks
+        generated_cypher = extract_cypher(generated_cypher)
+
+        logger.debug("Generated Cypher: %s", generated_cypher)
+        if self.metrics.enabled:
+            self.metrics.observe(TOKENS, estimate_tokens(generated_cypher), kind="cypher")
+
+        # Correct Cypher query if enabled
+        if self.cypher_query_corrector:
+            with self.metrics.span("corrector"):
+                generated_cypher = self.cypher_query_corrector(generated_cypher)
+            logger.debug("Corrected Cypher: %s", generated_cypher)
+
+        self._cache_set("cypher", question, generated_cypher)
+        return generated_cypher
+
+    def _generate_cypher(self, question: str, callbacks: Callbacks) -> str:
+        """Generate, extract and optionally correct the Cypher statement."""
+        generated_cypher = self._known_cypher(question)
+        if generated_cypher is not None:
+            return generated_cypher
+
+        with self.metrics.span("cypher_generation"):
+            generated_cypher = self.cypher_generation_chain.run(
+                self._cypher_inputs(question), 
+                callbacks=callbacks
+            )
+        return self._finalize_cypher(question, generated_cypher)
+
+    async def _agenerate_cypher(self, question: str, callbacks: Callbacks) -> str:
+        generated_cypher = self._known_cypher(question)
+        if generated_cypher is not None:
+            return generated_cypher
+
+        with self.metrics.span("cypher_generation"):
+            generated_cypher = await self.cypher_generation_chain.arun(
+                self._cypher_inputs(question), 
+                callbacks=callbacks
+            )
+        return self._finalize_cypher(question, generated_cypher)
+
+    def _query_graph(
+        self, query: str, params: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Run a Cypher statement, going through the result cache if any."""
+        if self.query_cache is not None:
+            return self.query_cache.query(self.graph, query, params, limit)
+        return query_graph(self.graph, query, params, limit)
+
+    async def _aquery_graph(
+        self, query: str, params: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        if self.query_cache is not None:
+            return await self.query_cache.aquery(self.graph, query, params, limit)
+        return await aquery_graph(self.graph, query, params, limit)
+
+    def _statement(self, cypher: str) -> Tuple[str, Dict[str, Any]]:
+        """Statement and parameters sent to the graph for a Cypher statement."""
+        if self.parameterize:
+            # one template per question shape: Neo4j plans it once
+            return parameterize_cypher(cypher)
+        return cypher, {}
+
+    def _retrieve_context(self, cypher: str) -> List[Dict[str, Any]]:
+        """Run the generated Cypher, reading at most `top_k` records.
+
+        The `LIMIT` is pushed down into the statement when possible, otherwise
+        the result cursor is closed after `top_k` records.
+        """
+        limited_cypher = enforce_limit(cypher, self.top_k)
+        query, params = self._statement(limited_cypher or cypher)
+        with self.metrics.span("graph_query"):
+            if limited_cypher is not None:
+                context = self._query_graph(query, params)[: self.top_k]
+            else:
+                context = self._query_graph(query, params, limit=self.top_k)
+        self.metrics.observe(GRAPH_ROWS, len(context))
+        return context
+
+    async def _aretrieve_context(self, cypher: str) -> List[Dict[str, Any]]:
+        limited_cypher = enforce_limit(cypher, self.top_k)
+        query, params = self._statement(limited_cypher or cypher)
+        with self.metrics.span("graph_query"):
+            if limited_cypher is not None:
+                context = (await self._aquery_graph(query, params))[: self.top_k]
+            else:
+                context = await self._aquery_graph(query, params, limit=self.top_k)
+        self.metrics.observe(GRAPH_ROWS, len(context))
+        return context
+
+    def _compact_context(self, context: List[Dict[str, Any]], intermediate_steps: List) -> Any:
+        """Context given to the QA prompt, compacted if a compactor is set."""
+        intermediate_steps.append({"context": context})
+        if self.context_compactor is None:
+            if self.metrics.enabled:
+                self.metrics.observe(TOKENS, estimate_tokens(str(context)), kind="qa_context")
+            return context
+        qa_context, report = self.context_compactor.compact(context)
+        logger.debug("QA context compacted: %s", report)
+        self.metrics.observe(TOKENS, report["tokens"], kind="qa_context")
+        self.metrics.observe(TOKENS, report["saved_tokens"], kind="qa_context_saved")
+        intermediate_steps.append({"context_report": report})
+        return qa_context
+
+    def _finalize_answer(self, result: Dict[str, Any]) -> str:
+        answer = get_response_from_generator(result[self.qa_chain.output_key], qa_re)
+        if self.metrics.enabled:
+            self.metrics.observe(TOKENS, estimate_tokens(answer), kind="answer")
+        return answer
+
+    def _ask_qa(self, question: str, context: Any, callbacks: Callbacks) -> str:
+        """Answer the question from the (possibly empty) graph context."""
+        with self.metrics.span("qa"):
+            result = self.qa_chain(
+                {"question": question, "context": context},
+                callbacks=callbacks,
+                tags=[QA_STREAM_TAG],
+            )
+        return self._finalize_answer(result)
+
+    async def _aask_qa(self, question: str, context: Any, callbacks: Callbacks) -> str:
+        with self.metrics.span("qa"):
+            result = await self.qa_chain.acall(
+                {"question": question, "context": context},
+                callbacks=callbacks,
+                tags=[QA_STREAM_TAG],
+            )
+        return self._finalize_answer(result)
+
     def _call(
         self,
         inputs: Dict[str, Any],
@@ -215,49 +538,120 @@ class GraphCypherQAChain(Chain):
         question = inputs[self.input_key]
         #history = inputs[self.history_key]
 
+        graph_version = None
+        if self.answer_cache is not None:
+            if self.query_cache is not None:
+                graph_version = self.query_cache.version(self.graph)
+            cached_result = self._cache_get("answer", question, graph_version)
+            if cached_result is not None:
+                self.metrics.increment(CACHE_HITS, tier="answer")
+                _run_manager.on_text("Cached answer:", end="\n", verbose=self.verbose)
+                _run_manager.on_text(
+                    str(cached_result[self.output_key]), color="green", end="\n",
+                    verbose=self.verbose
+                )
+                return dict(cached_result)
+
+        def _answer() -> Dict[str, Any]:
+            self.metrics.increment(QUESTIONS)
+            with self.metrics.span("question"):
+                result = self._answer_question(question, _run_manager, callbacks)
+            self._cache_set("answer", question, result, graph_version)
+            return result
+
+        if self.single_flight is None:
+            return _answer()
+        # sessions asking the same question at the same time share one run
+        chain_result, shared = self.single_flight.do(
+            self._flight_key(question, graph_version), _answer)
+        if shared:
+            self.metrics.increment(CACHE_HITS, tier="single_flight")
+            _run_manager.on_text("Shared answer:", end="\n", verbose=self.verbose)
+        return dict(chain_result)
+
+    async def _acall(
+        self,
+        inputs: Dict[str, Any],
+        run_manager: Optional[AsyncCallbackManagerForChainRun] = None,
+    ) -> Dict[str, Any]:
+        """Generate Cypher statement, use it to look up in db and answer question."""
+        _run_manager = run_manager or AsyncCallbackManagerForChainRun.get_noop_manager()
+        callbacks = _run_manager.get_child()
+        question = inputs[self.input_key]
+
+        graph_version = None
+        if self.answer_cache is not None:
+            if self.query_cache is not None:
+                graph_version = await self.query_cache.aversion(self.graph)
+            cached_result = self._cache_get("answer", question, graph_version)
+            if cached_result is not None:
+                self.metrics.increment(CACHE_HITS, tier="answer")
+                await _run_manager.on_text("Cached answer:", end="\n", verbose=self.verbose)
+                await _run_manager.on_text(
+                    str(cached_result[self.output_key]), color="green", end="\n",
+                    verbose=self.verbose
+                )
+                return dict(cached_result)
+
+        async def _answer() -> Dict[str, Any]:
+            self.metrics.increment(QUESTIONS)
+            with self.metrics.span("question"):
+                result = await self._aanswer_question(question, _run_manager, callbacks)
+            self._cache_set("answer", question, result, graph_version)
+            return result
+
+        if self.single_flight is None:
+            return await _answer()
+        # sessions asking the same question at the same time share one run; it
+        # goes on (streamed to the first asker) if the first asker leaves
+        chain_result, shared = await self.single_flight.ado(
+            self._flight_key(question, graph_version), _answer)
+        if shared:
+            self.metrics.increment(CACHE_HITS, tier="single_flight")
+            await _run_manager.on_text("Shared answer:", end="\n", verbose=self.verbose)
+        return dict(chain_result)
+
+    def _answer_question(
+        self,
+        question: str,
+        _run_manager: CallbackManagerForChainRun,
+        callbacks: Callbacks,
+    ) -> Dict[str, Any]:
         intermediate_steps: List = []
 
-        #print("cypher_generation_chain: ", {"question": question, "schema": self.graph_schema})
-        # get cypher command based of user question
-        is_can_be_cypher_command = self.checker_chain.run(
-            {"question": question}, 
-            callbacks=callbacks
-        )
-        is_can_be_cypher_command = get_response_from_generator(is_can_be_cypher_command, qa_re)
+        # check if the user question can be translated to a cypher command
+        is_can_be_cypher_command = self._route_question(question)
+        speculation = None
+        if is_can_be_cypher_command is None:
+            if self.speculative:
+                # generate the cypher while the checker LLM is thinking
+                speculation = Speculation(self._generate_cypher, question, callbacks,
+                                          metrics=self.metrics)
+            try:
+                is_can_be_cypher_command = self._ask_checker(question, callbacks)
+            except BaseException:
+                if speculation is not None:
+                    speculation.discard()
+                raise
         intermediate_steps.append({"is_can_be_translated_to_cypher_command": is_can_be_cypher_command})
-        print("is_can_be_cypher_command: ", is_can_be_cypher_command)
+        logger.debug("Question can be translated to Cypher: %s", is_can_be_cypher_command)
         if is_can_be_cypher_command.strip() == "False":
+            if speculation is not None:
+                speculation.discard()
             _run_manager.on_text("User can't be translated to Cypher:", end="\n", verbose=self.verbose)
             _run_manager.on_text(
                 is_can_be_cypher_command, color="green", end="\n", verbose=self.verbose
             )
-            result = self.qa_chain(
-                {"question": question, "context": ""},
-                callbacks=callbacks,
-            )
-            print(result)
-            final_result = get_response_from_generator(result["text"], qa_re)
+            final_result = self._ask_qa(question, "", callbacks)
             chain_result: Dict[str, Any] = {self.output_key: final_result}
             return chain_result
             
 
         # get cypher command based of user question
-        generated_cypher = self.cypher_generation_chain.run(
-            {"question": question, "schema": self.graph_schema}, 
-            callbacks=callbacks
-        )
-
-        generated_cypher = get_response_from_generator(generated_cypher)
-        # print(generated_cypher)
-        # Extract Cypher code if it is wrapped in backticks
-        generated_cypher = extract_cypher(generated_cypher)
-
-        print("generated_cypher: ", generated_cypher)
-
-        # Correct Cypher query if enabled
-        if self.cypher_query_corrector:
-            generated_cypher = self.cypher_query_corrector(generated_cypher)
-            print("cypher_query_corrector: ", generated_cypher)
+        if speculation is not None:
+            generated_cypher = speculation.result()
+        else:
+            generated_cypher = self._generate_cypher(question, callbacks)
 
         _run_manager.on_text("Generated Cypher:", end="\n", verbose=self.verbose)
         _run_manager.on_text(
@@ -269,32 +663,290 @@ class GraphCypherQAChain(Chain):
         # Retrieve and limit the number of results
         # Generated Cypher be null if query corrector identifies invalid schema
         if generated_cypher:
-            context = self.graph.query(generated_cypher)[: self.top_k]
+            context = self._retrieve_context(generated_cypher)
+            self._record_example(question, generated_cypher, context)
         else:
             context = []
 
         if self.return_direct:
             final_result = context
         else:
-            print("context", context)
+            qa_context = self._compact_context(context, intermediate_steps)
             _run_manager.on_text("Full Context:", end="\n", verbose=self.verbose)
             _run_manager.on_text(
-                str(context), color="green", end="\n", verbose=self.verbose
+                str(qa_context), color="green", end="\n", verbose=self.verbose
             )
 
-            intermediate_steps.append({"context": context})
+            final_result = self._ask_qa(question, qa_context, callbacks)
 
-            result = self.qa_chain.run(
-                {"question": question, "context": context},
-                callbacks=callbacks,
+        chain_result: Dict[str, Any] = {self.output_key: final_result}
+        if self.return_intermediate_steps:
+            chain_result[INTERMEDIATE_STEPS_KEY] = intermediate_steps
+
+        return chain_result
+
+    async def _aanswer_question(
+        self,
+        question: str,
+        _run_manager: AsyncCallbackManagerForChainRun,
+        callbacks: Callbacks,
+    ) -> Dict[str, Any]:
+        intermediate_steps: List = []
+
+        # check if the user question can be translated to a cypher command
+        is_can_be_cypher_command = self._route_question(question)
+        speculation = None
+        if is_can_be_cypher_command is None:
+            if self.speculative:
+                # generate the cypher while the checker LLM is thinking
+                speculation = AsyncSpeculation(self._agenerate_cypher(question, callbacks),
+                                               metrics=self.metrics)
+            try:
+                is_can_be_cypher_command = await self._aask_checker(question, callbacks)
+            except BaseException:
+                if speculation is not None:
+                    speculation.discard()
+                raise
+        intermediate_steps.append({"is_can_be_translated_to_cypher_command": is_can_be_cypher_command})
+        logger.debug("Question can be translated to Cypher: %s", is_can_be_cypher_command)
+        if is_can_be_cypher_command.strip() == "False":
+            if speculation is not None:
+                speculation.discard()
+            await _run_manager.on_text("User can't be translated to Cypher:", end="\n", verbose=self.verbose)
+            await _run_manager.on_text(
+                is_can_be_cypher_command, color="green", end="\n", verbose=self.verbose
+            )
+            final_result = await self._aask_qa(question, "", callbacks)
+            chain_result: Dict[str, Any] = {self.output_key: final_result}
+            return chain_result
+
+        # get cypher command based of user question
+        if speculation is not None:
+            generated_cypher = await speculation.result()
+        else:
+            generated_cypher = await self._agenerate_cypher(question, callbacks)
+
+        await _run_manager.on_text("Generated Cypher:", end="\n", verbose=self.verbose)
+        await _run_manager.on_text(
+            generated_cypher, color="green", end="\n", verbose=self.verbose
+        )
+
+        intermediate_steps.append({"query": generated_cypher})
+
+        # Retrieve and limit the number of results
+        # Generated Cypher be null if query corrector identifies invalid schema
+        if generated_cypher:
+            context = await self._aretrieve_context(generated_cypher)
+            self._record_example(question, generated_cypher, context)
+        else:
+            context = []
+
+        if self.return_direct:
+            final_result = context
+        else:
+            qa_context = self._compact_context(context, intermediate_steps)
+            await _run_manager.on_text("Full Context:", end="\n", verbose=self.verbose)
+            await _run_manager.on_text(
+                str(qa_context), color="green", end="\n", verbose=self.verbose
             )
-            final_result = result[self.qa_chain.output_key]
 
-            final_result = get_response_from_generator(final_result, qa_re)
+            final_result = await self._aask_qa(question, qa_context, callbacks)
 
         chain_result: Dict[str, Any] = {self.output_key: final_result}
         if self.return_intermediate_steps:
             chain_result[INTERMEDIATE_STEPS_KEY] = intermediate_steps
 
         return chain_result
-    
+
+    async def abatch_questions(
+        self,
+        questions: List[str],
+        max_concurrency: int = 4,
+        callbacks: Callbacks = None,
+    ) -> List[Dict[str, Any]]:
+        """Answer a list of questions, e.g. an evaluation set or a bulk job.
+
+        Identical questions (once normalized) are answered once and identical
+        Cypher statements run once. At most `max_concurrency` LLM calls run
+        at the same time, and lookups differing only by their literals
+        (e.g. one `NeoWord` query per word) are merged into `UNWIND` queries.
+
+        Returns one dict per question, in input order, with the answer, the
+        Cypher statement, the duration of each stage (`timings`) and the
+        `error` of the failed items.
+        """
+        # batch jobs give way to the interactive questions at the LLM scheduler
+        with batch_priority():
+            return await self._abatch_questions(questions, max_concurrency, callbacks)
+
+    async def _abatch_questions(
+        self,
+        questions: List[str],
+        max_concurrency: int,
+        callbacks: Callbacks,
+    ) -> List[Dict[str, Any]]:
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def _limited(coro: Any) -> Any:
+            async with semaphore:
+                return await coro
+
+        graph_version = None
+        if self.answer_cache is not None and self.query_cache is not None:
+            graph_version = await self.query_cache.aversion(self.graph)
+
+        keys = [normalize_question(question) for question in questions]
+        first_index: Dict[str, int] = {}
+        for index, key in enumerate(keys):
+            first_index.setdefault(key, index)
+        items = {key: {self.input_key: questions[index], "timings": {}}
+                 for key, index in first_index.items()}
+
+        async def _prepare(item: Dict[str, Any]) -> None:
+            question, timings = item[self.input_key], item["timings"]
+            cached_result = self._cache_get("answer", question, graph_version)
+            if cached_result is not None:
+                self.metrics.increment(CACHE_HITS, tier="answer")
+                item.update(cached_result, cached=True)
+                return
+            self.metrics.increment(QUESTIONS)
+            started = time.perf_counter()
+            verdict = self._route_question(question)
+            if verdict is None:
+                verdict = await _limited(self._aask_checker(question, callbacks))
+            timings["validation"] = time.perf_counter() - started
+            item["is_can_be_cypher_command"] = verdict.strip() != "False"
+            if item["is_can_be_cypher_command"]:
+                started = time.perf_counter()
+                item["cypher"] = await _limited(self._agenerate_cypher(question, callbacks))
+                timings["cypher"] = time.perf_counter() - started
+
+        async def _answer(item: Dict[str, Any]) -> None:
+            question, timings = item[self.input_key], item["timings"]
+            started = time.perf_counter()
+            if not item["is_can_be_cypher_command"]:
+                final_result = await _limited(self._aask_qa(question, "", callbacks))
+            elif self.return_direct:
+                final_result = item["context"]
+            else:
+                qa_context = self._compact_context(item["context"], [])
+                final_result = await _limited(self._aask_qa(question, qa_context, callbacks))
+            timings["qa"] = time.perf_counter() - started
+            item[self.output_key] = final_result
+            # single question calls may expect the intermediate steps
+            if not self.return_intermediate_steps:
+                self._cache_set("answer", question, {self.output_key: final_result},
+                                graph_version)
+
+        async def _run(stage: Any, item: Dict[str, Any]) -> None:
+            if "error" in item or item.get("cached"):
+                return
+            try:
+                await stage(item)
+            except Exception as e:
+                item["error"] = repr(e)
+
+        await asyncio.gather(*[_run(_prepare, item) for item in items.values()])
+
+        pending = [item for item in items.values()
+                   if item.get("cypher") and "error" not in item and not item.get("cached")]
+        try:
+            contexts = await self._abatch_retrieve_contexts(
+                list(dict.fromkeys(item["cypher"] for item in pending)))
+        except Exception as e:
+            for item in pending:
+                item["error"] = repr(e)
+        else:
+            for item in pending:
+                item["context"], item["timings"]["graph"] = contexts[item["cypher"]]
+                self._record_example(item[self.input_key], item["cypher"], item["context"])
+        for item in items.values():
+            if item.get("is_can_be_cypher_command") and not item.get("cypher"):
+                item["context"] = []
+
+        await asyncio.gather(*[_run(_answer, item) for item in items.values()])
+
+        results = []
+        for index, key in enumerate(keys):
+            item = {k: v for k, v in items[key].items()
+                    if k not in ("context", "is_can_be_cypher_command")}
+            item["timings"] = dict(item["timings"], total=sum(item["timings"].values()))
+            if first_index[key] != index:
+                item[self.input_key] = questions[index]
+                item["duplicate_of"] = first_index[key]
+            results.append(item)
+        return results
+
+    def batch_questions(
+        self,
+        questions: List[str],
+        max_concurrency: int = 4,
+        callbacks: Callbacks = None,
+    ) -> List[Dict[str, Any]]:
+        """Synchronous `abatch_questions`, not callable from a running event loop."""
+        async def _batch() -> List[Dict[str, Any]]:
+            try:
+                return await self.abatch_questions(questions, max_concurrency, callbacks)
+            finally:
+                # the async driver opened on this loop would not outlive it
+                aclose = getattr(self.graph, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+
+        return asyncio.run(_batch())
+
+    async def _abatch_retrieve_contexts(
+        self, cyphers: List[str]
+    ) -> Dict[str, Tuple[List[Dict[str, Any]], float]]:
+        """Rows (at most `top_k`) and lookup duration of each Cypher statement."""
+        results: Dict[str, Tuple[List[Dict[str, Any]], float]] = {}
+        templates: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+        singles = []
+        for cypher in cyphers:
+            limited_cypher = enforce_limit(cypher, self.top_k)
+            if limited_cypher is None:
+                singles.append(cypher)
+                continue
+            template, params = parameterize_cypher(limited_cypher)
+            # merged only if the subquery can return the same columns as the lookup
+            if params and alias_return_items(template) is not None:
+                templates.setdefault(template, []).append((cypher, params))
+            else:
+                singles.append(cypher)
+
+        async def _single(cypher: str) -> None:
+            started = time.perf_counter()
+            rows = await self._aretrieve_context(cypher)
+            results[cypher] = (rows, time.perf_counter() - started)
+
+        async def _merged(template: str, lookups: List[Tuple[str, Dict[str, Any]]]) -> None:
+            if len(lookups) == 1:
+                return await _single(lookups[0][0])
+            started = time.perf_counter()
+            batch = [dict(params, **{BATCH_INDEX: index})
+                     for index, (_, params) in enumerate(lookups)]
+            try:
+                with self.metrics.span("graph_query", merged=len(lookups)):
+                    rows = await aquery_graph(
+                        self.graph, build_unwind_query(template, list(lookups[0][1])),
+                        {"batch": batch},
+                    )
+            except Exception:
+                # e.g. a statement not allowed in a subquery: run them one by one
+                logger.warning("merged lookup of %d statements failed, run one by one",
+                               len(lookups), exc_info=True)
+                self.metrics.increment(BATCH_FALLBACKS)
+                await asyncio.gather(*[_single(cypher) for cypher, _ in lookups])
+                return
+            duration = time.perf_counter() - started
+            rows_per_lookup: List[List[Dict[str, Any]]] = [[] for _ in lookups]
+            for row in rows:
+                row = dict(row)
+                rows_per_lookup[row.pop(BATCH_ROW)[BATCH_INDEX]].append(row)
+            for (cypher, _), lookup_rows in zip(lookups, rows_per_lookup):
+                results[cypher] = (lookup_rows[: self.top_k], duration)
+                self.metrics.observe(GRAPH_ROWS, len(results[cypher][0]))
+
+        await asyncio.gather(*[_single(cypher) for cypher in singles],
+                             *[_merged(t, lookups) for t, lookups in templates.items()])
+        return results
@@ -0,0 +1,234 @@
+import asyncio
+import atexit
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_community.graphs import Neo4jGraph
+from langchain_community.graphs.graph_store import GraphStore
+from langchain_community.graphs.neo4j_graph import value_sanitize
+from langchain_core.utils import get_from_dict_or_env
+
+from .cache import fingerprint
+
+__all__ = ["AsyncNeo4jGraph", "GraphRegistry", "graph_registry"]
+
+
+class AsyncNeo4jGraph(Neo4jGraph):
+    """Neo4jGraph with a native `aquery` backed by the neo4j async driver.
+
+    `query_head`/`aquery_head` read only the first records of a result.
+
+    An async driver is bound to the event loop it was opened on: one is
+    opened lazily per loop, on its first `aquery` (the loop serving the chat
+    sessions, or the short-lived loop of a `batch_questions` call, which
+    closes it with `aclose` before the loop ends). With
+    `refresh_schema=False` the schema introspection done while connecting
+    is skipped (the schema comes from a `SchemaSnapshot`).
+    """
+
+    def __init__(self, url: Optional[str] = None, username: Optional[str] = None,
+                 password: Optional[str] = None, database: Optional[str] = None,
+                 timeout: Optional[float] = None, sanitize: bool = False,
+                 refresh_schema: bool = True):
+        self._skip_schema_refresh = not refresh_schema
+        super().__init__(url, username, password, database, timeout, sanitize)
+        self._skip_schema_refresh = False
+        self._async_driver_args = (
+            get_from_dict_or_env({"url": url}, "url", "NEO4J_URI"),
+            (
+                get_from_dict_or_env({"username": username}, "username", "NEO4J_USERNAME"),
+                get_from_dict_or_env({"password": password}, "password", "NEO4J_PASSWORD"),
+            ),
+        )
+        self._async_drivers: Dict[asyncio.AbstractEventLoop, Any] = {}
+        self._async_lock = threading.Lock()
+
+    def refresh_schema(self) -> None:
+        if not self._skip_schema_refresh:
+            super().refresh_schema()
+
+    def query_head(self, query: str, params: dict = {},
+                   limit: int = 10) -> List[Dict[str, Any]]:
+        """Return the first `limit` records of a query.
+
+        The records are fetched in batches of `limit` and the rest of the
+        result is discarded on the server once enough records were read.
+        """
+        from neo4j import Query
+        from neo4j.exceptions import CypherSyntaxError
+
+        with self._driver.session(database=self._database, fetch_size=limit) as session:
+            try:
+                result = session.run(Query(text=query, timeout=self.timeout), params)
+                json_data = []
+                # stop at the last record wanted: the next one could need another fetch
+                for record in result:
+                    json_data.append(record.data())
+                    if len(json_data) >= limit:
+                        break
+                if self.sanitize:
+                    json_data = [value_sanitize(el) for el in json_data]
+                return json_data
+            except CypherSyntaxError as e:
+                raise ValueError(f"Generated Cypher Statement is not valid\n{e}")
+
+    async def aquery(self, query: str, params: dict = {}) -> List[Dict[str, Any]]:
+        """Query Neo4j database without blocking the event loop."""
+        return await self._arun(query, params)
+
+    async def aquery_head(self, query: str, params: dict = {},
+                          limit: int = 10) -> List[Dict[str, Any]]:
+        """Async version of `query_head`."""
+        return await self._arun(query, params, limit)
+
+    async def _arun(self, query: str, params: dict,
+                    limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        import neo4j
+        from neo4j.exceptions import CypherSyntaxError
+
+        loop = asyncio.get_running_loop()
+        with self._async_lock:
+            # drivers of closed loops cannot be closed anymore: dropped with their loop
+            for closed in [other for other in self._async_drivers if other.is_closed()]:
+                del self._async_drivers[closed]
+            driver = self._async_drivers.get(loop)
+            if driver is None:
+                url, auth = self._async_driver_args
+                driver = self._async_drivers[loop] = neo4j.AsyncGraphDatabase.driver(url, auth=auth)
+        session_config = {"fetch_size": limit} if limit is not None else {}
+        async with driver.session(database=self._database,
+                                              **session_config) as session:
+            try:
+                result = await session.run(neo4j.Query(text=query, timeout=self.timeout),
+                                           params)
+                if limit is None:
+                    json_data = await result.data()
+                else:
+                    json_data = []
+                    async for record in result:
+                        json_data.append(record.data())
+                        if len(json_data) >= limit:
+                            break
+                if self.sanitize:
+                    json_data = [value_sanitize(el) for el in json_data]
+                return json_data
+            except CypherSyntaxError as e:
+                raise ValueError(f"Generated Cypher Statement is not valid\n{e}")
+
+    async def aclose(self) -> None:
+        """Close the async driver of the running event loop."""
+        with self._async_lock:
+            driver = self._async_drivers.pop(asyncio.get_running_loop(), None)
+        if driver is not None:
+            await driver.close()
+
+    def close(self) -> None:
+        self._driver.close()
+        with self._async_lock:
+            drivers, self._async_drivers = self._async_drivers, {}
+        for loop, driver in drivers.items():
+            if loop.is_closed() or loop.is_running():
+                # bound to a closed or running event loop: dropped with it
+                continue
+            try:
+                loop.run_until_complete(driver.close())
+            except Exception:
+                pass
+
+
+class GraphRegistry:
+    """Process-wide, reference counted registry of graph connections.
+
+    Creating a `Neo4jGraph` opens a driver with its own connection pool,
+    checks connectivity and introspects the schema through APOC. The
+    registry does it once per (url, username, database) and lets every chat
+    session borrow the same instance:
+
+        graph = graph_registry.acquire(url=..., username=..., password=...)
+        ...
+        graph_registry.release(graph)
+
+    Released graphs stay open so the next session does not pay for a new
+    connection; `close_idle` and `close_all` close the drivers (the default
+    registry is closed at interpreter exit).
+    """
+
+    def __init__(self, factory: Callable[..., GraphStore] = AsyncNeo4jGraph):
+        """
+        Args:
+            factory: callable building a graph from the `acquire` arguments.
+        """
+        self.factory = factory
+        self._graphs: Dict[str, GraphStore] = {}
+        self._refcounts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(url: Optional[str], username: Optional[str], password: Optional[str],
+                 database: Optional[str] = None, **kwargs: Any) -> str:
+        return fingerprint(url, username, password, database,
+                           sorted(kwargs.items()))
+
+    def acquire(self, url: Optional[str] = None, username: Optional[str] = None,
+                password: Optional[str] = None, database: Optional[str] = None,
+                **kwargs: Any) -> GraphStore:
+        """Borrow the shared graph for these credentials, creating it if needed."""
+        key = self.make_key(url, username, password, database, **kwargs)
+        with self._lock:
+            graph = self._graphs.get(key)
+            if graph is None:
+                graph = self.factory(url=url, username=username,
+                                     password=password, database=database,
+                                     **kwargs)
+                self._graphs[key] = graph
+                self._refcounts[key] = 0
+            self._refcounts[key] += 1
+            return graph
+
+    def release(self, graph: Optional[GraphStore]) -> None:
+        """Give back a graph borrowed with `acquire`."""
+        if graph is None:
+            return
+        with self._lock:
+            key = self._find_key(graph)
+            if key is not None and self._refcounts[key] > 0:
+                self._refcounts[key] -= 1
+
+    def refcount(self, graph: GraphStore) -> int:
+        with self._lock:
+            key = self._find_key(graph)
+            return self._refcounts.get(key, 0) if key is not None else 0
+
+    def close_idle(self) -> None:
+        """Close the graphs no session is borrowing anymore."""
+        with self._lock:
+            idle = [key for key, count in self._refcounts.items() if count == 0]
+            for key in idle:
+                self._close(key)
+
+    def close_all(self) -> None:
+        """Close every graph, borrowed or not (used on shutdown)."""
+        with self._lock:
+            for key in list(self._graphs):
+                self._close(key)
+
+    def __len__(self) -> int:
+        return len(self._graphs)
+
+    def _find_key(self, graph: GraphStore) -> Optional[str]:
+        for key, candidate in self._graphs.items():
+            if candidate is graph:
+                return key
+        return None
+
+    def _close(self, key: str) -> None:
+        graph = self._graphs.pop(key)
+        self._refcounts.pop(key, None)
+        if hasattr(graph, "close"):
+            graph.close()
+        elif getattr(graph, "_driver", None) is not None:
+            graph._driver.close()
+
+
+graph_registry = GraphRegistry()
+atexit.register(graph_registry.close_all)
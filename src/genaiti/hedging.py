@@ -0,0 +1,431 @@
+import asyncio
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+from langchain_core.pydantic_v1 import Field, root_validator
+from langchain_core.runnables import Runnable
+
+__all__ = ["LatencyTracker", "latency_tracker", "HedgedLLM"]
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(thread_name_prefix="genaiti-hedge")
+        return _executor
+
+
+class LatencyTracker:
+    """Sliding windows of the latency and the outcome of each endpoint.
+
+    Latencies are those of the successful requests (and a lower bound for
+    the cancelled ones); error rates only count the outcomes of the last
+    `error_ttl` seconds, so a failing endpoint is tried again later.
+    """
+
+    def __init__(self, window: int = 200, error_ttl: float = 300.0):
+        """
+        Args:
+            window: number of requests kept per endpoint.
+            error_ttl: seconds an outcome counts in the error rate.
+        """
+        self.window = window
+        self.error_ttl = error_ttl
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._outcomes: Dict[str, Deque[Tuple[float, bool]]] = {}
+        self._lock = threading.Lock()
+        self.hedged = 0
+        self.alternate_wins = 0
+        self.failovers = 0
+
+    def record(self, endpoint: str, seconds: float, ok: Optional[bool]) -> None:
+        """Record a request; `ok=None` for a request cancelled before its end."""
+        with self._lock:
+            if ok is not False:
+                self._latencies.setdefault(endpoint, deque(maxlen=self.window)).append(seconds)
+            if ok is not None:
+                self._outcomes.setdefault(endpoint, deque(maxlen=self.window)).append(
+                    (time.monotonic(), ok))
+
+    def count(self, event: str) -> None:
+        with self._lock:
+            setattr(self, event, getattr(self, event) + 1)
+
+    def samples(self, endpoint: str) -> int:
+        return len(self._latencies.get(endpoint, ()))
+
+    def percentile(self, endpoint: str, percentile: float) -> Optional[float]:
+        with self._lock:
+            latencies = sorted(self._latencies.get(endpoint, ()))
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, max(0, round(percentile / 100 * (len(latencies) - 1))))
+        return latencies[index]
+
+    def error_rate(self, endpoint: str) -> float:
+        since = time.monotonic() - self.error_ttl
+        with self._lock:
+            outcomes = [ok for at, ok in self._outcomes.get(endpoint, ()) if at >= since]
+        return outcomes.count(False) / len(outcomes) if outcomes else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        endpoints = {
+            endpoint: {
+                "samples": self.samples(endpoint),
+                "p50": self.percentile(endpoint, 50),
+                "p95": self.percentile(endpoint, 95),
+                "p99": self.percentile(endpoint, 99),
+                "error_rate": self.error_rate(endpoint),
+            }
+            for endpoint in set(self._latencies) | set(self._outcomes)
+        }
+        return {"endpoints": endpoints, "hedged": self.hedged,
+                "alternate_wins": self.alternate_wins, "failovers": self.failovers}
+
+
+latency_tracker = LatencyTracker()
+
+
+def _text(output: Any) -> str:
+    """Text of an LLM (str) or chat model (message) output."""
+    return output if isinstance(output, str) else getattr(output, "content", str(output))
+
+
+def _is_non_empty(text: str) -> bool:
+    return bool(text and text.strip())
+
+
+def _endpoint_name(llm: Any, index: int) -> str:
+    for attribute in ("repo_id", "endpoint_url", "model", "model_name", "model_path"):
+        name = getattr(llm, attribute, None)
+        if isinstance(name, str) and name:
+            return name
+    return f"{getattr(llm, '_llm_type', type(llm).__name__)}-{index}"
+
+
+class HedgedLLM(LLM):
+    """LLM sending the prompt to a primary model, hedged by alternate models.
+
+    The primary (the first of `llms` with an acceptable error rate) gets the
+    request. If it has not answered after the hedge delay, the same request
+    is sent to the fastest alternate and the first good response wins; a
+    model failing or returning an empty text is replaced at once by the next
+    one. The hedge delay is `hedge_delay`, lowered to the primary's p95
+    latency once `min_samples` requests are known, so only the slow tail of
+    the requests is duplicated.
+
+    With `streaming`, the race is on the first token: the winner's tokens
+    are then streamed through the callbacks. The async path cancels the
+    losing requests; the sync one lets them finish in the background (their
+    latency is still recorded).
+    """
+
+    llms: List[Runnable]
+    """Candidate models, in order of preference (the first one is the primary)"""
+    names: List[str] = []
+    """Endpoint names used for the latency statistics (default: the repo ids)"""
+    hedge_delay: float = 2.0
+    """Maximal number of seconds to wait for a model before hedging"""
+    adaptive_delay: bool = True
+    """Whether to hedge at the primary's p95 latency once it is known"""
+    min_hedge_delay: float = 0.2
+    min_samples: int = 20
+    max_hedges: int = 1
+    """Maximal number of duplicate requests (failovers excluded)"""
+    max_error_rate: float = 0.5
+    """Models failing more often are only tried after the others"""
+    streaming: bool = False
+    tracker: LatencyTracker = Field(default_factory=lambda: latency_tracker, exclude=True)
+    is_good: Callable[[str], bool] = Field(default=_is_non_empty, exclude=True)
+
+    @root_validator(skip_on_failure=True)
+    def _set_names(cls, values: Dict[str, Any]) -> Dict[str, Any]:
+        llms = values["llms"]
+        if not llms:
+            raise ValueError("HedgedLLM needs at least one LLM")
+        if not values.get("names"):
+            values["names"] = [_endpoint_name(llm, i) for i, llm in enumerate(llms)]
+        if len(values["names"]) != len(llms):
+            raise ValueError("`names` must give one name per LLM")
+        return values
+
+    @property
+    def _llm_type(self) -> str:
+        return "hedged"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        # the generation parameters of the models are part of the cache fingerprints
+        models = [{**dict(getattr(llm, "_identifying_params", {})),
+                   **(getattr(llm, "_default_params", None) or {})} for llm in self.llms]
+        return {"names": self.names, "models": models, "hedge_delay": self.hedge_delay,
+                "max_hedges": self.max_hedges, "streaming": self.streaming}
+
+    def _order(self) -> List[int]:
+        """Indexes of the models to try: primary first, then by median latency."""
+        indexes = range(len(self.llms))
+        healthy = [i for i in indexes
+                   if self.tracker.error_rate(self.names[i]) <= self.max_error_rate]
+        if not healthy:
+            return list(indexes)
+
+        def _speed(i: int) -> Tuple[bool, float]:
+            p50 = self.tracker.percentile(self.names[i], 50)
+            return (p50 is None, p50 or 0.0)
+
+        unhealthy = [i for i in indexes if i not in healthy]
+        return [healthy[0]] + sorted(healthy[1:], key=_speed) + unhealthy
+
+    def _delay(self, primary: int) -> float:
+        name = self.names[primary]
+        if self.adaptive_delay and self.tracker.samples(name) >= self.min_samples:
+            p95 = self.tracker.percentile(name, 95)
+            return min(self.hedge_delay, max(self.min_hedge_delay, p95))
+        return self.hedge_delay
+
+    def _check(self, index: int, text: str) -> str:
+        if not self.is_good(text):
+            raise ValueError(f"Empty or invalid response from {self.names[index]}")
+        return text
+
+    # sync path
+
+    def _attempt(self, index: int, start: Callable[[int], Any]) -> Any:
+        started = time.perf_counter()
+        try:
+            result = start(index)
+        except Exception:
+            self.tracker.record(self.names[index], time.perf_counter() - started, ok=False)
+            raise
+        self.tracker.record(self.names[index], time.perf_counter() - started, ok=True)
+        return result
+
+    def _race(self, start: Callable[[int], Any],
+              discard: Callable[[Any], None] = lambda result: None) -> Any:
+        order = self._order()
+        delay = self._delay(order[0])
+        executor = _get_executor()
+        pending: Dict[Future, int] = {}
+        errors: List[BaseException] = []
+        launched = hedges = 0
+
+        def _launch() -> None:
+            nonlocal launched
+            pending[executor.submit(self._attempt, order[launched], start)] = order[launched]
+            launched += 1
+
+        def _discard(future: Future) -> None:
+            if not future.cancelled() and future.exception() is None:
+                discard(future.result())
+
+        _launch()
+        try:
+            while pending:
+                can_hedge = hedges < self.max_hedges and launched < len(order)
+                done, _ = wait(list(pending), timeout=delay if can_hedge else None,
+                               return_when=FIRST_COMPLETED)
+                if not done:
+                    hedges += 1
+                    self.tracker.count("hedged")
+                    _launch()
+                    continue
+                for future in done:
+                    index = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        errors.append(e)
+                        continue
+                    if index != order[0]:
+                        self.tracker.count("alternate_wins")
+                    return result
+                # the finished requests failed: fail over without waiting
+                if launched < len(order):
+                    self.tracker.count("failovers")
+                    _launch()
+            raise errors[-1]
+        finally:
+            for future in pending:
+                if not future.cancel():
+                    future.add_done_callback(_discard)
+
+    def _invoke(self, index: int, prompt: str, stop: Optional[List[str]],
+                **kwargs: Any) -> str:
+        return self._check(index, _text(self.llms[index].invoke(prompt, stop=stop, **kwargs)))
+
+    def _start_stream(self, index: int, prompt: str, stop: Optional[List[str]],
+                      **kwargs: Any) -> Tuple[str, Iterator[Any]]:
+        """First non empty chunk of a model stream, with the rest of the stream."""
+        iterator = iter(self.llms[index].stream(prompt, stop=stop, **kwargs))
+        for chunk in iterator:
+            if _text(chunk):
+                return _text(chunk), iterator
+        return self._check(index, ""), iterator
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        if self.streaming:
+            return "".join(chunk.text for chunk in
+                           self._stream(prompt, stop, run_manager, **kwargs))
+        return self._race(lambda index: self._invoke(index, prompt, stop, **kwargs))
+
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        first, iterator = self._race(
+            lambda index: self._start_stream(index, prompt, stop, **kwargs),
+            lambda result: getattr(result[1], "close", lambda: None)(),
+        )
+        for text in itertools.chain([first], map(_text, iterator)):
+            chunk = GenerationChunk(text=text)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    # async path
+
+    async def _aattempt(self, index: int, start: Callable[[int], Awaitable[Any]]) -> Any:
+        started = time.perf_counter()
+        try:
+            result = await start(index)
+        except asyncio.CancelledError:
+            self.tracker.record(self.names[index], time.perf_counter() - started, ok=None)
+            raise
+        except Exception:
+            self.tracker.record(self.names[index], time.perf_counter() - started, ok=False)
+            raise
+        self.tracker.record(self.names[index], time.perf_counter() - started, ok=True)
+        return result
+
+    async def _arace(self, start: Callable[[int], Awaitable[Any]],
+                     discard: Callable[[Any], None] = lambda result: None) -> Any:
+        order = self._order()
+        delay = self._delay(order[0])
+        pending: Dict["asyncio.Task", int] = {}
+        errors: List[BaseException] = []
+        launched = hedges = 0
+
+        def _launch() -> None:
+            nonlocal launched
+            task = asyncio.ensure_future(self._aattempt(order[launched], start))
+            pending[task] = order[launched]
+            launched += 1
+
+        def _discard(task: "asyncio.Task") -> None:
+            if not task.cancelled() and task.exception() is None:
+                discard(task.result())
+
+        _launch()
+        try:
+            while pending:
+                can_hedge = hedges < self.max_hedges and launched < len(order)
+                done, _ = await asyncio.wait(list(pending),
+                                             timeout=delay if can_hedge else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedges += 1
+                    self.tracker.count("hedged")
+                    _launch()
+                    continue
+                for task in done:
+                    index = pending.pop(task)
+                    if task.exception() is not None:
+                        errors.append(task.exception())
+                        continue
+                    if index != order[0]:
+                        self.tracker.count("alternate_wins")
+                    return task.result()
+                if launched < len(order):
+                    self.tracker.count("failovers")
+                    _launch()
+            raise errors[-1]
+        finally:
+            for task in pending:
+                task.cancel()
+                task.add_done_callback(_discard)
+
+    async def _ainvoke(self, index: int, prompt: str, stop: Optional[List[str]],
+                       **kwargs: Any) -> str:
+        output = await self.llms[index].ainvoke(prompt, stop=stop, **kwargs)
+        return self._check(index, _text(output))
+
+    async def _astart_stream(self, index: int, prompt: str, stop: Optional[List[str]],
+                             **kwargs: Any) -> Tuple[str, AsyncIterator[Any]]:
+        iterator = self.llms[index].astream(prompt, stop=stop, **kwargs).__aiter__()
+        async for chunk in iterator:
+            if _text(chunk):
+                return _text(chunk), iterator
+        return self._check(index, ""), iterator
+
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        if self.streaming:
+            completion = ""
+            async for chunk in self._astream(prompt, stop, run_manager, **kwargs):
+                completion += chunk.text
+            return completion
+        return await self._arace(lambda index: self._ainvoke(index, prompt, stop, **kwargs))
+
+    async def _astream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[GenerationChunk]:
+        def _close(result: Tuple[str, AsyncIterator[Any]]) -> None:
+            aclose = getattr(result[1], "aclose", None)
+            if aclose is not None:
+                asyncio.ensure_future(aclose())
+
+        first, iterator = await self._arace(
+            lambda index: self._astart_stream(index, prompt, stop, **kwargs), _close)
+        text = first
+        while True:
+            chunk = GenerationChunk(text=text)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+            try:
+                text = _text(await iterator.__anext__())
+            except StopAsyncIteration:
+                break
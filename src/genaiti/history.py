@@ -0,0 +1,322 @@
+import inspect
+import logging
+import threading
+from collections import deque
+from typing import (Any, Awaitable, Callable, Deque, Dict, Iterable, List, NamedTuple, Optional,
+                    Sequence, Tuple, Union)
+
+from .context import _truncate, estimate_tokens
+
+__all__ = ["ConversationHistory", "Turn", "llm_summarizer", "thread_messages", "steps_page_loader",
+           "HUMAN", "AI"]
+
+logger = logging.getLogger(__name__)
+
+# message types, as in the langchain messages and the chainlit steps
+HUMAN = "human"
+AI = "ai"
+
+# (current summary, text of the evicted turns) -> new summary
+Summarizer = Callable[[str, str], Union[str, Awaitable[str]]]
+# (cursor, count) -> (up to count messages before the cursor, cursor of the oldest one or None)
+Page = Tuple[List[Dict[str, Any]], Any]
+PageLoader = Callable[[Any, int], Union[Page, Awaitable[Page]]]
+
+
+class Turn(NamedTuple):
+    type: str
+    content: str
+    line: str
+    tokens: int
+
+
+class ConversationHistory:
+    """Conversation history kept as a token bounded, pre-rendered buffer.
+
+    Each turn is formatted once when it is added (`"{type}: {content}\\n"`, as
+    `parse_conversation_history` does) and appended to the rendered buffer;
+    the oldest turns are evicted as soon as the window exceeds `max_tokens`,
+    so adding a turn and reading the history no longer depend on the length
+    of the chat. Evicted turns are folded into a running summary by
+    `summarize` / `asummarize` when a `summarizer` is given (meant to run off
+    the critical path, after the answer is sent), and dropped otherwise.
+
+    A resumed chat only loads its last turns (`resume`); older ones are paged
+    in by `aload_older` while the window has room, through a `PageLoader`.
+    """
+
+    def __init__(self, max_tokens: int = 512, max_turn_tokens: int = 256,
+                 summarizer: Optional[Summarizer] = None, summary_max_tokens: int = 128,
+                 token_counter: Callable[[str], int] = estimate_tokens):
+        """
+        Args:
+            max_tokens: token budget of the turns kept verbatim.
+            max_turn_tokens: a longer turn is truncated (e.g. a long answer).
+            summarizer: callable, sync or async, summarizing the evicted turns.
+            summary_max_tokens: the summary is truncated past this budget.
+            token_counter: text -> number of tokens.
+        """
+        self.max_tokens = max_tokens
+        self.max_turn_tokens = max_turn_tokens
+        self.summarizer = summarizer
+        self.summary_max_tokens = summary_max_tokens
+        self.token_counter = token_counter
+        self.summary = ""
+        self.total_turns = 0
+        self.evicted_turns = 0
+        self._turns: Deque[Turn] = deque()
+        self._tokens = 0
+        self._buffer = ""
+        self._rendered: Optional[str] = ""
+        self._pending: List[str] = []
+        self._loader: Optional[PageLoader] = None
+        self._cursor: Any = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._turns)
+
+    @property
+    def tokens(self) -> int:
+        """Tokens of the turns kept verbatim."""
+        return self._tokens
+
+    @property
+    def needs_summary(self) -> bool:
+        """Whether evicted turns wait to be folded into the summary."""
+        return bool(self._pending)
+
+    def _line(self, type: str, content: str) -> str:
+        content = " ".join(content.split())
+        # the counter is not invertible: truncate on the 4 characters per token estimate
+        if self.token_counter(content) > self.max_turn_tokens:
+            content = _truncate(content, self.max_turn_tokens * 4)
+        return f"{type}: {content}\n"
+
+    def add(self, type: str, content: str) -> None:
+        """Append a turn, evicting the oldest ones past the token budget."""
+        line = self._line(type, content)
+        turn = Turn(type, content, line, self.token_counter(line))
+        with self._lock:
+            self._turns.append(turn)
+            self._tokens += turn.tokens
+            self._buffer += line
+            self.total_turns += 1
+            # the last turn is always kept, whatever its size
+            while self._tokens > self.max_tokens and len(self._turns) > 1:
+                evicted = self._turns.popleft()
+                self._tokens -= evicted.tokens
+                self._buffer = self._buffer[len(evicted.line):]
+                self.evicted_turns += 1
+                if self.summarizer is not None:
+                    self._pending.append(evicted.line)
+            self._rendered = None
+
+    def add_user_message(self, content: str) -> None:
+        self.add(HUMAN, content)
+
+    def add_ai_message(self, content: str) -> None:
+        self.add(AI, content)
+
+    def load(self, messages: Iterable[Dict[str, Any]]) -> "ConversationHistory":
+        """Append messages given as dictionaries with `type` and `content` keys."""
+        for message in messages:
+            self.add(message.get("type"), message.get("content") or "")
+        return self
+
+    def resume(self, messages: Iterable[Dict[str, Any]], cursor: Any = None,
+               loader: Optional[PageLoader] = None) -> "ConversationHistory":
+        """Load the last messages of a resumed chat.
+
+        Args:
+            messages: last messages of the chat, oldest first.
+            cursor: position of the oldest one, None when there are no older messages.
+            loader: (cursor, count) -> older messages and their cursor, sync or async.
+        """
+        self.load(messages)
+        self._cursor = cursor
+        self._loader = loader if cursor is not None else None
+        return self
+
+    @property
+    def has_older(self) -> bool:
+        """Whether older messages of a resumed chat may still be paged in."""
+        return self._loader is not None
+
+    def prepend(self, messages: Sequence[Dict[str, Any]]) -> int:
+        """Insert older messages before the kept turns while they fit in the window.
+
+        Returns:
+            Number of messages inserted, from the newest one.
+        """
+        added = 0
+        with self._lock:
+            for message in reversed(messages):
+                line = self._line(message.get("type"), message.get("content") or "")
+                turn = Turn(message.get("type"), message.get("content") or "", line,
+                            self.token_counter(line))
+                if self._tokens + turn.tokens > self.max_tokens:
+                    break
+                self._turns.appendleft(turn)
+                self._tokens += turn.tokens
+                self._buffer = line + self._buffer
+                self.total_turns += 1
+                added += 1
+            if added:
+                self._rendered = None
+        return added
+
+    async def aload_older(self, count: int = 20) -> int:
+        """Page older messages in, `count` at a time, until the window is full.
+
+        Returns:
+            Number of messages inserted.
+        """
+        added = 0
+        while self._loader is not None and self._tokens < self.max_tokens:
+            try:
+                page = self._loader(self._cursor, count)
+                if inspect.isawaitable(page):
+                    page = await page
+            except Exception:
+                logger.warning("older messages could not be loaded", exc_info=True)
+                self._loader = None
+                break
+            messages, self._cursor = page
+            inserted = self.prepend(messages)
+            added += inserted
+            # window full or first message reached
+            if inserted < len(messages) or self._cursor is None or not messages:
+                self._loader = None
+        return added
+
+    def clear(self) -> None:
+        with self._lock:
+            self._loader = None
+            self._turns.clear()
+            self._tokens = 0
+            self._buffer = ""
+            self._pending = []
+            self.summary = ""
+            self._rendered = ""
+
+    def render(self) -> str:
+        """History text: the summary of the evicted turns, then the kept turns."""
+        rendered = self._rendered
+        if rendered is None:
+            with self._lock:
+                summary = f"summary: {self.summary}\n" if self.summary else ""
+                rendered = self._rendered = summary + self._buffer
+        return rendered
+
+    def prompt_history(self) -> str:
+        """History ready to be inserted in a prompt, empty for a new chat."""
+        rendered = self.render()
+        return f"\n{rendered}\n\n" if rendered else ""
+
+    def messages(self) -> List[Dict[str, str]]:
+        """Kept turns as dictionaries with `type` and `content` keys."""
+        with self._lock:
+            return [{"type": turn.type, "content": turn.content} for turn in self._turns]
+
+    def _take_pending(self) -> Optional[str]:
+        with self._lock:
+            if not self._pending:
+                return None
+            text, self._pending = "".join(self._pending), []
+            return text
+
+    def _set_summary(self, summary: str) -> None:
+        summary = " ".join(str(summary).split())
+        if self.token_counter(summary) > self.summary_max_tokens:
+            summary = _truncate(summary, self.summary_max_tokens * 4)
+        with self._lock:
+            self.summary = summary
+            self._rendered = None
+
+    def summarize(self) -> None:
+        """Fold the evicted turns into the summary (sync summarizer)."""
+        text = self._take_pending()
+        if text is None:
+            return
+        try:
+            summary = self.summarizer(self.summary, text)
+            if inspect.isawaitable(summary):
+                raise TypeError("use asummarize with an async summarizer")
+        except Exception:
+            logger.warning("conversation summary failed, evicted turns dropped", exc_info=True)
+            return
+        self._set_summary(summary)
+
+    async def asummarize(self) -> None:
+        """Fold the evicted turns into the summary (sync or async summarizer)."""
+        text = self._take_pending()
+        if text is None:
+            return
+        try:
+            summary = self.summarizer(self.summary, text)
+            if inspect.isawaitable(summary):
+                summary = await summary
+        except Exception:
+            logger.warning("conversation summary failed, evicted turns dropped", exc_info=True)
+            return
+        self._set_summary(summary)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "turns": len(self._turns),
+            "tokens": self._tokens,
+            "total_turns": self.total_turns,
+            "evicted_turns": self.evicted_turns,
+            "summary_tokens": self.token_counter(self.summary),
+            "pending": len(self._pending),
+            "has_older": self.has_older,
+        }
+
+
+def thread_messages(steps: Sequence[Dict[str, Any]], before: Optional[int] = None,
+                    count: int = 20) -> Page:
+    """Last root messages of a chainlit thread, walking its steps backwards.
+
+    Args:
+        steps: steps of the thread, oldest first.
+        before: index of the step the messages precede (all the steps if None).
+        count: maximal number of messages.
+
+    Returns:
+        The messages, oldest first, as dictionaries with `type` and `content`
+        keys, and the index of the oldest one (None if no step precedes it).
+    """
+    messages: List[Dict[str, Any]] = []
+    index = len(steps) if before is None else before
+    while index > 0 and len(messages) < count:
+        index -= 1
+        step = steps[index]
+        if step.get("parentId") is not None:
+            continue
+        content = step.get("content", step.get("output")) or ""
+        human = step.get("type") in (HUMAN, "user_message")
+        messages.append({"type": HUMAN if human else AI, "content": content})
+    messages.reverse()
+    # the earlier steps are not scanned: the next page may be empty
+    return messages, (index or None)
+
+
+def steps_page_loader(steps: Sequence[Dict[str, Any]]) -> PageLoader:
+    """`PageLoader` paging the messages of steps already read (e.g. a resumed thread)."""
+    def load(before: Optional[int], count: int) -> Page:
+        return thread_messages(steps, before, count)
+    return load
+
+
+def llm_summarizer(llm: Any, prompt: Any = None) -> Callable[[str, str], Awaitable[str]]:
+    """Async summarizer of evicted turns calling `llm` with the summary prompt."""
+    if prompt is None:
+        from .prompt_registry import prompt_registry
+        prompt = prompt_registry.get("history_summary")
+
+    async def summarize(summary: str, lines: str) -> str:
+        result = await llm.ainvoke(prompt.format(summary=summary or "-", lines=lines))
+        return getattr(result, "content", result)
+
+    return summarize
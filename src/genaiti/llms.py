@@ -0,0 +1,155 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from langchain_core.language_models import BaseLanguageModel
+
+from .cache import fingerprint
+
+__all__ = ["LLMRegistry", "llm_registry", "configure_http_pool", "LLM_KEY_PARAMS"]
+
+# generation parameters identifying a shared LLM client
+LLM_KEY_PARAMS = ("repo_id", "task", "max_new_tokens", "top_k", "temperature",
+                  "repetition_penalty")
+
+
+def _default_factory(**kwargs: Any) -> BaseLanguageModel:
+    from .local_llm import is_local_model, local_llm_from_params
+
+    # "local:<path>" models run on CPU in the local pool
+    if is_local_model(kwargs.get("repo_id")):
+        return local_llm_from_params(**kwargs)
+
+    from langchain_community.llms import HuggingFaceEndpoint
+
+    return HuggingFaceEndpoint(**kwargs)
+
+
+def configure_http_pool(pool_connections: int = 10, pool_maxsize: int = 32) -> None:
+    """Enlarge the keep-alive connection pool of the huggingface_hub sessions.
+
+    `InferenceClient` posts through `huggingface_hub.get_session()`, one
+    `requests.Session` per thread shared by every client, so connections to
+    the inference API are reused between LLM clients and questions.
+    """
+    import requests
+    from huggingface_hub import configure_http_backend
+
+    def backend_factory() -> requests.Session:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_connections,
+                                                pool_maxsize=pool_maxsize)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    configure_http_backend(backend_factory=backend_factory)
+
+
+class LLMRegistry:
+    """Process-wide, reference counted registry of LLM clients.
+
+    Building a `HuggingFaceEndpoint` logs in to the Hub and creates its
+    sync and async inference clients. Most sessions use the same model and
+    generation parameters, so the registry builds one client per
+    `LLM_KEY_PARAMS` combination (plus any extra keyword argument such as
+    `streaming`) and lets every session borrow it:
+
+        llm = llm_registry.acquire(repo_id=..., task=..., temperature=...)
+        ...
+        llm_registry.release(llm)
+
+    Clients no session has borrowed for `idle_ttl` seconds are evicted on the
+    next `acquire` (or with `evict_idle`).
+    """
+
+    def __init__(self, factory: Callable[..., BaseLanguageModel] = _default_factory,
+                 idle_ttl: Optional[float] = 1800.0):
+        """
+        Args:
+            factory: callable building an LLM from the `acquire` arguments.
+            idle_ttl: seconds an unused client is kept; None to keep it forever.
+        """
+        self.factory = factory
+        self.idle_ttl = idle_ttl
+        self._llms: Dict[str, BaseLanguageModel] = {}
+        self._refcounts: Dict[str, int] = {}
+        self._released_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    @staticmethod
+    def make_key(**kwargs: Any) -> str:
+        params = [kwargs.pop(name, None) for name in LLM_KEY_PARAMS]
+        return fingerprint(*params, sorted(kwargs.items()))
+
+    def acquire(self, **kwargs: Any) -> BaseLanguageModel:
+        """Borrow the shared client for these parameters, creating it if needed."""
+        key = self.make_key(**kwargs)
+        with self._lock:
+            self._evict_idle(time.monotonic())
+            llm = self._llms.get(key)
+            if llm is None:
+                llm = self.factory(**kwargs)
+                self._llms[key] = llm
+                self._refcounts[key] = 0
+                self.created += 1
+            else:
+                self.reused += 1
+            self._refcounts[key] += 1
+            self._released_at.pop(key, None)
+            return llm
+
+    def release(self, llm: Optional[BaseLanguageModel]) -> None:
+        """Give back a client borrowed with `acquire`."""
+        if llm is None:
+            return
+        with self._lock:
+            key = self._find_key(llm)
+            if key is not None and self._refcounts[key] > 0:
+                self._refcounts[key] -= 1
+                if self._refcounts[key] == 0:
+                    self._released_at[key] = time.monotonic()
+
+    def refcount(self, llm: BaseLanguageModel) -> int:
+        with self._lock:
+            key = self._find_key(llm)
+            return self._refcounts.get(key, 0) if key is not None else 0
+
+    def evict_idle(self) -> None:
+        """Drop the clients unused for more than `idle_ttl` seconds."""
+        with self._lock:
+            self._evict_idle(time.monotonic())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._llms.clear()
+            self._refcounts.clear()
+            self._released_at.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"clients": len(self._llms), "created": self.created,
+                "reused": self.reused}
+
+    def __len__(self) -> int:
+        return len(self._llms)
+
+    def _find_key(self, llm: BaseLanguageModel) -> Optional[str]:
+        for key, candidate in self._llms.items():
+            if candidate is llm:
+                return key
+        return None
+
+    def _evict_idle(self, now: float) -> None:
+        if self.idle_ttl is None:
+            return
+        expired = [key for key, released_at in self._released_at.items()
+                   if now - released_at > self.idle_ttl]
+        for key in expired:
+            self._llms.pop(key, None)
+            self._refcounts.pop(key, None)
+            self._released_at.pop(key, None)
+
+
+llm_registry = LLMRegistry()
@@ -0,0 +1,415 @@
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+from langchain_core.pydantic_v1 import Field
+
+__all__ = ["LocalModelPool", "local_model_pool", "LocalLLM", "LOCAL_PREFIX",
+           "is_local_model", "local_llm_from_params", "configure_local_models"]
+
+logger = logging.getLogger(__name__)
+
+# model names of the settings served by the local pool: "local:/models/model.gguf"
+LOCAL_PREFIX = "local:"
+
+_DONE = object()
+
+
+def is_local_model(name: Optional[str]) -> bool:
+    return bool(name) and name.startswith(LOCAL_PREFIX)
+
+
+def _load_llama(model_path: str, prompt_cache_bytes: int = 0, **kwargs: Any) -> Any:
+    try:
+        from llama_cpp import Llama, LlamaRAMCache
+    except ImportError as e:
+        raise ImportError(
+            "Could not import llama_cpp python package. "
+            "Please install it with `pip install llama-cpp-python`."
+        ) from e
+    model = Llama(model_path=model_path, verbose=False, **kwargs)
+    if prompt_cache_bytes:
+        model.set_cache(LlamaRAMCache(capacity_bytes=prompt_cache_bytes))
+    return model
+
+
+class _Completion(Future):
+    """Future of a queued prompt; cancelling it also stops a running generation."""
+
+    abandoned = False
+
+    def cancel(self) -> bool:
+        self.abandoned = True
+        return super().cancel()
+
+
+class _Request:
+    __slots__ = ("key", "prompt", "params", "futures", "sinks")
+
+    def __init__(self, prompt: str, params: Dict[str, Any],
+                 sink: Optional[Callable[[str], None]]):
+        self.key = (prompt, tuple(sorted((k, tuple(v) if isinstance(v, list) else v)
+                                         for k, v in params.items())))
+        self.prompt = prompt
+        self.params = params
+        self.futures: List[_Completion] = [_Completion()]
+        self.sinks = [sink] if sink is not None else []
+
+    def merge(self, other: "_Request") -> None:
+        self.futures.extend(other.futures)
+        self.sinks.extend(other.sinks)
+
+    def cancelled(self) -> bool:
+        return all(future.abandoned for future in self.futures)
+
+
+class _Model:
+    """Instances of one GGUF model and the queue their workers drain."""
+
+    def __init__(self, pool: "LocalModelPool", model_path: str):
+        self.model_path = model_path
+        self.queue: Deque[_Request] = deque()
+        self.ready = threading.Condition()
+        self.instances: List[Any] = []
+        self.generations = 0
+        self.coalesced = 0
+        self.busy = 0
+        for i in range(pool.instances):
+            started = time.perf_counter()
+            instance = pool.loader(model_path, prompt_cache_bytes=pool.prompt_cache_bytes,
+                                   **pool.model_kwargs)
+            logger.info("loaded %s (%d/%d) in %.1fs", model_path, i + 1, pool.instances,
+                        time.perf_counter() - started)
+            self.instances.append(instance)
+            threading.Thread(target=self._work, args=(instance,), daemon=True,
+                             name=f"genaiti-local-{os.path.basename(model_path)}-{i}").start()
+
+    def submit(self, request: _Request) -> None:
+        with self.ready:
+            self.queue.append(request)
+            self.ready.notify()
+
+    def _next(self) -> _Request:
+        with self.ready:
+            while not self.queue:
+                self.ready.wait()
+            request = self.queue.popleft()
+            # identical prompts queued meanwhile share the generation
+            for other in [other for other in self.queue if other.key == request.key]:
+                self.queue.remove(other)
+                request.merge(other)
+                self.coalesced += 1
+            self.busy += 1
+            return request
+
+    def _work(self, instance: Any) -> None:
+        while True:
+            request = self._next()
+            try:
+                self._generate(instance, request)
+            except Exception:
+                # the worker must survive a request: it is the only one of its instance
+                logger.exception("local generation with %s failed", self.model_path)
+            finally:
+                with self.ready:
+                    self.busy -= 1
+
+    def _emit(self, request: _Request, text: Any) -> None:
+        """Give a text piece to the sinks, dropping those which fail."""
+        for sink in list(request.sinks):
+            try:
+                sink(text)
+            except Exception:
+                # e.g. the event loop of a streaming caller closed meanwhile
+                logger.warning("local generation sink failed, dropped", exc_info=True)
+                request.sinks.remove(sink)
+
+    def _generate(self, instance: Any, request: _Request) -> None:
+        request.futures = [future for future in request.futures
+                           if future.set_running_or_notify_cancel()]
+        if not request.futures:
+            return
+        self.generations += 1
+        parts: List[str] = []
+        try:
+            for part in instance(prompt=request.prompt, stream=True, **request.params):
+                text = part["choices"][0]["text"]
+                parts.append(text)
+                self._emit(request, text)
+                if request.cancelled():
+                    break
+        except Exception as e:
+            for future in request.futures:
+                future.set_exception(e)
+        else:
+            for future in request.futures:
+                future.set_result("".join(parts))
+        self._emit(request, _DONE)
+
+
+class LocalModelPool:
+    """Warm pool of quantized GGUF models run on CPU with llama.cpp.
+
+    Each model is loaded once per process (`instances` copies, one worker
+    thread each, kept for the life of the process) on first use or ahead with `warm`.
+    Loading happens outside the pool lock and, from the async path
+    (`asubmit`), in a thread: the event loop never waits for a GGUF load. A
+    failed load is remembered, later prompts for the model fail at once.
+    Concurrent prompts queue per model and go to the first free instance;
+    identical prompts (same text and parameters) waiting in the queue are
+    answered by a single generation. With `prompt_cache_bytes`, the KV state
+    of the prompt prefixes is cached in RAM, so the long shared templates of
+    the checker and Cypher prompts are only evaluated once.
+    """
+
+    def __init__(self, instances: int = 1, n_ctx: int = 4096,
+                 n_threads: Optional[int] = None, prompt_cache_bytes: int = 0,
+                 loader: Callable[..., Any] = _load_llama, **model_kwargs: Any):
+        """
+        Args:
+            instances: copies of each model (each one answers one prompt at a time).
+            n_ctx: context size of the models.
+            n_threads: CPU threads per instance (llama.cpp default if None).
+            prompt_cache_bytes: size of the prompt prefix cache per instance (0: none).
+            loader: callable loading a model from its path and keyword arguments
+                (`prompt_cache_bytes` and the model arguments).
+            model_kwargs: other `llama_cpp.Llama` arguments.
+        """
+        self.instances = instances
+        self.prompt_cache_bytes = prompt_cache_bytes
+        self.loader = loader
+        self.model_kwargs = {"n_ctx": n_ctx, **model_kwargs}
+        if n_threads:
+            self.model_kwargs["n_threads"] = n_threads
+        self._models: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def _loading(self, model_path: str) -> Tuple[Future, bool]:
+        """Future of a model and whether the caller must load it."""
+        with self._lock:
+            future = self._models.get(model_path)
+            if future is not None:
+                return future, False
+            future = self._models[model_path] = Future()
+            return future, True
+
+    def _load(self, model_path: str, future: Future) -> None:
+        try:
+            future.set_result(_Model(self, model_path))
+        except Exception as e:
+            logger.warning("local model %s not loaded", model_path, exc_info=True)
+            future.set_exception(e)
+
+    def model(self, model_path: str) -> _Model:
+        """Loaded model, loading it in the calling thread on first use."""
+        future, load = self._loading(model_path)
+        if load:
+            self._load(model_path, future)
+        return future.result()
+
+    async def amodel(self, model_path: str) -> _Model:
+        """Loaded model, loading it in a thread on first use."""
+        future, load = self._loading(model_path)
+        if load:
+            asyncio.get_running_loop().run_in_executor(None, self._load, model_path, future)
+        return await asyncio.wrap_future(future)
+
+    def warm(self, model_paths: List[str], background: bool = False) -> None:
+        """Load models ahead of their first prompt."""
+        def _warm() -> None:
+            for model_path in model_paths:
+                try:
+                    self.model(model_path)
+                except Exception:
+                    # logged by _load
+                    pass
+
+        if background:
+            threading.Thread(target=_warm, daemon=True, name="genaiti-local-warm").start()
+        else:
+            _warm()
+
+    def submit(self, model_path: str, prompt: str, params: Dict[str, Any],
+               sink: Optional[Callable[[Any], None]] = None) -> Future:
+        """Queue a prompt; the future gets the whole completion.
+
+        `sink`, if given, receives each generated text piece, then a sentinel
+        once the completion is over (or has failed).
+        """
+        request = _Request(prompt, params, sink)
+        self.model(model_path).submit(request)
+        return request.futures[0]
+
+    async def asubmit(self, model_path: str, prompt: str, params: Dict[str, Any],
+                      sink: Optional[Callable[[Any], None]] = None) -> Future:
+        """`submit` waiting for the model to load without blocking the event loop."""
+        request = _Request(prompt, params, sink)
+        (await self.amodel(model_path)).submit(request)
+        return request.futures[0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models = {path: future.result() for path, future in self._models.items()
+                      if future.done() and future.exception() is None}
+        return {path: {"instances": len(model.instances), "queued": len(model.queue),
+                       "busy": model.busy, "generations": model.generations,
+                       "coalesced": model.coalesced}
+                for path, model in models.items()}
+
+
+local_model_pool = LocalModelPool()
+
+
+def configure_local_models(model_paths: List[str], instances: int = 1, n_ctx: int = 4096,
+                           n_threads: Optional[int] = None,
+                           prompt_cache_bytes: int = 0) -> LocalModelPool:
+    """Set up the shared pool and load its models in the background."""
+    pool = local_model_pool
+    pool.instances = instances
+    pool.prompt_cache_bytes = prompt_cache_bytes
+    pool.model_kwargs["n_ctx"] = n_ctx
+    if n_threads:
+        pool.model_kwargs["n_threads"] = n_threads
+    if model_paths:
+        pool.warm(model_paths, background=True)
+    return pool
+
+
+class LocalLLM(LLM):
+    """LLM generating with a GGUF model of the local pool, on CPU.
+
+    Runs offline; with `streaming`, the completion is generated token by
+    token through the callbacks like `HuggingFaceEndpoint`.
+    """
+
+    model_path: str
+    """Path of the GGUF model file."""
+    max_tokens: int = 256
+    temperature: float = 0.01
+    top_k: int = 40
+    top_p: float = 0.95
+    repeat_penalty: float = 1.1
+    streaming: bool = False
+    pool: LocalModelPool = Field(default_factory=lambda: local_model_pool, exclude=True)
+    """Pool running the model (the process-wide one by default)."""
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def _llm_type(self) -> str:
+        return "local_llamacpp"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_path": self.model_path, **self._params(None)}
+
+    def _params(self, stop: Optional[List[str]], **kwargs: Any) -> Dict[str, Any]:
+        params = {"max_tokens": self.max_tokens, "temperature": self.temperature,
+                  "top_k": self.top_k, "top_p": self.top_p,
+                  "repeat_penalty": self.repeat_penalty, **kwargs}
+        if stop:
+            params["stop"] = list(stop)
+        return params
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        if self.streaming:
+            return "".join(chunk.text for chunk in
+                           self._stream(prompt, stop, run_manager, **kwargs))
+        return self.pool.submit(self.model_path, prompt, self._params(stop, **kwargs)).result()
+
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        pieces: "queue.Queue[Any]" = queue.Queue()
+        future = self.pool.submit(self.model_path, prompt, self._params(stop, **kwargs),
+                                  pieces.put)
+        try:
+            while True:
+                text = pieces.get()
+                if text is _DONE:
+                    break
+                chunk = GenerationChunk(text=text)
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+            future.result()
+        finally:
+            future.cancel()
+
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        if self.streaming:
+            completion = ""
+            async for chunk in self._astream(prompt, stop, run_manager, **kwargs):
+                completion += chunk.text
+            return completion
+        future = await self.pool.asubmit(self.model_path, prompt, self._params(stop, **kwargs))
+        return await asyncio.wrap_future(future)
+
+    async def _astream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[GenerationChunk]:
+        loop = asyncio.get_running_loop()
+        pieces: "asyncio.Queue[Any]" = asyncio.Queue()
+
+        def _put(text: Any) -> None:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(pieces.put_nowait, text)
+
+        future = await self.pool.asubmit(self.model_path, prompt, self._params(stop, **kwargs),
+                                         _put)
+        try:
+            while True:
+                text = await pieces.get()
+                if text is _DONE:
+                    break
+                chunk = GenerationChunk(text=text)
+                if run_manager:
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+            await asyncio.wrap_future(future)
+        finally:
+            # the worker stops generating once no caller waits for the text
+            future.cancel()
+
+
+def local_llm_from_params(repo_id: str, max_new_tokens: int = 256, top_k: int = 40,
+                          temperature: float = 0.01, repetition_penalty: float = 1.1,
+                          streaming: bool = False, **kwargs: Any) -> LocalLLM:
+    """`LocalLLM` built from the `HuggingFaceEndpoint` parameters of the settings."""
+    kwargs.pop("task", None)
+    return LocalLLM(model_path=repo_id[len(LOCAL_PREFIX):], max_tokens=max_new_tokens,
+                    top_k=top_k, temperature=temperature,
+                    repeat_penalty=repetition_penalty, streaming=streaming, **kwargs)
@@ -0,0 +1,344 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+__all__ = [
+    "STAGE_SECONDS",
+    "STAGE_FAILURES",
+    "TOKENS",
+    "GRAPH_ROWS",
+    "ROUTE_DECISIONS",
+    "CACHE_HITS",
+    "QUESTIONS",
+    "BATCH_FALLBACKS",
+    "SPECULATIONS",
+    "SPECULATION_SECONDS",
+    "LLM_QUEUE_DEPTH",
+    "LLM_QUEUE_WAIT",
+    "LLM_RETRIES",
+    "DEFAULT_BUCKETS",
+    "Metrics",
+    "NoopMetrics",
+    "PrometheusMetrics",
+    "OpenTelemetryMetrics",
+    "configure_opentelemetry",
+    "serve_metrics",
+    "build_metrics",
+]
+
+# metric names recorded by the chain
+STAGE_SECONDS = "genaiti_stage_seconds"
+STAGE_FAILURES = "genaiti_stage_failures_total"
+TOKENS = "genaiti_tokens"
+GRAPH_ROWS = "genaiti_graph_rows"
+ROUTE_DECISIONS = "genaiti_route_decisions_total"
+CACHE_HITS = "genaiti_cache_hits_total"
+QUESTIONS = "genaiti_questions_total"
+BATCH_FALLBACKS = "genaiti_batch_fallbacks_total"
+SPECULATIONS = "genaiti_speculations_total"
+SPECULATION_SECONDS = "genaiti_speculation_seconds_total"
+# metric names recorded by the LLM scheduler
+LLM_QUEUE_DEPTH = "genaiti_llm_queue_depth"
+LLM_QUEUE_WAIT = "genaiti_llm_queue_wait_seconds"
+LLM_RETRIES = "genaiti_llm_retries_total"
+
+DEFAULT_BUCKETS: Dict[str, Tuple[float, ...]] = {
+    STAGE_SECONDS: (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+    TOKENS: (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192),
+    GRAPH_ROWS: (0, 1, 2, 5, 10, 25, 50, 100, 250, 1000),
+    LLM_QUEUE_DEPTH: (0, 1, 2, 5, 10, 25, 50, 100, 250),
+    LLM_QUEUE_WAIT: (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+}
+_FALLBACK_BUCKETS = (0.1, 1, 10, 100, 1000, 10000)
+
+_HELP = {
+    STAGE_SECONDS: "Duration of a pipeline stage in seconds.",
+    STAGE_FAILURES: "Pipeline stages which raised an exception.",
+    TOKENS: "Estimated number of tokens of a prompt part or an LLM output.",
+    GRAPH_ROWS: "Number of rows returned by a graph query.",
+    ROUTE_DECISIONS: "Question validation decisions by source and verdict.",
+    CACHE_HITS: "Values served without an LLM call or a graph query.",
+    QUESTIONS: "Questions answered by the chain.",
+    BATCH_FALLBACKS: "Merged batch lookups which failed and were run one by one.",
+    SPECULATIONS: "Speculative Cypher generations by outcome (launched, used, cancelled, wasted).",
+    SPECULATION_SECONDS: "Seconds of speculative work by outcome: saved when used, wasted otherwise.",
+    LLM_QUEUE_DEPTH: "Calls already waiting for the endpoint when an LLM call is queued.",
+    LLM_QUEUE_WAIT: "Seconds an LLM call waited for a slot and the rate limiter.",
+    LLM_RETRIES: "LLM calls sent again after a 429 response.",
+}
+
+
+class Metrics:
+    """Metrics sink of the chain: stage spans, histograms and counters.
+
+    `span` times a block into the `STAGE_SECONDS` histogram and counts the
+    exceptions it raises into `STAGE_FAILURES`. Backends implement
+    `observe` and `increment`.
+    """
+
+    enabled = True
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        raise NotImplementedError
+
+    def increment(self, name: str, value: float = 1, **labels: Any) -> None:
+        raise NotImplementedError
+
+    @contextmanager
+    def span(self, stage: str, **attributes: Any) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            self.increment(STAGE_FAILURES, stage=stage, error=type(e).__name__)
+            raise
+        finally:
+            self.observe(STAGE_SECONDS, time.perf_counter() - started, stage=stage)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exc_info: Any) -> bool:
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class NoopMetrics(Metrics):
+    """Disabled metrics: every call returns immediately."""
+
+    enabled = False
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        pass
+
+    def increment(self, name: str, value: float = 1, **labels: Any) -> None:
+        pass
+
+    def span(self, stage: str, **attributes: Any) -> _NoopSpan:
+        return _NOOP_SPAN
+
+
+def _label_key(labels: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: Tuple[Tuple[str, str], ...], **extra: str) -> str:
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class PrometheusMetrics(Metrics):
+    """In-process histograms and counters rendered in the Prometheus text format.
+
+    Expose `render()` on a scrape endpoint, e.g. with `serve_metrics`.
+    """
+
+    def __init__(self, buckets: Optional[Dict[str, Tuple[float, ...]]] = None):
+        """
+        Args:
+            buckets: histogram name -> upper bounds, defaults to `DEFAULT_BUCKETS`.
+        """
+        self.buckets = dict(DEFAULT_BUCKETS, **(buckets or {}))
+        # name -> labels -> [bucket counts..., sum, count]
+        self._histograms: Dict[str, Dict[Tuple, List[float]]] = {}
+        self._counters: Dict[str, Dict[Tuple, float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        bounds = self.buckets.get(name, _FALLBACK_BUCKETS)
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            values = series.get(key)
+            if values is None:
+                values = series[key] = [0.0] * (len(bounds) + 2)
+            values[bisect.bisect_left(bounds, value)] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def increment(self, name: str, value: float = 1, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def render(self) -> str:
+        """Current values in the Prometheus exposition format."""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                bounds = self.buckets.get(name, _FALLBACK_BUCKETS)
+                lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, values in sorted(series.items()):
+                    cumulative = 0.0
+                    for bound, count in zip(list(bounds) + [float("inf")], values[:-2]):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key, le=_format_value(bound))}"
+                                     f" {_format_value(cumulative)}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_value(values[-2])}")
+                    lines.append(f"{name}_count{_format_labels(key)} {_format_value(values[-1])}")
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters and histogram sums/counts, e.g. for the benchmarks."""
+        with self._lock:
+            return {
+                "counters": {name: {_format_labels(k): v for k, v in series.items()}
+                             for name, series in self._counters.items()},
+                "histograms": {name: {_format_labels(k): {"sum": v[-2], "count": v[-1]}
+                                      for k, v in series.items()}
+                               for name, series in self._histograms.items()},
+            }
+
+
+class OpenTelemetryMetrics(Metrics):
+    """Spans, histograms and counters sent through the OpenTelemetry API.
+
+    The exporters are those of the global tracer and meter providers, see
+    `configure_opentelemetry`.
+    """
+
+    def __init__(self, name: str = "genaiti"):
+        try:
+            from opentelemetry import metrics, trace
+        except ImportError as e:
+            raise ImportError(
+                "Could not import opentelemetry python package. "
+                "Please install it with `pip install opentelemetry-api opentelemetry-sdk`."
+            ) from e
+        self._trace = trace
+        self._tracer = trace.get_tracer(name)
+        self._meter = metrics.get_meter(name)
+        self._instruments: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _instrument(self, name: str, kind: str) -> Any:
+        instrument = self._instruments.get(name)
+        if instrument is None:
+            with self._lock:
+                instrument = self._instruments.get(name)
+                if instrument is None:
+                    create = (self._meter.create_histogram if kind == "histogram"
+                              else self._meter.create_counter)
+                    instrument = self._instruments[name] = create(
+                        name, description=_HELP.get(name, ""))
+        return instrument
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        self._instrument(name, "histogram").record(value, attributes=labels)
+
+    def increment(self, name: str, value: float = 1, **labels: Any) -> None:
+        self._instrument(name, "counter").add(value, attributes=labels)
+
+    @contextmanager
+    def span(self, stage: str, **attributes: Any) -> Iterator[None]:
+        attributes = {k: v for k, v in attributes.items() if v is not None}
+        with self._tracer.start_as_current_span(f"genaiti.{stage}",
+                                                attributes=attributes) as span:
+            started = time.perf_counter()
+            try:
+                yield
+            except BaseException as e:
+                span.record_exception(e)
+                span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, str(e)))
+                self.increment(STAGE_FAILURES, stage=stage, error=type(e).__name__)
+                raise
+            finally:
+                self.observe(STAGE_SECONDS, time.perf_counter() - started, stage=stage)
+
+
+def configure_opentelemetry(service_name: str = "genaiti",
+                            endpoint: Optional[str] = None) -> None:
+    """Install SDK tracer and meter providers exporting over OTLP/HTTP.
+
+    Without `endpoint`, the exporters read the `OTEL_EXPORTER_OTLP_*` variables.
+    """
+    try:
+        from opentelemetry import metrics, trace
+        from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.metrics import MeterProvider
+        from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError as e:
+        raise ImportError(
+            "Could not import opentelemetry sdk or exporter packages. Please install them "
+            "with `pip install opentelemetry-sdk opentelemetry-exporter-otlp-proto-http`."
+        ) from e
+
+    resource = Resource.create({"service.name": service_name})
+    endpoint = endpoint.rstrip("/") if endpoint else None
+    tracer_provider = TracerProvider(resource=resource)
+    tracer_provider.add_span_processor(BatchSpanProcessor(
+        OTLPSpanExporter(endpoint=f"{endpoint}/v1/traces" if endpoint else None)))
+    trace.set_tracer_provider(tracer_provider)
+    reader = PeriodicExportingMetricReader(
+        OTLPMetricExporter(endpoint=f"{endpoint}/v1/metrics" if endpoint else None))
+    metrics.set_meter_provider(MeterProvider(resource=resource, metric_readers=[reader]))
+
+
+def serve_metrics(metrics: PrometheusMetrics, port: int = 9464,
+                  addr: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve `metrics.render()` on `/metrics` from a daemon thread."""
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer((addr, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="genaiti-metrics", daemon=True).start()
+    return server
+
+
+def build_metrics(backend: Optional[str], port: int = 9464,
+                  otlp_endpoint: Optional[str] = None) -> Metrics:
+    """Metrics for a backend name: `prometheus`, `otel`, or none (disabled)."""
+    backend = (backend or "").strip().lower()
+    if backend in ("", "none", "off", "noop"):
+        return NoopMetrics()
+    if backend == "prometheus":
+        metrics = PrometheusMetrics()
+        serve_metrics(metrics, port)
+        return metrics
+    if backend in ("otel", "opentelemetry"):
+        configure_opentelemetry(endpoint=otlp_endpoint)
+        return OpenTelemetryMetrics()
+    raise ValueError(f"Unknown metrics backend: {backend}")
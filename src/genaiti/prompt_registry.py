@@ -0,0 +1,142 @@
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from langchain_core.prompts import PromptTemplate
+
+from .context import estimate_tokens
+from .prompts_template import (
+    build_history_summary_prompt,
+    build_prompt_cypher_generator,
+    build_prompt_cypher_qa_generator,
+    build_question_validation_prompt,
+    build_safety_prompt,
+)
+
+__all__ = ["minify_template", "minify_prompt", "PromptRegistry", "prompt_registry",
+           "tokenizer_counter"]
+
+_variable_re = re.compile(r"(?<!\{)\{(\w+)\}(?!\})")
+_blank_lines_re = re.compile(r"\n{3,}")
+_inner_spaces_re = re.compile(r"(?<=\S) {2,}")
+
+
+def _variables(template: str) -> Tuple[str, ...]:
+    return tuple(_variable_re.findall(template))
+
+
+def minify_template(template: str) -> str:
+    """Remove the whitespace a template gets from its indentation in the code.
+
+    The common indentation of the lines after the first one (the triple
+    quoted string is indented with the code) and the trailing spaces are
+    removed, runs of spaces inside a line and of blank lines collapse into
+    one. Line breaks and the relative indentation of the samples are kept.
+
+    Raises:
+        ValueError: if the words or the variables of the template would change.
+    """
+    lines = template.split("\n")
+    indents = [len(line) - len(line.lstrip(" ")) for line in lines[1:] if line.strip()]
+    indent = min(indents) if indents else 0
+    lines = [lines[0]] + [line[indent:] for line in lines[1:]]
+    lines = [_inner_spaces_re.sub(" ", line.rstrip()) for line in lines]
+    minified = _blank_lines_re.sub("\n\n", "\n".join(lines)).strip("\n")
+    # a prompt ending with a line break still does
+    if template.rstrip(" ").endswith("\n") and minified:
+        minified += "\n"
+    if minified.split() != template.split() or _variables(minified) != _variables(template):
+        raise ValueError("minifying the template would change its words")
+    return minified
+
+
+def minify_prompt(prompt: PromptTemplate) -> PromptTemplate:
+    """Copy of a prompt with a minified template."""
+    return PromptTemplate(input_variables=list(prompt.input_variables),
+                          template=minify_template(prompt.template))
+
+
+def tokenizer_counter(name: str) -> Callable[[str], int]:
+    """Token counter of a Hugging Face tokenizer (a `tokenizer.json` path or a Hub model)."""
+    try:
+        from tokenizers import Tokenizer
+    except ImportError as e:
+        raise ImportError(
+            "Could not import tokenizers python package. "
+            "Please install it with `pip install tokenizers`."
+        ) from e
+    tokenizer = Tokenizer.from_file(name) if os.path.exists(name) else Tokenizer.from_pretrained(name)
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+class PromptRegistry:
+    """Prompts of the chain, built once per set of options and minified.
+
+    `get("qa")` returns the same `PromptTemplate` to every caller (the chain
+    defaults and the app), so templates are neither rebuilt nor re-minified
+    per session. `token_counts` gives the fixed cost of each template (its
+    text without the variables) for a chosen tokenizer.
+    """
+
+    def __init__(self, minify: bool = True):
+        """
+        Args:
+            minify: remove the indentation whitespace of the templates.
+        """
+        self.minify = minify
+        self._builders: Dict[str, Callable[..., PromptTemplate]] = {}
+        self._prompts: Dict[Tuple[str, Tuple[Tuple[str, Any], ...]], PromptTemplate] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, builder: Callable[..., PromptTemplate]) -> None:
+        with self._lock:
+            self._builders[name] = builder
+            self._prompts = {key: prompt for key, prompt in self._prompts.items()
+                             if key[0] != name}
+
+    def names(self) -> Tuple[str, ...]:
+        return tuple(self._builders)
+
+    def get(self, name: str, **options: Any) -> PromptTemplate:
+        """Prompt `name` built with `options` (cached)."""
+        key = (name, tuple(sorted(options.items())))
+        prompt = self._prompts.get(key)
+        if prompt is None:
+            with self._lock:
+                prompt = self._prompts.get(key)
+                if prompt is None:
+                    prompt = self._builders[name](**options)
+                    if self.minify:
+                        prompt = minify_prompt(prompt)
+                    self._prompts[key] = prompt
+        return prompt
+
+    def token_counts(self, token_counter: Callable[[str], int] = estimate_tokens,
+                     variants: Optional[Dict[str, Dict[str, Any]]] = None
+                     ) -> Dict[str, Dict[str, int]]:
+        """Tokens of each template without its variables, raw and minified.
+
+        Args:
+            token_counter: text -> number of tokens.
+            variants: report name -> (prompt name, options) as a dictionary
+                with a "name" key and the options; one entry per prompt if None.
+        """
+        variants = variants or {name: {"name": name} for name in self._builders}
+        counts = {}
+        for report_name, variant in variants.items():
+            options = {key: value for key, value in variant.items() if key != "name"}
+            raw = self._builders[variant["name"]](**options).template
+            counts[report_name] = {
+                "raw": token_counter(_variable_re.sub("", raw)),
+                "minified": token_counter(_variable_re.sub("", minify_template(raw))),
+            }
+        return counts
+
+
+prompt_registry = PromptRegistry()
+prompt_registry.register("cypher_generation", build_prompt_cypher_generator)
+prompt_registry.register("qa", build_prompt_cypher_qa_generator)
+prompt_registry.register("validation", build_question_validation_prompt)
+prompt_registry.register("safety", build_safety_prompt)
+prompt_registry.register("history_summary", build_history_summary_prompt)
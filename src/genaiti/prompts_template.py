@@ -4,10 +4,11 @@ from langchain_core.prompts import PromptTemplate
 __all__ = ['build_prompt_cypher_generator',
            'build_prompt_cypher_qa_generator',
            'build_question_validation_prompt',
-           'build_safety_prompt']
+           'build_safety_prompt',
+           'build_history_summary_prompt']
 
 
-def build_prompt_cypher_generator(prompt_form=None):
+def build_prompt_cypher_generator(prompt_form=None, with_examples=False):
     if prompt_form: 
         CYPHER_GENERATION_TEMPLATE = prompt_form
     # Simulate a running task
@@ -25,6 +26,7 @@ def build_prompt_cypher_generator(prompt_form=None):
     - MATCH (r:NeoRadical) WHERE r.value CONTAINS 'mba' RETURN r;  // Match and return all radicals in the graph database
     - MATCH (v:NeoVariant)<-[:WORD_IS_USED_IN]-(w:NeoWord)<-[:RADICAL_IS_FOUND_IN]-(r:NeoRadical) return r; // chain relation between nodes
     -----
+    {examples}
     ONLY accept MATCH query (read only data) and node attribute must respect the provided schema
     Your query must only provide relationship types and node properties in the schema below.
     Do not use any other relationship types or properties that are not provided in the schema below.
@@ -41,8 +43,15 @@ def build_prompt_cypher_generator(prompt_form=None):
 
     """
 
+    # examples retrieved for the question (see ExampleStore)
+    if with_examples:
+        input_variables = ["schema", "question", "examples"]
+    else:
+        input_variables = ["schema", "question"]
+        CYPHER_GENERATION_TEMPLATE = CYPHER_GENERATION_TEMPLATE.replace("    {examples}\n", "")
+
     CYPHER_GENERATION_PROMPT = PromptTemplate(
-        input_variables=["schema", "question"], 
+        input_variables=input_variables, 
         template=CYPHER_GENERATION_TEMPLATE
     )
     return CYPHER_GENERATION_PROMPT
@@ -157,3 +166,26 @@ def build_prompt_cypher_qa_generator(prompt_form=None):
     )
 
     return CYPHER_QA_PROMPT
+
+
+
+def build_history_summary_prompt(prompt_form=None):
+    HISTORY_SUMMARY_TEMPLATE = prompt_form or """Résumez brièvement la conversation
+    entre un utilisateur (human) et l'assistant de NTeALan (ai).
+    Gardez les mots, langues et dictionnaires mentionnés, sans rien inventer.
+    Répondez uniquement avec le résumé, en langue FRANÇAISE.
+
+    Résumé actuel:
+    {summary}
+
+    Nouveaux échanges:
+    {lines}
+
+    >Résumé:"""
+
+    HISTORY_SUMMARY_PROMPT = PromptTemplate(
+        input_variables=["summary", "lines"], 
+        template=HISTORY_SUMMARY_TEMPLATE
+    )
+
+    return HISTORY_SUMMARY_PROMPT
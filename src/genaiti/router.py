@@ -0,0 +1,236 @@
+import math
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .cache import normalize_question
+
+__all__ = ["QuestionRouter", "DATA_VOCABULARY", "SMALL_TALK_VOCABULARY",
+           "DEFAULT_ROUTER_SAMPLES"]
+
+_camel_re = re.compile(r"(?<=[a-z])(?=[A-Z])")
+
+# words (singular, without accents) pointing to the dictionary graph
+DATA_VOCABULARY = {
+    # french
+    "dictionnaire", "article", "mot", "radical", "radicaux", "variante",
+    "traduction", "exemple", "langue", "categorie", "classe", "prefixe",
+    "suffixe", "conjugaison", "entree", "etiquette", "tag", "nominal",
+    "pluriel", "singulier", "combien", "liste", "lister", "listez", "nombre",
+    "compte", "affiche", "afficher", "donne", "trouve", "cherche", "definition",
+    "signifie", "veut", "traduit", "traduire", "base",
+    # english
+    "dictionary", "dictionarie", "word", "variant", "translation", "example",
+    "language", "category", "categorie", "prefix", "suffix", "conjugation",
+    "entry", "entrie", "plural", "singular", "how", "many", "list", "count",
+    "number", "show", "find", "search", "meaning", "mean", "translate",
+    "database",
+}
+
+# words and phrases of greetings, thanks and small talk
+SMALL_TALK_VOCABULARY = {
+    "bonjour", "bonsoir", "salut", "coucou", "hello", "hi", "hey", "merci",
+    "thank", "thanks", "bye", "revoir", "ca va", "comment vas", "comment allez",
+    "how are you", "qui es tu", "qui etes vous", "who are you", "qui est",
+    "tu es", "you are", "ntealan", "super", "cool", "ok", "d accord", "bravo",
+}
+
+DEFAULT_ROUTER_SAMPLES: List[Tuple[str, bool]] = [
+    ("Tu es un salaud", False),
+    ("Bonjour, comment tu vas ?", False),
+    ("qui est ntealan ?", False),
+    ("Salut !", False),
+    ("Merci beaucoup pour ton aide", False),
+    ("Hello, who are you?", False),
+    ("Qui es-tu ?", False),
+    ("Bonsoir", False),
+    ("Parle moi de la culture africaine", False),
+    ("Au revoir et à bientôt", False),
+    ("Thanks a lot", False),
+    ("C'est quoi l'association ntealan ?", False),
+    ("How many articles you have in database", True),
+    ("liste tous les dictionnaires que tu connais", True),
+    ("combien de dictionnaires as-tu ?", True),
+    ("liste les dictionnaires", True),
+    ("Donne moi les radicaux qui contiennent mba", True),
+    ("Quelle est la traduction du mot mbwa ?", True),
+    ("Combien d'articles dans le dictionnaire duala ?", True),
+    ("Affiche les exemples du mot ngando", True),
+    ("List all the words of the ghomala dictionary", True),
+    ("Which languages are in the database?", True),
+    ("Quelles sont les variantes du mot bato ?", True),
+    ("Show me the translations of the word mbolo", True),
+]
+
+
+def _stem(token: str) -> str:
+    if len(token) > 3 and token[-1] in "sx":
+        return token[:-1]
+    return token
+
+
+def _labels_vocabulary(labels: Iterable[str]) -> set:
+    """Words of schema labels, e.g. `NeoNominalPair` -> {"nominal", "pair"}."""
+    words = set()
+    for label in labels:
+        label = label[3:] if label.startswith("Neo") else label
+        for word in _camel_re.split(label):
+            words.add(_stem(word.lower()))
+    return words
+
+
+class QuestionRouter:
+    """Local fast path deciding if a question needs a Cypher query.
+
+    It replaces the remote checker LLM call for obvious questions by
+    combining:
+
+    - a lexicon matcher over schema labels, dictionary vocabulary and small
+      talk phrases,
+    - a multinomial naive Bayes classifier over character n-grams, which is
+      trained on `DEFAULT_ROUTER_SAMPLES` and can keep learning from the
+      checker LLM verdicts (`observe`).
+
+    `route` returns True (data question), False (small talk) or None when
+    the confidence is below `threshold`, in which case the checker LLM must
+    decide.
+
+    Built `from_snapshot`, the router follows a `SchemaSnapshot`: the labels
+    of the lexicon are taken again whenever the snapshot fingerprint
+    changes (a snapshot loaded later, attached to the graph or refreshed).
+    """
+
+    def __init__(
+        self,
+        labels: Sequence[str] = (),
+        data_vocabulary: Iterable[str] = DATA_VOCABULARY,
+        small_talk_vocabulary: Iterable[str] = SMALL_TALK_VOCABULARY,
+        samples: Optional[Iterable[Tuple[str, bool]]] = DEFAULT_ROUTER_SAMPLES,
+        threshold: float = 0.9,
+        ngram_range: Tuple[int, int] = (2, 4),
+        lexicon_weight: float = 1.5,
+        alpha: float = 0.5,
+    ):
+        """
+        Args:
+            labels: graph node labels added to the data vocabulary.
+            data_vocabulary: words pointing to the dictionary graph.
+            small_talk_vocabulary: greetings and small talk words or phrases.
+            samples: (question, is data question) pairs to train on.
+            threshold: minimal probability needed to answer without the LLM.
+            ngram_range: sizes of the character n-grams.
+            lexicon_weight: log-odds added for each lexicon match.
+            alpha: additive smoothing of the n-gram counts.
+        """
+        self._base_vocabulary = {_stem(w) for w in data_vocabulary}
+        self.data_vocabulary = self._base_vocabulary | _labels_vocabulary(labels)
+        self.snapshot: Optional[Any] = None
+        self._snapshot_fingerprint: Optional[str] = None
+        self.small_talk_words = {w for w in small_talk_vocabulary if " " not in w}
+        self.small_talk_phrases = [f" {w} " for w in small_talk_vocabulary if " " in w]
+        self.threshold = threshold
+        self.ngram_range = ngram_range
+        self.lexicon_weight = lexicon_weight
+        self.alpha = alpha
+        self._counts: Dict[bool, Counter] = {True: Counter(), False: Counter()}
+        self._totals = {True: 0, False: 0}
+        self._docs = {True: 0, False: 0}
+        self._vocabulary: set = set()
+        self._lock = threading.Lock()
+        self.decisions = Counter()
+        if samples:
+            self.fit(samples)
+
+    @classmethod
+    def from_schema(cls, structured_schema: Dict[str, Any], **kwargs: Any) -> "QuestionRouter":
+        """Build a router whose lexicon includes the schema node labels."""
+        return cls(labels=list(structured_schema.get("node_props", {})), **kwargs)
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Any, **kwargs: Any) -> "QuestionRouter":
+        """Build a router whose lexicon follows the node labels of a `SchemaSnapshot`."""
+        router = cls(**kwargs)
+        router.snapshot = snapshot
+        router._sync_labels()
+        return router
+
+    def set_labels(self, labels: Iterable[str]) -> None:
+        """Replace the schema labels of the data vocabulary."""
+        self.data_vocabulary = self._base_vocabulary | _labels_vocabulary(labels)
+
+    def _sync_labels(self) -> None:
+        snapshot = self.snapshot
+        if snapshot is None or snapshot.fingerprint == self._snapshot_fingerprint:
+            return
+        with self._lock:
+            if snapshot.fingerprint != self._snapshot_fingerprint:
+                self._snapshot_fingerprint = snapshot.fingerprint
+                self.set_labels(list(snapshot.structured_schema.get("node_props", {})))
+
+    def _ngrams(self, normalized: str) -> List[str]:
+        text = f" {normalized} "
+        low, high = self.ngram_range
+        return [text[i:i + n] for n in range(low, high + 1)
+                for i in range(len(text) - n + 1)]
+
+    def fit(self, samples: Iterable[Tuple[str, bool]]) -> "QuestionRouter":
+        for question, label in samples:
+            self.observe(question, label)
+        return self
+
+    def observe(self, question: str, is_data_question: bool) -> None:
+        """Learn from one labelled question (e.g. a checker LLM verdict)."""
+        grams = self._ngrams(normalize_question(question))
+        label = bool(is_data_question)
+        with self._lock:
+            self._counts[label].update(grams)
+            self._totals[label] += len(grams)
+            self._docs[label] += 1
+            self._vocabulary.update(grams)
+
+    def lexicon_score(self, normalized: str) -> int:
+        """Number of data words minus number of small talk words and phrases."""
+        self._sync_labels()
+        tokens = normalized.split()
+        score = sum(1 for t in tokens if _stem(t) in self.data_vocabulary)
+        score -= sum(1 for t in tokens if t in self.small_talk_words)
+        padded = f" {normalized} "
+        score -= sum(1 for phrase in self.small_talk_phrases if phrase in padded)
+        return score
+
+    def log_odds(self, question: str) -> float:
+        """Log-odds that the question needs a Cypher query."""
+        normalized = normalize_question(question)
+        grams = self._ngrams(normalized)
+        vocabulary = len(self._vocabulary) or 1
+        log_odds = math.log((self._docs[True] + 1) / (self._docs[False] + 1))
+        if grams:
+            true_counts, false_counts = self._counts[True], self._counts[False]
+            true_norm = self._totals[True] + self.alpha * vocabulary
+            false_norm = self._totals[False] + self.alpha * vocabulary
+            ratio = sum(
+                math.log((true_counts[g] + self.alpha) / true_norm)
+                - math.log((false_counts[g] + self.alpha) / false_norm)
+                for g in grams
+            )
+            # average per n-gram: naive Bayes sums are overconfident
+            log_odds += 4 * ratio / len(grams)
+        return log_odds + self.lexicon_weight * self.lexicon_score(normalized)
+
+    def predict_proba(self, question: str) -> float:
+        """Probability that the question needs a Cypher query."""
+        log_odds = max(min(self.log_odds(question), 50.0), -50.0)
+        return 1.0 / (1.0 + math.exp(-log_odds))
+
+    def route(self, question: str) -> Optional[bool]:
+        """True/False when confident enough, None to defer to the checker LLM."""
+        probability = self.predict_proba(question)
+        if probability >= self.threshold:
+            decision = True
+        elif probability <= 1 - self.threshold:
+            decision = False
+        else:
+            decision = None
+        self.decisions[str(decision)] += 1
+        return decision
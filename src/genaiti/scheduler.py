@@ -0,0 +1,468 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+from langchain_core.pydantic_v1 import Field, root_validator
+from langchain_core.runnables import Runnable
+
+from .hedging import HedgedLLM, _endpoint_name, _text
+from .metrics import LLM_QUEUE_DEPTH, LLM_QUEUE_WAIT, LLM_RETRIES, Metrics, NoopMetrics
+
+__all__ = ["TokenBucket", "LLMScheduler", "llm_scheduler", "ScheduledLLM", "schedule_llm",
+           "unwrap_llm", "batch_priority", "PRIORITY_CHECKER", "PRIORITY_INTERACTIVE",
+           "PRIORITY_BATCH"]
+
+# lower runs first
+PRIORITY_CHECKER = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_BATCH = 2
+
+# priority floor of the LLM calls made in the current context (see `batch_priority`)
+_context_priority: contextvars.ContextVar[int] = contextvars.ContextVar(
+    "genaiti_llm_priority", default=PRIORITY_CHECKER)
+
+
+@contextmanager
+def batch_priority() -> Iterator[None]:
+    """Run the LLM calls of the block (and of the tasks it starts) as batch calls."""
+    token = _context_priority.set(PRIORITY_BATCH)
+    try:
+        yield
+    finally:
+        _context_priority.reset(token)
+
+
+def _status(error: BaseException) -> Optional[int]:
+    """HTTP status of a requests, huggingface_hub or aiohttp error."""
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None) or getattr(error, "status", None)
+    return status if isinstance(status, int) else None
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or \
+        getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Token bucket: `rate` requests per second, bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token; returns the seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            # a negative balance is a debt paid by waiting, in reservation order
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "wake", "granted", "abandoned")
+
+    def __init__(self, priority: int, seq: int, wake: Callable[[], None]):
+        self.priority = priority
+        self.seq = seq
+        self.wake = wake
+        self.granted = False
+        self.abandoned = False
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class _Endpoint:
+    def __init__(self, max_concurrency: int, bucket: Optional[TokenBucket]):
+        self.max_concurrency = max_concurrency
+        self.bucket = bucket
+        self.active = 0
+        self.waiters: List[_Waiter] = []
+        self.calls = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.wait_seconds = 0.0
+
+
+class LLMScheduler:
+    """Process-wide admission control of the LLM endpoint calls.
+
+    Each endpoint runs at most `max_concurrency` calls at a time and starts
+    at most `rate` calls per second (token bucket of `burst`). Calls waiting
+    for a slot are admitted by priority (`PRIORITY_CHECKER` first, then the
+    interactive calls, then the batch jobs), in arrival order within one
+    priority. A call failing with HTTP 429 gives its slot back and is sent
+    again after a jittered exponential backoff (or the Retry-After delay).
+
+    The queue depth seen by each call, its wait and the retries are
+    recorded into `metrics`.
+    """
+
+    def __init__(self, max_concurrency: int = 4, rate: Optional[float] = None, burst: int = 4,
+                 limits: Optional[Dict[str, Tuple[int, Optional[float], int]]] = None,
+                 max_retries: int = 4, backoff_base: float = 0.5, backoff_max: float = 20.0,
+                 metrics: Optional[Metrics] = None):
+        """
+        Args:
+            max_concurrency: concurrent calls per endpoint.
+            rate: calls started per second per endpoint (None: unlimited).
+            burst: calls started at once when the endpoint was idle.
+            limits: endpoint -> (max_concurrency, rate, burst), overriding the defaults.
+            max_retries: attempts after a 429 response before raising it.
+            backoff_base: backoff of the first retry in seconds, doubled at each retry.
+            backoff_max: cap of the backoff in seconds.
+            metrics: sink of the queue depth, wait time and retries.
+        """
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.limits = dict(limits or {})
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.metrics = metrics or NoopMetrics()
+        self._endpoints: Dict[str, _Endpoint] = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def _endpoint(self, name: str) -> _Endpoint:
+        endpoint = self._endpoints.get(name)
+        if endpoint is None:
+            max_concurrency, rate, burst = self.limits.get(
+                name, (self.max_concurrency, self.rate, self.burst))
+            bucket = TokenBucket(rate, burst) if rate else None
+            endpoint = self._endpoints[name] = _Endpoint(max_concurrency, bucket)
+        return endpoint
+
+    def _enqueue(self, name: str, priority: int, wake: Callable[[], None]) -> Optional[_Waiter]:
+        """Take a slot at once (None) or queue a waiter woken up by `wake`."""
+        with self._lock:
+            endpoint = self._endpoint(name)
+            depth = len(endpoint.waiters)
+            if endpoint.active < endpoint.max_concurrency and not depth:
+                endpoint.active += 1
+                waiter = None
+            else:
+                waiter = _Waiter(priority, next(self._seq), wake)
+                heapq.heappush(endpoint.waiters, waiter)
+        self.metrics.observe(LLM_QUEUE_DEPTH, depth, endpoint=name)
+        return waiter
+
+    def _release(self, name: str) -> None:
+        with self._lock:
+            endpoint = self._endpoints[name]
+            endpoint.active -= 1
+            while endpoint.waiters and endpoint.active < endpoint.max_concurrency:
+                waiter = heapq.heappop(endpoint.waiters)
+                if waiter.abandoned:
+                    continue
+                endpoint.active += 1
+                waiter.granted = True
+                waiter.wake()
+
+    def _admitted(self, name: str, started: float) -> float:
+        """Rate limiter delay of an admitted call; records its wait."""
+        endpoint = self._endpoints[name]
+        delay = endpoint.bucket.reserve() if endpoint.bucket is not None else 0.0
+        wait = time.perf_counter() - started + delay
+        with self._lock:
+            endpoint.calls += 1
+            endpoint.wait_seconds += wait
+        self.metrics.observe(LLM_QUEUE_WAIT, wait, endpoint=name)
+        return delay
+
+    @contextmanager
+    def admit(self, name: str, priority: int = PRIORITY_INTERACTIVE) -> Iterator[None]:
+        """Hold a call slot of endpoint `name` for the block."""
+        started = time.perf_counter()
+        event = threading.Event()
+        waiter = self._enqueue(name, priority, event.set)
+        if waiter is not None:
+            event.wait()
+        try:
+            delay = self._admitted(name, started)
+            if delay:
+                time.sleep(delay)
+            yield
+        finally:
+            self._release(name)
+
+    @asynccontextmanager
+    async def aadmit(self, name: str, priority: int = PRIORITY_INTERACTIVE) -> AsyncIterator[None]:
+        """Hold a call slot of endpoint `name` for the block."""
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def _wake() -> None:
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        waiter = self._enqueue(name, priority, _wake)
+        if waiter is not None:
+            try:
+                await granted
+            except asyncio.CancelledError:
+                with self._lock:
+                    waiter.abandoned = True
+                    holds_slot = waiter.granted
+                # woken up while being cancelled: hand the slot over
+                if holds_slot:
+                    self._release(name)
+                raise
+        try:
+            delay = self._admitted(name, started)
+            if delay:
+                await asyncio.sleep(delay)
+            yield
+        finally:
+            self._release(name)
+
+    def backoff(self, attempt: int, error: Optional[BaseException] = None) -> float:
+        """Full jitter exponential backoff, at least the Retry-After delay."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        retry_after = _retry_after(error) if error is not None else None
+        return max(delay, min(retry_after, self.backoff_max)) if retry_after else delay
+
+    def _should_retry(self, name: str, attempt: int, error: BaseException) -> bool:
+        if _status(error) != 429:
+            return False
+        with self._lock:
+            endpoint = self._endpoints[name]
+            endpoint.rate_limited += 1
+            if attempt >= self.max_retries:
+                return False
+            endpoint.retries += 1
+        self.metrics.increment(LLM_RETRIES, endpoint=name)
+        return True
+
+    def call(self, name: str, fn: Callable[[], Any],
+             priority: int = PRIORITY_INTERACTIVE) -> Any:
+        """Run `fn` in a slot of endpoint `name`, retrying on 429 responses."""
+        for attempt in itertools.count():
+            with self.admit(name, priority):
+                try:
+                    return fn()
+                except Exception as e:
+                    if not self._should_retry(name, attempt, e):
+                        raise
+                    delay = self.backoff(attempt, e)
+            time.sleep(delay)
+
+    async def acall(self, name: str, fn: Callable[[], Awaitable[Any]],
+                    priority: int = PRIORITY_INTERACTIVE) -> Any:
+        """Await `fn()` in a slot of endpoint `name`, retrying on 429 responses."""
+        for attempt in itertools.count():
+            async with self.aadmit(name, priority):
+                try:
+                    return await fn()
+                except Exception as e:
+                    if not self._should_retry(name, attempt, e):
+                        raise
+                    delay = self.backoff(attempt, e)
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {name: {"active": endpoint.active,
+                           "queued": sum(1 for w in endpoint.waiters if not w.abandoned),
+                           "calls": endpoint.calls, "retries": endpoint.retries,
+                           "rate_limited": endpoint.rate_limited,
+                           "mean_wait_s": endpoint.wait_seconds / endpoint.calls
+                           if endpoint.calls else 0.0}
+                    for name, endpoint in self._endpoints.items()}
+
+
+llm_scheduler = LLMScheduler()
+
+
+class ScheduledLLM(LLM):
+    """LLM whose calls go through an `LLMScheduler`.
+
+    The call priority is `priority`, lowered to batch inside
+    `batch_priority`. A streamed call keeps its slot until the last token
+    and is only retried when the 429 comes before the first token.
+    """
+
+    llm: Runnable
+    """The scheduled LLM (kept as is: registry clients are compared by identity)."""
+    endpoint: str = ""
+    """Scheduler key, the model name by default"""
+    priority: int = PRIORITY_INTERACTIVE
+    streaming: bool = False
+    scheduler: LLMScheduler = Field(default_factory=lambda: llm_scheduler, exclude=True)
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @root_validator(skip_on_failure=True)
+    def _set_endpoint(cls, values: Dict[str, Any]) -> Dict[str, Any]:
+        if not values.get("endpoint"):
+            values["endpoint"] = _endpoint_name(values["llm"], 0)
+        values["streaming"] = values.get("streaming") or getattr(values["llm"], "streaming", False)
+        return values
+
+    # the cache identities are those of the scheduled LLM
+
+    @property
+    def _llm_type(self) -> str:
+        return getattr(self.llm, "_llm_type", type(self.llm).__name__)
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return dict(getattr(self.llm, "_identifying_params", {}))
+
+    @property
+    def _default_params(self) -> Optional[Dict[str, Any]]:
+        return getattr(self.llm, "_default_params", None)
+
+    @property
+    def model(self) -> Optional[str]:
+        return getattr(self.llm, "model", None)
+
+    def _priority(self) -> int:
+        return max(self.priority, _context_priority.get())
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        if self.streaming:
+            return "".join(chunk.text for chunk in
+                           self._stream(prompt, stop, run_manager, **kwargs))
+        return _text(self.scheduler.call(
+            self.endpoint, lambda: self.llm.invoke(prompt, stop=stop, **kwargs),
+            self._priority()))
+
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        for attempt in itertools.count():
+            with self.scheduler.admit(self.endpoint, self._priority()):
+                iterator = iter(self.llm.stream(prompt, stop=stop, **kwargs))
+                try:
+                    first = next(iterator)
+                except StopIteration:
+                    return
+                except Exception as e:
+                    if not self.scheduler._should_retry(self.endpoint, attempt, e):
+                        raise
+                    delay = self.scheduler.backoff(attempt, e)
+                else:
+                    for output in itertools.chain([first], iterator):
+                        chunk = GenerationChunk(text=_text(output))
+                        if run_manager:
+                            run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                        yield chunk
+                    return
+            time.sleep(delay)
+
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        if self.streaming:
+            completion = ""
+            async for chunk in self._astream(prompt, stop, run_manager, **kwargs):
+                completion += chunk.text
+            return completion
+        return _text(await self.scheduler.acall(
+            self.endpoint, lambda: self.llm.ainvoke(prompt, stop=stop, **kwargs),
+            self._priority()))
+
+    async def _astream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[GenerationChunk]:
+        for attempt in itertools.count():
+            async with self.scheduler.aadmit(self.endpoint, self._priority()):
+                iterator = self.llm.astream(prompt, stop=stop, **kwargs).__aiter__()
+                try:
+                    first = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+                except Exception as e:
+                    if not self.scheduler._should_retry(self.endpoint, attempt, e):
+                        raise
+                    delay = self.scheduler.backoff(attempt, e)
+                else:
+                    output = first
+                    while True:
+                        chunk = GenerationChunk(text=_text(output))
+                        if run_manager:
+                            await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                        yield chunk
+                        try:
+                            output = await iterator.__anext__()
+                        except StopAsyncIteration:
+                            return
+            await asyncio.sleep(delay)
+
+
+def schedule_llm(llm: Any, scheduler: LLMScheduler = llm_scheduler,
+                 priority: int = PRIORITY_INTERACTIVE) -> Any:
+    """Route the calls of `llm` through `scheduler`.
+
+    The models of a `HedgedLLM` are scheduled one by one, so that each
+    endpoint keeps its own limits.
+    """
+    if isinstance(llm, ScheduledLLM):
+        return llm
+    if isinstance(llm, HedgedLLM):
+        return llm.copy(update={"llms": [schedule_llm(inner, scheduler, priority)
+                                         for inner in llm.llms]})
+    return ScheduledLLM(llm=llm, scheduler=scheduler, priority=priority)
+
+
+def unwrap_llm(llm: Any) -> Any:
+    """LLM given to `schedule_llm`, with the models of a `HedgedLLM` unwrapped."""
+    if isinstance(llm, ScheduledLLM):
+        return llm.llm
+    if isinstance(llm, HedgedLLM):
+        return llm.copy(update={"llms": [unwrap_llm(inner) for inner in llm.llms]})
+    return llm
@@ -0,0 +1,323 @@
+import json
+import logging
+import os
+import re
+import threading
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+
+from langchain_community.graphs.graph_store import GraphStore
+from langchain.chains.graph_qa.cypher_utils import CypherQueryCorrector, Schema
+
+from .cache import fingerprint, normalize_question
+from .corrector import MemoizedCypherQueryCorrector
+from .utils import construct_schema
+
+__all__ = ["SchemaSnapshot", "SchemaIndex", "schema_fingerprint", "LABEL_ALIASES"]
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA_KEYS = ("node_props", "rel_props", "relationships")
+
+# french and english words (lowercase, without accents) naming each label
+LABEL_ALIASES: Dict[str, List[str]] = {
+    "NeoDictionary": ["dictionnaire", "dictionary", "dictionarie", "dico", "lexique"],
+    "NeoArticle": ["article", "mot", "word", "terme", "term", "lemme"],
+    "NeoEntry": ["entree", "entry", "entrie", "vedette"],
+    "NeoWord": ["mot", "word", "forme", "ecriture", "orthographe"],
+    "NeoRadical": ["radical", "radicaux", "racine", "root"],
+    "NeoVariant": ["variante", "variant", "variation"],
+    "NeoTranslation": ["traduction", "translation", "traduit", "traduire", "translate",
+                       "signifie", "signification", "meaning", "mean", "sens", "definition"],
+    "NeoTranslations": ["traduction", "translation"],
+    "NeoExample": ["exemple", "example", "phrase", "sentence", "contexte"],
+    "NeoExamples": ["exemple", "example"],
+    "NeoLanguage": ["langue", "language", "dialecte", "dialect", "iso", "parle", "spoken"],
+    "NeoCategory": ["categorie", "category", "grammaticale", "grammatical", "nature",
+                    "adjectif", "adjective", "adverbe", "adverb"],
+    "NeoCategories": ["categorie", "category"],
+    "NeoTag": ["tag", "etiquette", "keyword", "theme"],
+    "NeoNominalPair": ["paire", "pair", "nominal", "nominale"],
+    "NeoGroupNominalPair": ["paire", "pair", "groupe", "group"],
+    "NeoSingularClass": ["singulier", "singular", "classe", "class"],
+    "NeoPluralClass": ["pluriel", "plural", "classe", "class"],
+    "NeoNeutralClass": ["neutre", "neutral", "classe", "class"],
+    "NeoClasses": ["classe", "class"],
+    "NeoPrefix": ["prefixe", "prefix"],
+    "NeoSuffix": ["suffixe", "suffix"],
+    "NeoConjugations": ["conjugaison", "conjugation", "conjuguer", "conjugate", "verbe", "verb"],
+    "NeoVariantConjugation": ["conjugaison", "conjugation", "temps", "tense"],
+    "NeoUser": ["utilisateur", "user", "auteur", "author", "createur", "creator"],
+    "NeoComment": ["commentaire", "comment"],
+    "NeoCommunity": ["communaute", "community"],
+    "NeoLicense": ["licence", "license"],
+    "NeoContribution": ["contribution", "contributeur", "contributor"],
+}
+
+_camel_re = re.compile(r"(?<=[a-z])(?=[A-Z])")
+
+# words of relationship types and properties naming no label
+_SCHEMA_STOP_WORDS = {"is", "in", "use", "used", "have", "by", "of", "found", "id", "type",
+                      "name", "value", "number", "created", "at", "last", "update", "ref"}
+
+
+def schema_fingerprint(structured_schema: Dict[str, Any]) -> str:
+    """Fingerprint of the parts of a structured schema used in prompts.
+
+    Constraints and indexes (`metadata`) are ignored: they never reach the
+    prompts nor the Cypher corrector.
+    """
+    payload = {key: structured_schema.get(key) for key in _SCHEMA_KEYS}
+    return fingerprint(json.dumps(payload, sort_keys=True, default=str))
+
+
+class SchemaSnapshot:
+    """Persistent snapshot of the graph structured schema.
+
+    The dictionary schema almost never changes, so it is stored as JSON on
+    disk and reused at start up instead of introspecting Neo4j. The prompt
+    string of each include/exclude filter and the Cypher corrector are
+    memoized, which makes chain construction pure in-memory work.
+
+    A background thread can refresh the snapshot: the memoized values are
+    rebuilt only when the schema fingerprint changes.
+    """
+
+    def __init__(self, path: Optional[str] = None,
+                 structured_schema: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            path: optional JSON file used to persist the snapshot.
+            structured_schema: optional initial structured schema.
+        """
+        self.path = path
+        self.structured_schema: Dict[str, Any] = {}
+        self.fingerprint: Optional[str] = None
+        self._formatted: Dict[Tuple[Tuple[str, ...], Tuple[str, ...]], str] = {}
+        self._corrector: Optional[CypherQueryCorrector] = None
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        if structured_schema is not None:
+            self.update(structured_schema)
+
+    @property
+    def loaded(self) -> bool:
+        return self.fingerprint is not None
+
+    def load(self, path: Optional[str] = None) -> bool:
+        """Load the snapshot from disk; return False if there is none."""
+        path = path or self.path
+        if not path or not os.path.exists(path):
+            return False
+        with open(path, encoding="utf-8") as f:
+            self.update(json.load(f), save=False)
+        return True
+
+    def save(self, path: Optional[str] = None) -> None:
+        path = path or self.path
+        if not path:
+            return
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.structured_schema, f, ensure_ascii=False, indent=1,
+                      default=str)
+        os.replace(tmp_path, path)
+
+    def update(self, structured_schema: Dict[str, Any], save: bool = True) -> bool:
+        """Replace the snapshot; return True if the schema fingerprint changed."""
+        new_fingerprint = schema_fingerprint(structured_schema)
+        with self._lock:
+            if new_fingerprint == self.fingerprint:
+                return False
+            self.structured_schema = structured_schema
+            self.fingerprint = new_fingerprint
+            self._formatted.clear()
+            self._corrector = None
+        if save:
+            self.save()
+        return True
+
+    def formatted(self, include_types: Sequence[str] = (),
+                  exclude_types: Sequence[str] = ()) -> str:
+        """Schema string for the Cypher prompt, memoized per filter combination."""
+        key = (tuple(sorted(include_types)), tuple(sorted(exclude_types)))
+        with self._lock:
+            schema = self._formatted.get(key)
+            if schema is None:
+                schema = construct_schema(self.structured_schema,
+                                          list(include_types), list(exclude_types))
+                self._formatted[key] = schema
+            return schema
+
+    def corrector_schema(self) -> List[Schema]:
+        return [
+            Schema(el["start"], el["type"], el["end"])
+            for el in self.structured_schema.get("relationships", [])
+        ]
+
+    def corrector(self) -> CypherQueryCorrector:
+        """Shared Cypher corrector built from the snapshot relationships."""
+        with self._lock:
+            if self._corrector is None:
+                self._corrector = MemoizedCypherQueryCorrector(self.corrector_schema())
+            return self._corrector
+
+    def attach(self, graph: GraphStore) -> None:
+        """Bind a graph to the snapshot.
+
+        An empty snapshot is filled from the graph (introspecting it if its
+        schema was not loaded yet), otherwise the graph reuses the snapshot
+        and skips the introspection.
+        """
+        if not self.loaded:
+            if not graph.get_structured_schema:
+                graph.refresh_schema()
+            self.update(graph.get_structured_schema)
+        graph.structured_schema = self.structured_schema
+
+    def refresh(self, graph: GraphStore) -> bool:
+        """Introspect the graph again; return True if the schema changed."""
+        graph.refresh_schema()
+        changed = self.update(graph.get_structured_schema)
+        graph.structured_schema = self.structured_schema
+        if changed:
+            logger.info("Graph schema changed, new fingerprint %s", self.fingerprint)
+        return changed
+
+    def start_background_refresh(self, graph: GraphStore,
+                                 interval: float = 3600.0) -> None:
+        """Refresh the snapshot from `graph` every `interval` seconds."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def _run() -> None:
+            while not self._stop.wait(interval):
+                try:
+                    self.refresh(graph)
+                except Exception as e:
+                    logger.warning("Graph schema refresh failed: %s", e)
+
+        self._thread = threading.Thread(target=_run, name="schema-refresh",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop_background_refresh(self) -> None:
+        self._stop.set()
+
+
+def _stem(word: str) -> str:
+    if len(word) > 3 and word[-1] in "sx":
+        return word[:-1]
+    return word
+
+
+class SchemaIndex:
+    """Question-aware pruning of the schema given to the Cypher prompt.
+
+    Labels are indexed by their french/english aliases (`LABEL_ALIASES`),
+    the words of their name (`NeoNominalPair` -> nominal, pair), their
+    distinctive properties (present in a few labels only) and the words of
+    their relationship types. `schema_for` keeps the labels a question
+    mentions, their `hops`-hop neighbourhood and the relationships between
+    them, and falls back to the whole schema when nothing matches.
+
+    Formatted schemas are memoized by the snapshot per label selection; the
+    index is rebuilt when the snapshot fingerprint changes.
+    """
+
+    def __init__(self, snapshot: SchemaSnapshot,
+                 aliases: Dict[str, List[str]] = LABEL_ALIASES, hops: int = 1,
+                 exclude_types: Sequence[str] = (), max_property_labels: int = 3):
+        """
+        Args:
+            snapshot: schema snapshot the pruned schemas are built from.
+            aliases: label -> words (lowercase, without accents) naming it.
+            hops: size of the neighbourhood added around the matched labels.
+            exclude_types: labels and relationship types never included.
+            max_property_labels: a property is indexed only if at most this
+                number of labels have it.
+        """
+        self.snapshot = snapshot
+        self.aliases = aliases
+        self.hops = hops
+        self.exclude_types = tuple(exclude_types)
+        self.max_property_labels = max_property_labels
+        self._index: Dict[str, Set[str]] = {}
+        self._neighbours: Dict[str, Set[str]] = {}
+        self._indexed_fingerprint: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @property
+    def fingerprint(self) -> str:
+        return fingerprint(self.snapshot.fingerprint, self.hops, self.exclude_types,
+                           sorted(self.aliases.items()))
+
+    def _add(self, word: str, label: str) -> None:
+        word = _stem(word.lower())
+        if word and word not in _SCHEMA_STOP_WORDS:
+            self._index.setdefault(word, set()).add(label)
+
+    def _build(self) -> None:
+        schema = self.snapshot.structured_schema
+        self._index, self._neighbours = {}, {}
+        labels = set(schema.get("node_props", {}))
+        for rel in schema.get("relationships", []):
+            labels.update((rel["start"], rel["end"]))
+            self._neighbours.setdefault(rel["start"], set()).add(rel["end"])
+            self._neighbours.setdefault(rel["end"], set()).add(rel["start"])
+            for word in rel["type"].split("_"):
+                self._add(word, rel["start"])
+                self._add(word, rel["end"])
+
+        for label in labels:
+            for word in self.aliases.get(label, []):
+                self._add(word, label)
+            name = label[3:] if label.startswith("Neo") else label
+            for word in _camel_re.split(name):
+                self._add(word, label)
+
+        owners: Dict[str, Set[str]] = {}
+        for label, props in schema.get("node_props", {}).items():
+            for prop in props:
+                owners.setdefault(prop["property"], set()).add(label)
+        for prop, prop_labels in owners.items():
+            if len(prop_labels) <= self.max_property_labels:
+                for label in prop_labels:
+                    for word in prop.split("_"):
+                        self._add(word, label)
+        self._indexed_fingerprint = self.snapshot.fingerprint
+
+    def _ensure_index(self) -> None:
+        with self._lock:
+            if self._indexed_fingerprint != self.snapshot.fingerprint:
+                self._build()
+
+    def match_labels(self, question: str) -> Set[str]:
+        """Labels mentioned by the question."""
+        self._ensure_index()
+        labels: Set[str] = set()
+        for word in normalize_question(question).split():
+            labels |= self._index.get(_stem(word), set())
+        return labels - set(self.exclude_types)
+
+    def expand(self, labels: Iterable[str]) -> FrozenSet[str]:
+        """Labels plus their `hops`-hop neighbourhood."""
+        selected = set(labels)
+        frontier = set(selected)
+        for _ in range(self.hops):
+            frontier = {n for label in frontier for n in self._neighbours.get(label, ())}
+            frontier -= selected
+            selected |= frontier
+        return frozenset(selected - set(self.exclude_types))
+
+    def schema_for(self, question: str) -> str:
+        """Schema string restricted to the part of the graph the question is about."""
+        labels = self.match_labels(question)
+        if not labels:
+            return self.snapshot.formatted(exclude_types=self.exclude_types)
+        selected = self.expand(labels)
+        rel_types = {rel["type"] for rel in self.snapshot.structured_schema.get("relationships", [])
+                     if rel["start"] in selected and rel["end"] in selected}
+        return self.snapshot.formatted(include_types=sorted(selected | rel_types),
+                                       exclude_types=self.exclude_types)
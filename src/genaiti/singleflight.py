@@ -0,0 +1,129 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+__all__ = ["SingleFlight"]
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Future[Any]"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Concurrent identical calls share one in-flight execution.
+
+        result, shared = await single_flight.ado(key, lambda: answer(question))
+
+    The first caller of a key (the leader) starts the execution; callers
+    arriving while it runs wait for it and all get its result (`shared` is
+    True for them). Nothing is kept once it is over: the next call runs
+    again, and a failure is raised to every waiter without being cached.
+
+    On the async path the execution runs in its own task: a waiter being
+    cancelled (e.g. a user disconnecting) only stops waiting, the others
+    still get the result. The execution is cancelled once no caller waits
+    for it anymore (unless `cancel_orphans` is False).
+    """
+
+    def __init__(self, cancel_orphans: bool = True):
+        """
+        Args:
+            cancel_orphans: cancel an execution left without any waiter.
+        """
+        self.cancel_orphans = cancel_orphans
+        self._futures: Dict[Hashable, Future] = {}
+        self._flights: Dict[Tuple[Any, Hashable], _Flight] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+        self.failures = 0
+        self.orphans = 0
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args: Any,
+           **kwargs: Any) -> Tuple[Any, bool]:
+        """Run `fn(*args, **kwargs)` unless an identical call is in flight.
+
+        Returns:
+            The result and whether it comes from another caller's execution.
+        """
+        with self._lock:
+            future = self._futures.get(key)
+            leader = future is None
+            if leader:
+                future = self._futures[key] = Future()
+                future.set_running_or_notify_cancel()
+                self.leaders += 1
+            else:
+                self.followers += 1
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self._forget(key, future)
+            with self._lock:
+                self.failures += 1
+            future.set_exception(e)
+            raise
+        self._forget(key, future)
+        future.set_result(result)
+        return result, False
+
+    def _forget(self, key: Hashable, future: Future) -> None:
+        with self._lock:
+            if self._futures.get(key) is future:
+                del self._futures[key]
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Await `fn()` unless an identical call is in flight on this event loop.
+
+        Returns:
+            The result and whether it comes from another caller's execution.
+        """
+        flight_key = (asyncio.get_running_loop(), key)
+        with self._lock:
+            flight = self._flights.get(flight_key)
+            shared = flight is not None
+            if shared:
+                self.followers += 1
+            else:
+                flight = _Flight(asyncio.ensure_future(fn()))
+                flight.task.add_done_callback(
+                    lambda task: self._finish(flight_key, flight))
+                self._flights[flight_key] = flight
+                self.leaders += 1
+            flight.waiters += 1
+        try:
+            # a cancelled waiter does not cancel the shared task
+            return await asyncio.shield(flight.task), shared
+        finally:
+            with self._lock:
+                flight.waiters -= 1
+                if flight.waiters == 0 and self.cancel_orphans and not flight.task.done():
+                    # forgotten now: a caller arriving before the task ends starts a new one
+                    if self._flights.get(flight_key) is flight:
+                        del self._flights[flight_key]
+                    flight.task.cancel()
+                    self.orphans += 1
+
+    def _finish(self, flight_key: Tuple[Any, Hashable], flight: _Flight) -> None:
+        with self._lock:
+            if self._flights.get(flight_key) is flight:
+                del self._flights[flight_key]
+            # retrieved here so an orphaned failure is not reported as never retrieved
+            if not flight.task.cancelled() and flight.task.exception() is not None:
+                self.failures += 1
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._futures) + len(self._flights)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"leaders": self.leaders, "followers": self.followers,
+                "failures": self.failures, "orphans": self.orphans,
+                "in_flight": self.in_flight()}
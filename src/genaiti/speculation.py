@@ -0,0 +1,155 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .metrics import SPECULATION_SECONDS, SPECULATIONS, Metrics
+
+__all__ = ["Speculation", "AsyncSpeculation", "SpeculationStats", "speculation_stats"]
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(thread_name_prefix="genaiti-speculative")
+        return _executor
+
+
+class SpeculationStats:
+    """Counters of speculative work: how much was used and how much was wasted.
+
+    With a `Metrics` backend, each outcome is also exported: the number of
+    speculations per outcome (`SPECULATIONS`) and the seconds of speculative
+    work used or wasted (`SPECULATION_SECONDS`).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.launched = 0
+        self.used = 0
+        self.cancelled = 0
+        self.wasted = 0
+        self.wasted_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    def record(self, outcome: str, seconds: float = 0.0,
+               metrics: Optional[Metrics] = None) -> None:
+        if metrics is not None:
+            metrics.increment(SPECULATIONS, outcome=outcome)
+            if seconds:
+                metrics.increment(SPECULATION_SECONDS, seconds, outcome=outcome)
+        with self._lock:
+            if outcome == "launched":
+                self.launched += 1
+            elif outcome == "used":
+                self.used += 1
+                self.saved_seconds += seconds
+            elif outcome == "cancelled":
+                self.cancelled += 1
+                self.wasted_seconds += seconds
+            elif outcome == "wasted":
+                self.wasted += 1
+                self.wasted_seconds += seconds
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "launched": self.launched,
+            "used": self.used,
+            "cancelled": self.cancelled,
+            "wasted": self.wasted,
+            "wasted_seconds": self.wasted_seconds,
+            "saved_seconds": self.saved_seconds,
+        }
+
+
+speculation_stats = SpeculationStats()
+
+
+class Speculation:
+    """A stage started ahead of time, before knowing if its result is needed.
+
+        speculation = Speculation(generate, question)  # runs in the background
+        ...
+        result = speculation.result()   # needed: wait for it
+        speculation.discard()           # not needed: cancel or ignore it
+
+    A speculation discarded before it starts is cancelled. Once started it
+    cannot be interrupted (the remote call is already sent): it finishes in
+    the background, its result is ignored and its duration is counted as
+    wasted work.
+    """
+
+    def __init__(self, fn: Callable[..., Any], *args: Any,
+                 stats: SpeculationStats = speculation_stats,
+                 metrics: Optional[Metrics] = None, **kwargs: Any):
+        self.stats = stats
+        self.metrics = metrics
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.stats.record("launched", metrics=self.metrics)
+        self._future: Future = _get_executor().submit(self._run, fn, *args, **kwargs)
+
+    def _run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        self.started_at = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.finished_at = time.perf_counter()
+
+    def result(self) -> Any:
+        """Wait for the speculative result and count it as used."""
+        waited_at = time.perf_counter()
+        result = self._future.result()
+        # time spent by the stage while the caller was busy elsewhere
+        self.stats.record("used", max(0.0, waited_at - (self.started_at or waited_at)),
+                          self.metrics)
+        return result
+
+    def discard(self) -> None:
+        """Drop the speculative result, cancelling the stage if not started."""
+        if self._future.cancel():
+            self.stats.record("cancelled", metrics=self.metrics)
+            return
+
+        def _account(future: Future) -> None:
+            self.stats.record("wasted", (self.finished_at or 0.0) - (self.started_at or 0.0),
+                              self.metrics)
+
+        self._future.add_done_callback(_account)
+
+
+class AsyncSpeculation:
+    """Event loop version of `Speculation`.
+
+    The stage runs as a task: discarding it cancels the task, which also
+    aborts the pending remote call.
+    """
+
+    def __init__(self, coro: Awaitable[Any], stats: SpeculationStats = speculation_stats,
+                 metrics: Optional[Metrics] = None):
+        self.stats = stats
+        self.metrics = metrics
+        self.started_at = time.perf_counter()
+        self.stats.record("launched", metrics=self.metrics)
+        self._task = asyncio.ensure_future(coro)
+
+    async def result(self) -> Any:
+        """Wait for the speculative result and count it as used."""
+        self.stats.record("used", time.perf_counter() - self.started_at, self.metrics)
+        return await self._task
+
+    def discard(self) -> None:
+        """Drop the speculative result, cancelling the task if still running."""
+        elapsed = time.perf_counter() - self.started_at
+        if self._task.cancel():
+            self.stats.record("cancelled", elapsed, self.metrics)
+        else:
+            self.stats.record("wasted", elapsed, self.metrics)
+            # retrieve the outcome so that a failure is not reported as unhandled
+            if not self._task.cancelled():
+                self._task.exception()
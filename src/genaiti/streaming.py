@@ -0,0 +1,111 @@
+import re
+from typing import List, Pattern
+
+from .utils import get_response_from_generator, qa_re
+
+__all__ = ["ResponseStreamParser", "QA_STREAM_TAG", "ANSWER_MARKERS"]
+
+# tag of the final answer LLM run, the only one streamed to the user
+QA_STREAM_TAG = "genaiti:qa_answer"
+
+# literal forms of the `qa_re`/`resp_re` answer markers
+ANSWER_MARKERS: List[str] = [">Helpful Answer:", ">Réponse utile:", ">>Cypher query::"]
+
+_space_re = re.compile(r"\s+")
+
+
+def _is_partial_marker(text: str, markers: List[str]) -> bool:
+    """Whether the end of `text` could still grow into an answer marker."""
+    start = text.rfind(">")
+    if start == -1:
+        return False
+    tail = _space_re.sub(" ", text[start:])
+    return any(marker.startswith(tail) for marker in markers)
+
+
+class ResponseStreamParser:
+    """Incremental version of `get_response_from_generator` for token streams.
+
+    Tokens are fed as they arrive and the parser returns the part of the
+    answer that can safely be shown. Answer markers (`qa_re`/`resp_re`) and
+    trailers (`info_check`, `remover`) may be split across chunks, so the
+    parser holds back the characters whose meaning depends on what comes
+    next:
+
+    - the beginning of the text while no answer marker was found, up to
+      `lookahead` characters (or longer if it ends with a partial marker),
+    - a trailing `>` or `<` and trailing newlines,
+    - an unfinished `<br` tag,
+    - a line following an empty line (it may end with `Information`).
+
+    The text shown is always consistent with `get_response_from_generator`
+    applied to the text received so far; if a late marker changes the
+    answer, the parser stops emitting and `result` gives the exact answer
+    to display once the generation is over.
+    """
+
+    def __init__(self, sep: Pattern = qa_re, lookahead: int = 32,
+                 markers: List[str] = ANSWER_MARKERS):
+        """
+        Args:
+            sep: answer marker pattern, as given to `get_response_from_generator`.
+            lookahead: number of characters waited for an answer marker
+                before streaming the text as is.
+            markers: literal forms of the markers matched by `sep`.
+        """
+        self.sep = sep
+        self.lookahead = lookahead
+        self.markers = markers
+        self.text = ""
+        self.emitted = ""
+        self.stalled = False
+
+    @property
+    def result(self) -> str:
+        """Exact answer for the text received so far."""
+        return get_response_from_generator(self.text, self.sep)
+
+    def feed(self, chunk: str) -> str:
+        """Add a chunk of generated text; return the new text to display."""
+        self.text += chunk
+        return self._emit(self.text[: self._stable_length()])
+
+    def close(self) -> str:
+        """End of the generation; return the remaining text to display."""
+        return self._emit(self.text)
+
+    def _stable_length(self) -> int:
+        text = self.text
+        if not self.sep.search(text) and (
+            len(text) < self.lookahead or _is_partial_marker(text, self.markers)
+        ):
+            return 0
+
+        # trailing newlines: may become `\n\n\n.+` or `>\n+`/`<\n+`
+        stable = len(text.rstrip("\n"))
+        line_start = text.rfind("\n", 0, stable) + 1
+        line = text[line_start:stable]
+
+        # a line after an empty line may end with `Information`
+        if text.endswith("\n\n", 0, line_start):
+            return len(text[:line_start].rstrip("\n"))
+        # `>`/`<` at the end of a line decide on the next character
+        if line.endswith((">", "<")):
+            stable -= 1
+        # `<br ...>` is removed once closed
+        br_start = line.rfind("<br")
+        if br_start != -1 and ">" not in line[br_start:]:
+            stable = min(stable, line_start + br_start)
+        return stable
+
+    def _emit(self, stable_text: str) -> str:
+        if self.stalled:
+            return ""
+        candidate = get_response_from_generator(stable_text, self.sep).lstrip()
+        if not candidate.startswith(self.emitted):
+            # a late marker changed the answer: wait for the final result
+            self.stalled = True
+            return ""
+        new_text = candidate[len(self.emitted):]
+        self.emitted = candidate
+        return new_text
@@ -1,8 +1,10 @@
 
 import re
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 import json
 
+from langchain_core.runnables.config import run_in_executor
+
 INTERMEDIATE_STEPS_KEY = "intermediate_steps"
 resp_re = re.compile(r">(Helpful\s+Answer|Réponse\s+utile|>Cypher query:):\s+")
 qa_re = re.compile(r">(Helpful\s+Answer|Réponse\s+utile|>Cypher query:):")
@@ -11,18 +13,47 @@ remover = re.compile(r"(<br.+>|>\n+|<\n+)")
 
 __all__ = ["extract_cypher", "get_response_from_generator", "construct_schema",
            "qa_re", "resp_re", "INTERMEDIATE_STEPS_KEY", 
-           "parse_conversation_history"]
+           "parse_conversation_history", "query_graph", "aquery_graph"]
 
 
 def parse_conversation_history(history):
-    history = json.loads(history)
-    formatted_history = ""
-    messages = history.get('messages')
-    for message in messages:
-        formatted_history += f"{message.get('type')}: {message.get('content')}\n"
-    
-    # print(formatted_history)
-    return formatted_history
+    """Format a serialized chat memory (see `history.ConversationHistory` for
+    a buffer that does not re-parse the whole chat at each turn)."""
+    messages = json.loads(history).get('messages') or []
+    return "".join(f"{message.get('type')}: {message.get('content')}\n"
+                   for message in messages)
+
+
+def query_graph(
+    graph: Any, query: str, params: Optional[Dict[str, Any]] = None,
+    limit: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Query a graph, reading at most `limit` records if given.
+
+    Uses the graph `query_head` when available so that the records past
+    `limit` are never transferred.
+    """
+    if limit is None:
+        return graph.query(query, params or {})
+    if hasattr(graph, "query_head"):
+        return graph.query_head(query, params or {}, limit)
+    return graph.query(query, params or {})[:limit]
+
+
+async def aquery_graph(
+    graph: Any, query: str, params: Optional[Dict[str, Any]] = None,
+    limit: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Query a graph without blocking the event loop.
+
+    Uses the graph native `aquery`/`aquery_head` when available, otherwise
+    runs `query_graph` in the default executor.
+    """
+    if limit is None and hasattr(graph, "aquery"):
+        return await graph.aquery(query, params or {})
+    if limit is not None and hasattr(graph, "aquery_head"):
+        return await graph.aquery_head(query, params or {}, limit)
+    return await run_in_executor(None, query_graph, graph, query, params, limit)
 
 
 def extract_cypher(text: str) -> str:
@@ -0,0 +1,123 @@
+import asyncio
+import time
+
+from src.benchmarks.scenarios import build_chain
+from src.genaiti.cache import (
+    GRAPH_VERSION_QUERY,
+    AnswerCache,
+    LRUCache,
+    QueryResultCache,
+    normalize_question,
+)
+
+
+class _VersionedGraph:
+    """Graph counting its queries, with a settable dictionary version marker."""
+
+    def __init__(self):
+        self.last_update = 1
+        self.queries = []
+
+    def query(self, query, params=None):
+        if query == GRAPH_VERSION_QUERY:
+            return [{"total": 1, "last_update": self.last_update}]
+        self.queries.append((query, params))
+        return [{"value": (params or {}).get("value"), "query": len(self.queries)}]
+
+
+def test_lru_cache_evicts_the_least_recently_used_entry():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_cache_entries_expire():
+    cache = LRUCache(ttl=0.05)
+    cache.set("short", 1)
+    cache.set("long", 2, ttl=10)
+    time.sleep(0.06)
+    assert cache.get("short") is None and cache.get("long") == 2
+    assert cache.stats()["expirations"] == 1
+
+
+def test_lru_cache_weight_cap():
+    cache = LRUCache(max_weight=10, weigher=len)
+    assert cache.set("a", "x" * 6)
+    assert cache.set("b", "x" * 6)
+    # over the cap: the oldest entry goes
+    assert cache.get("a") is None and cache.weight == 6
+    # heavier than the cap on its own: never stored, the previous value is dropped
+    assert not cache.set("b", "x" * 11)
+    assert cache.get("b") is None and cache.weight == 0
+
+
+def test_answer_cache_keys_on_the_normalized_question_and_the_identity():
+    assert normalize_question("  Quelle est la TRADUCTION du mot mbɔ ? ") == \
+        "quelle est la traduction du mot mbɔ"
+    cache = AnswerCache()
+    cache.set("cypher", "Traduction de mbwa ?", "model-a", "MATCH (w) RETURN w")
+    assert cache.get("cypher", "traduction de  mbwa", "model-a") == "MATCH (w) RETURN w"
+    assert cache.get("cypher", "traduction de mbwa", "model-b") is None
+    assert cache.get("answer", "traduction de mbwa", "model-a") is None
+
+
+def test_chain_serves_a_repeated_question_from_the_answer_cache():
+    chain = build_chain(llm_latency=0.0, graph_latency=0.0, answer_cache=AnswerCache())
+    first = chain.invoke({"query": "Quelle est la traduction du mot mbɔ ?"})
+    calls = dict(chain.qa_chain.llm.calls)
+    queries = chain.graph.queries
+    second = chain.invoke({"query": "quelle est la traduction du mot mbɔ"})
+    assert second["result"] == first["result"]
+    assert chain.qa_chain.llm.calls == calls and chain.graph.queries == queries
+
+
+def test_query_cache_keys_on_the_canonical_statement_and_the_parameters():
+    graph = _VersionedGraph()
+    cache = QueryResultCache()
+    first = cache.query(graph, "MATCH (w:Word {value: $value})\nRETURN w;", {"value": "mbwa"})
+    assert cache.query(graph, "MATCH (w:Word {value: $value})  RETURN w",
+                       {"value": "mbwa"}) == first
+    cache.query(graph, "MATCH (w:Word {value: $value}) RETURN w", {"value": "mbɔ"})
+    # whitespace in strings is significant
+    cache.query(graph, "MATCH (w:Word {value: 'a  b'}) RETURN w")
+    cache.query(graph, "MATCH (w:Word {value: 'a b'}) RETURN w")
+    assert len(graph.queries) == 4
+
+
+def test_query_cache_is_dropped_when_the_graph_version_changes():
+    graph = _VersionedGraph()
+    cache = QueryResultCache(version_check_interval=0.0)
+    query = "MATCH (w:Word) RETURN w"
+    cache.query(graph, query)
+    cache.query(graph, query)
+    graph.last_update = 2
+    cache.query(graph, query)
+    assert len(graph.queries) == 2
+    cache.bump()
+    asyncio.run(cache.aquery(graph, query))
+    assert len(graph.queries) == 3
+
+
+def test_query_cache_version_check_is_throttled():
+    graph = _VersionedGraph()
+    cache = QueryResultCache(version_check_interval=60.0)
+    query = "MATCH (w:Word) RETURN w"
+    cache.query(graph, query)
+    graph.last_update = 2
+    # not checked again before the interval: the cached result is served
+    cache.query(graph, query)
+    assert len(graph.queries) == 1
+
+
+def test_query_cache_does_not_keep_results_over_the_memory_cap():
+    graph = _VersionedGraph()
+    cache = QueryResultCache(max_bytes=64)
+    query = "MATCH (w:Word {value: $value}) RETURN w"
+    cache.query(graph, query, {"value": "x" * 100})
+    cache.query(graph, query, {"value": "x" * 100})
+    assert len(graph.queries) == 2 and cache.stats()["weight"] == 0
@@ -0,0 +1,67 @@
+from src.genaiti.context import ContextCompactor, estimate_tokens
+
+SCHEMA = {"node_props": {
+    "NeoArticle": [{"property": name} for name in
+                   ("value", "translation", "html_version", "xml_version", "raw_data")],
+    "NeoDictionary": [{"property": name} for name in ("name", "description", "authors_ref")],
+}}
+
+
+def _article(value, **props):
+    return {"value": value, "translation": f"translation of {value}",
+            "html_version": "<p>" + "x" * 2000 + "</p>", **props}
+
+
+def test_duplicates_are_removed_and_heavy_properties_dropped():
+    compactor = ContextCompactor(SCHEMA)
+    rows = [{"a": _article("mbwa")}, {"a": _article("mbwa")}, {"a": _article("bato")}]
+    text, report = compactor.compact(rows)
+    assert report["duplicates"] == 1 and report["rows_kept"] == 2
+    assert "html_version" not in text and "xxxx" not in text
+    assert report["saved_tokens"] > 0
+
+
+def test_constant_columns_are_printed_once():
+    dictionary = {"name": "duala", "description": "Dictionnaire duala-français"}
+    rows = [{"a": _article(value), "d": dictionary} for value in ("mbwa", "bato", "ngando")]
+    text, _ = ContextCompactor(SCHEMA).compact(rows)
+    lines = text.split("\n")
+    assert lines[:2] == ["d.name: duala", "d.description: Dictionnaire duala-français"]
+    assert lines[2] == "a.value | a.translation"
+    assert lines[3:] == ["mbwa | translation of mbwa", "bato | translation of bato",
+                         "ngando | translation of ngando"]
+
+
+def test_long_values_are_truncated():
+    dictionary = {"name": "duala", "description": "d" * 1000}
+    text, _ = ContextCompactor(SCHEMA, max_value_chars=1000).compact([{"d": dictionary}])
+    # NeoDictionary.description is limited to 300 characters
+    assert "d" * 299 + "…" in text and "d" * 300 not in text
+    # any value to max_value_chars
+    text, _ = ContextCompactor(SCHEMA).compact([{"d": dictionary}])
+    assert "d" * 199 + "…" in text and "d" * 200 not in text
+
+
+def test_rows_stop_at_the_budget():
+    rows = [{"a": _article(f"word{i}")} for i in range(200)]
+    text, report = ContextCompactor(SCHEMA, max_tokens=100).compact(rows)
+    assert estimate_tokens(text) <= 100 + 10
+    assert 0 < report["rows_kept"] < 200
+    assert text.endswith(f"({200 - report['rows_kept']} more rows not shown)")
+
+
+def test_first_row_is_kept_when_over_budget():
+    node = {f"property_{i}": "v" * 200 for i in range(20)}
+    text, report = ContextCompactor(max_tokens=64).compact([{"n": node}])
+    assert report["rows_kept"] == 1
+    assert text.split("\n")[1].startswith("v" * 50)
+    assert "more rows not shown" not in text
+
+
+def test_constant_columns_are_bounded():
+    node = {f"property_{i}": f"value {i} " + "c" * 150 for i in range(20)}
+    rows = [{"n": node, "i": i} for i in range(3)]
+    text, report = ContextCompactor(max_tokens=200).compact(rows)
+    assert "more constant columns not shown" in text
+    assert report["rows_kept"] == 3
+    assert estimate_tokens(text) <= 200
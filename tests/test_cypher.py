@@ -0,0 +1,97 @@
+import pytest
+
+from src.genaiti.cypher import (alias_return_items, build_unwind_query, enforce_limit,
+                                parameterize_cypher)
+
+
+@pytest.mark.parametrize("template, expected", [
+    # unaliased expressions get their own text as alias
+    ("MATCH (w:Word {value: $lit0}) RETURN w.translation LIMIT 10",
+     "MATCH (w:Word {value: genaiti_row.lit0}) RETURN w.translation AS `w.translation` LIMIT 10"),
+    ("MATCH (a:Article {value: $lit0}) RETURN a.value, count(a) ORDER BY a.value",
+     "MATCH (a:Article {value: genaiti_row.lit0}) "
+     "RETURN a.value AS `a.value`, count(a) AS `count(a)` ORDER BY a.value"),
+    # aliased items and plain variables are kept
+    ("MATCH (w:Word {value: $lit0}) RETURN w.translation AS translation, w",
+     "MATCH (w:Word {value: genaiti_row.lit0}) RETURN w.translation AS translation, w"),
+    ("MATCH (w:Word {value: $lit0}) RETURN DISTINCT w",
+     "MATCH (w:Word {value: genaiti_row.lit0}) RETURN DISTINCT w"),
+])
+def test_build_unwind_query_aliases_the_returned_expressions(template, expected):
+    query = build_unwind_query(template, ["lit0"])
+    assert query == ("UNWIND $batch AS genaiti_row\nCALL {\nWITH genaiti_row\n"
+                     f"{expected}\n}}\nRETURN *")
+
+
+def test_parameters_in_return_items_are_not_merged():
+    # the column name of `$lit1` would be the value of each lookup
+    assert alias_return_items("MATCH (a) WHERE a.value = $lit0 RETURN a.value, $lit1") is None
+    with pytest.raises(ValueError):
+        build_unwind_query("MATCH (a) RETURN a.value + $lit0", ["lit0"])
+
+
+def test_strings_and_escaped_names_are_left_alone():
+    query = build_unwind_query("MATCH (w {value: $lit0}) WHERE w.note = '$lit0' RETURN w.`$odd`",
+                               ["lit0"])
+    assert "w.note = '$lit0'" in query
+    assert "RETURN w.`$odd` AS `w.``$odd```" in query
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("MATCH (a) RETURN a", "MATCH (a) RETURN a\nLIMIT 10"),
+    ("MATCH (a) RETURN a;", "MATCH (a) RETURN a\nLIMIT 10"),
+    ("MATCH (a) RETURN a LIMIT 50", "MATCH (a) RETURN a LIMIT 10"),
+    ("MATCH (a) RETURN a LIMIT 3", "MATCH (a) RETURN a LIMIT 3"),
+    ("MATCH (a) RETURN a ORDER BY a.value SKIP 2", "MATCH (a) RETURN a ORDER BY a.value SKIP 2\nLIMIT 10"),
+    # keywords in strings and comments are not clauses
+    ("MATCH (a) WHERE a.value = 'x LIMIT 1000' RETURN a",
+     "MATCH (a) WHERE a.value = 'x LIMIT 1000' RETURN a\nLIMIT 10"),
+    ("MATCH (a) WHERE a.value = 'it\\'s; RETURN' RETURN a // LIMIT 1000",
+     "MATCH (a) WHERE a.value = 'it\\'s; RETURN' RETURN a // LIMIT 1000\nLIMIT 10"),
+    ("MATCH (a) CALL { WITH a MATCH (a)--(b) RETURN b LIMIT 100 } RETURN b",
+     "MATCH (a) CALL { WITH a MATCH (a)--(b) RETURN b LIMIT 100 } RETURN b\nLIMIT 10"),
+    # rows capped by the caller
+    ("MATCH (a) RETURN a LIMIT 2+3", None),
+    ("MATCH (a) RETURN a LIMIT $n", None),
+    ("MATCH (a) RETURN a UNION MATCH (b) RETURN b", None),
+    ("MATCH (a) RETURN a; MATCH (b) RETURN b", None),
+    ("MATCH (a) SET a.seen = true", None),
+    ("MATCH (a) RETURN a.value AS value WITH value RETURN count(value)",
+     "MATCH (a) RETURN a.value AS value WITH value RETURN count(value)\nLIMIT 10"),
+])
+def test_enforce_limit(query, expected):
+    assert enforce_limit(query, 10) == expected
+
+
+@pytest.mark.parametrize("query, expected, params", [
+    ("MATCH (a:Article {value: 'mbwa'}) WHERE a.rank > 2.5 RETURN a.value AS value",
+     "MATCH (a:Article {value: $lit0}) WHERE a.rank > $lit1 RETURN a.value AS value",
+     {"lit0": "mbwa", "lit1": 2.5}),
+    # identical values share a parameter, whatever their quotes
+    ("MATCH (a {value: 'mbwa'})--(b {value: \"mbwa\"}) RETURN b",
+     "MATCH (a {value: $lit0})--(b {value: $lit0}) RETURN b", {"lit0": "mbwa"}),
+    # escapes are decoded
+    ("MATCH (a {value: 'it\\'s caf\\u00e9 \\U0001F600\\n'}) RETURN a",
+     "MATCH (a {value: $lit0}) RETURN a", {"lit0": "it's caf\u00e9 \U0001F600\n"}),
+    # an invalid escape is left for Neo4j to report
+    ("MATCH (a {value: '\\UFFFFFFFF'}) RETURN a", "MATCH (a {value: '\\UFFFFFFFF'}) RETURN a", {}),
+    # comments are dropped
+    ("MATCH (a) // the articles\nWHERE a.value = 'x' /* 'y' */ RETURN a",
+     "MATCH (a) WHERE a.value = $lit0 RETURN a", {"lit0": "x"}),
+    # bounds, SKIP and LIMIT stay inline
+    ("MATCH (a)-[*1..3]->(b) RETURN b SKIP 1 LIMIT 2+3",
+     "MATCH (a)-[*1..3]->(b) RETURN b SKIP 1 LIMIT 2+3", {}),
+    # unaliased items are named by their text
+    ("MATCH (a {value: 'x'}) RETURN a.value, 1, 'x', a.rank + 2, 'y' AS y",
+     "MATCH (a {value: $lit0}) RETURN a.value, 1, 'x', a.rank + 2, $lit1 AS y",
+     {"lit0": "x", "lit1": "y"}),
+    ("MATCH (a {value: 'x'}) RETURN DISTINCT 'x'",
+     "MATCH (a {value: $lit0}) RETURN DISTINCT 'x'", {"lit0": "x"}),
+    # already parameterized
+    ("MATCH (a {value: $value}) RETURN a LIMIT $limit",
+     "MATCH (a {value: $value}) RETURN a LIMIT $limit", {}),
+    ("MATCH (a {value: $lit0, rank: 2}) RETURN a",
+     "MATCH (a {value: $lit0, rank: $lit1}) RETURN a", {"lit1": 2}),
+])
+def test_parameterize_cypher(query, expected, params):
+    assert parameterize_cypher(query) == (expected, params)
@@ -0,0 +1,56 @@
+import json
+import os
+
+import numpy as np
+
+from src.genaiti.cache import normalize_question
+from src.genaiti.examples import ExampleStore
+
+CYPHER = "MATCH (w:Word {name: 'mbɔ'}) RETURN w.translation"
+
+
+def test_direct_hits_only_reuse_verified_examples():
+    store = ExampleStore()
+    store.add("What is the translation of mbɔ?", CYPHER)
+    assert store.direct_hit("what is the translation of mbɔ") is None
+    store.add("What is the translation of mbɔ?", CYPHER, verified=True, source="operator")
+    assert store.direct_hit("what is the translation of mbɔ") == CYPHER
+
+
+def test_examples_are_written_by_the_flush(tmp_path):
+    path = os.path.join(tmp_path, "examples.json")
+    store = ExampleStore(path=path, flush_interval=60)
+    store.add("What is the translation of mbɔ?", CYPHER)
+    assert not os.path.exists(path)
+    store.flush()
+    with open(path, encoding="utf-8") as f:
+        assert [example["cypher"] for example in json.load(f)] == [CYPHER]
+
+
+def _reference_scores(store, question):
+    """Cosine similarities of the tf-idf vectors computed from scratch."""
+    counts = np.stack([store._term_counts(normalize_question(e["question"]))
+                       for e in store.examples])
+    idf = np.log((1 + len(counts)) / (1 + (counts > 0).sum(axis=0))) + 1
+
+    def _weights(c):
+        w = np.log1p(c) * idf
+        return w / np.linalg.norm(w, axis=-1, keepdims=True)
+
+    query = store._term_counts(normalize_question(question))
+    return _weights(counts) @ _weights(query)
+
+
+def test_incremental_index_matches_a_rebuild():
+    store = ExampleStore(max_examples=20, min_similarity=0.0)
+    words = ["mbɔ", "mbwa", "nyama", "kalata", "ndabo", "mutu", "bato", "mai"]
+    for i, word in enumerate(words * 3):
+        store.add(f"Quelle est la traduction {i} du mot {word} ?", f"RETURN {i}")
+    store.remove("Quelle est la traduction 3 du mot kalata ?")
+    assert len(store) == 20
+
+    question = "traduction du mot nyama"
+    expected = _reference_scores(store, question)
+    found = {e["question"]: score for score, e in store.search(question, k=len(store))}
+    for example, score in zip(store.examples, expected):
+        assert abs(found[example["question"]] - score) < 1e-4
@@ -0,0 +1,40 @@
+import time
+
+import pytest
+
+from src.benchmarks.scenarios import build_chain
+from src.genaiti.graph_chain import GraphCypherQAChain
+from src.genaiti.metrics import PrometheusMetrics
+from src.genaiti.speculation import speculation_stats
+
+
+def test_speculation_discarded_when_the_checker_fails(monkeypatch):
+    def _failing_checker(self, question, callbacks):
+        raise RuntimeError("checker endpoint down")
+
+    monkeypatch.setattr(GraphCypherQAChain, "_ask_checker", _failing_checker)
+    chain = build_chain(llm_latency=0.01, graph_latency=0.0, speculative=True)
+    before = speculation_stats.stats()
+    with pytest.raises(RuntimeError):
+        chain.invoke({"query": "Quelle est la traduction du mot mbɔ ?"})
+    # a started speculation is accounted as wasted once it finishes
+    deadline = time.monotonic() + 2
+    while time.monotonic() < deadline:
+        after = speculation_stats.stats()
+        if after["cancelled"] + after["wasted"] > before["cancelled"] + before["wasted"]:
+            break
+        time.sleep(0.01)
+    assert after["launched"] == before["launched"] + 1
+    assert after["cancelled"] + after["wasted"] == before["cancelled"] + before["wasted"] + 1
+    assert after["used"] == before["used"]
+
+
+def test_speculation_outcomes_are_exported_as_metrics():
+    metrics = PrometheusMetrics()
+    chain = build_chain(llm_latency=0.01, graph_latency=0.0, speculative=True, metrics=metrics)
+    # not routed locally: the checker LLM decides while the Cypher is generated
+    chain.invoke({"query": "Quelle est la traduction du mot mbɔ ?"})
+    text = metrics.render()
+    assert 'genaiti_speculations_total{outcome="launched"} 1' in text
+    assert 'genaiti_speculations_total{outcome="used"} 1' in text
+    assert "genaiti_speculation_seconds_total" in text
@@ -0,0 +1,144 @@
+import asyncio
+import threading
+
+import neo4j
+
+from src.genaiti.graphs import AsyncNeo4jGraph
+
+
+class _Record:
+    def __init__(self, value):
+        self.value = value
+
+    def data(self):
+        return {"value": self.value}
+
+
+class _Result:
+    """Result of 100 records counting how many were pulled from the server."""
+
+    def __init__(self):
+        self.consumed = 0
+
+    def _next(self):
+        if self.consumed == 100:
+            raise StopIteration
+        self.consumed += 1
+        return _Record(self.consumed)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self._next()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return self._next()
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class _Session:
+    def __init__(self, result):
+        self.result = result
+
+    def run(self, query, params):
+        return self.result
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class _AsyncSession(_Session):
+    async def run(self, query, params):
+        return self.result
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class _Driver:
+    def __init__(self, session):
+        self._session = session
+
+    def session(self, **kwargs):
+        return self._session
+
+
+def _graph(result):
+    graph = AsyncNeo4jGraph.__new__(AsyncNeo4jGraph)
+    graph._driver = _Driver(_Session(result))
+    graph._database = "neo4j"
+    graph.timeout = None
+    graph.sanitize = False
+    return graph
+
+
+def test_query_head_consumes_limit_records():
+    result = _Result()
+    rows = _graph(result).query_head("MATCH (n) RETURN n", limit=10)
+    assert [row["value"] for row in rows] == list(range(1, 11))
+    assert result.consumed == 10
+
+
+def test_aquery_head_consumes_limit_records():
+    result = _Result()
+    graph = _graph(result)
+
+    async def _head():
+        graph._async_drivers = {asyncio.get_running_loop(): _Driver(_AsyncSession(result))}
+        graph._async_lock = threading.Lock()
+        return await graph.aquery_head("MATCH (n) RETURN n", limit=10)
+
+    rows = asyncio.run(_head())
+    assert len(rows) == 10
+    assert result.consumed == 10
+
+
+class _AsyncDriver(_Driver):
+    def __init__(self):
+        super().__init__(_AsyncSession(_Result()))
+        self.loop = asyncio.get_running_loop()
+        self.closed = False
+
+    def session(self, **kwargs):
+        # a driver used from another loop than its own fails
+        assert asyncio.get_running_loop() is self.loop and not self.closed
+        return super().session(**kwargs)
+
+    async def close(self):
+        self.closed = True
+
+
+def test_async_driver_per_event_loop(monkeypatch):
+    drivers = []
+
+    def _driver(url, auth):
+        drivers.append(_AsyncDriver())
+        return drivers[-1]
+
+    monkeypatch.setattr(neo4j.AsyncGraphDatabase, "driver", _driver)
+    graph = _graph(_Result())
+    graph._async_driver_args = ("bolt://localhost:7687", ("neo4j", "password"))
+    graph._async_drivers = {}
+    graph._async_lock = threading.Lock()
+
+    async def _query_and_close():
+        await graph.aquery_head("MATCH (n) RETURN n", limit=2)
+        await graph.aclose()
+
+    # e.g. two batch_questions calls, each on its own loop
+    asyncio.run(_query_and_close())
+    asyncio.run(_query_and_close())
+    assert len(drivers) == 2 and all(driver.closed for driver in drivers)
+    assert graph._async_drivers == {}
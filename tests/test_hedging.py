@@ -0,0 +1,47 @@
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.llms import LLM
+from langchain_core.prompts import PromptTemplate
+
+from src.genaiti.cache import llm_chain_fingerprint
+from src.genaiti.hedging import HedgedLLM
+
+
+class _EndpointLLM(LLM):
+    """Stands for a HuggingFaceEndpoint: its generation parameters in `_default_params`."""
+
+    endpoint_url: str
+    temperature: float = 0.1
+    top_k: int = 10
+
+    @property
+    def _llm_type(self) -> str:
+        return "endpoint"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"endpoint_url": self.endpoint_url}
+
+    @property
+    def _default_params(self) -> Dict[str, Any]:
+        return {"temperature": self.temperature, "top_k": self.top_k}
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, **kwargs: Any) -> str:
+        return prompt
+
+
+class _Chain:
+    def __init__(self, llm):
+        self.llm = llm
+        self.prompt = PromptTemplate.from_template("{question}")
+
+
+def _hedged(temperature: float) -> HedgedLLM:
+    return HedgedLLM(llms=[_EndpointLLM(endpoint_url=f"http://localhost:8080/{name}",
+                                        temperature=temperature)
+                           for name in ("primary", "backup")])
+
+
+def test_fingerprint_depends_on_the_generation_parameters():
+    assert llm_chain_fingerprint(_Chain(_hedged(0.1))) != llm_chain_fingerprint(_Chain(_hedged(0.9)))
+    assert llm_chain_fingerprint(_Chain(_hedged(0.1))) == llm_chain_fingerprint(_Chain(_hedged(0.1)))
@@ -0,0 +1,84 @@
+import asyncio
+
+from src.genaiti.history import AI, HUMAN, ConversationHistory, steps_page_loader, thread_messages
+
+
+def _words(text: str) -> int:
+    return len(text.split())
+
+
+def _history(**kwargs) -> ConversationHistory:
+    return ConversationHistory(token_counter=_words, **kwargs)
+
+
+def test_oldest_turns_are_evicted_past_the_budget():
+    history = _history(max_tokens=10)
+    for i in range(4):
+        history.add_user_message(f"question {i}")
+    # 3 words per turn ("human: question i")
+    assert history.render() == "human: question 1\nhuman: question 2\nhuman: question 3\n"
+    assert history.tokens == 9 and history.stats()["evicted_turns"] == 1
+    # the last turn is kept whatever its size
+    history.add_ai_message(" ".join(["mot"] * 20))
+    assert len(history) == 1 and history.tokens == 21
+
+
+def test_long_turns_are_truncated():
+    history = _history(max_turn_tokens=5)
+    history.add_ai_message(" ".join(["mot"] * 100))
+    assert history.tokens < 10 and len(history.render()) < 40
+
+
+def test_evicted_turns_are_folded_into_the_summary():
+    seen = []
+
+    def summarizer(summary, lines):
+        seen.append((summary, lines))
+        return f"{summary} [{lines.strip()}]".strip()
+
+    history = _history(max_tokens=6, summarizer=summarizer)
+    history.load([{"type": HUMAN, "content": "bonjour"}, {"type": AI, "content": "salut"},
+                  {"type": HUMAN, "content": "mbwa ?"}, {"type": AI, "content": "chien"}])
+    assert history.needs_summary
+    history.summarize()
+    assert seen == [("", "human: bonjour\nai: salut\n")]
+    assert history.render() == "summary: [human: bonjour ai: salut]\nhuman: mbwa ?\nai: chien\n"
+    assert not history.needs_summary
+
+
+def _steps(count: int):
+    steps = []
+    for i in range(count):
+        steps.append({"type": "user_message", "output": f"q{i}", "parentId": None})
+        steps.append({"type": "run", "output": "tool", "parentId": "run"})
+        steps.append({"type": "assistant_message", "output": f"a{i}", "parentId": None})
+    return steps
+
+
+def test_thread_messages_pages_the_root_messages_backwards():
+    steps = _steps(3)
+    messages, cursor = thread_messages(steps, count=3)
+    assert messages == [{"type": AI, "content": "a1"}, {"type": HUMAN, "content": "q2"},
+                        {"type": AI, "content": "a2"}]
+    # child steps are skipped
+    messages, cursor = thread_messages(steps, before=cursor, count=3)
+    assert [m["content"] for m in messages] == ["q0", "a0", "q1"] and cursor is None
+
+
+def test_resumed_history_pages_older_messages_while_the_window_has_room():
+    steps = _steps(10)
+    pages = []
+    load = steps_page_loader(steps)
+
+    def loader(before, count):
+        pages.append(before)
+        return load(before, count)
+
+    last, cursor = thread_messages(steps, count=2)
+    history = _history(max_tokens=14).resume(last, cursor, loader)
+    assert history.has_older
+    added = asyncio.run(history.aload_older(count=2))
+    # 2 words per turn: 7 turns fit
+    assert added == 5 and len(history) == 7 and not history.has_older
+    assert history.messages()[0] == {"type": AI, "content": "a6"}
+    assert len(pages) == 3
@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+import pytest
+
+from src.genaiti.local_llm import LocalModelPool
+
+
+def _fake_model(model_path, prompt_cache_bytes=0, **kwargs):
+    def generate(prompt, stream=True, **params):
+        for word in prompt.split():
+            yield {"choices": [{"text": word}]}
+    return generate
+
+
+def test_failing_sink_does_not_kill_the_worker():
+    pool = LocalModelPool(instances=1, loader=_fake_model)
+    received = []
+
+    def closed_loop_sink(text):
+        received.append(text)
+        raise RuntimeError("Event loop is closed")
+
+    first = pool.submit("model.gguf", "le mot mbɔ", {}, closed_loop_sink)
+    assert first.result(timeout=2) == "lemotmbɔ"
+    # dropped after its first failure
+    assert received == ["le"]
+    # the only instance still answers
+    second = pool.submit("model.gguf", "bonjour", {})
+    assert second.result(timeout=2) == "bonjour"
+
+
+def test_async_submit_loads_the_model_off_the_event_loop():
+    loads = []
+
+    def slow_model(model_path, prompt_cache_bytes=0, **kwargs):
+        loads.append(model_path)
+        time.sleep(0.2)
+        return _fake_model(model_path)
+
+    async def scenario():
+        pool = LocalModelPool(instances=1, loader=slow_model)
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.ensure_future(ticker())
+        completions = await asyncio.gather(
+            *[asyncio.wrap_future(await pool.asubmit("model.gguf", "bonjour", {}))
+              for _ in range(2)])
+        task.cancel()
+        return completions, ticks
+
+    completions, ticks = asyncio.run(scenario())
+    assert completions == ["bonjour", "bonjour"]
+    assert loads == ["model.gguf"]
+    # the loop kept running while the model loaded
+    assert ticks >= 5
+
+
+def test_failed_load_is_remembered():
+    loads = []
+
+    def missing_model(model_path, prompt_cache_bytes=0, **kwargs):
+        loads.append(model_path)
+        raise ValueError(f"{model_path} does not exist")
+
+    pool = LocalModelPool(instances=1, loader=missing_model)
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            pool.submit("missing.gguf", "bonjour", {})
+    with pytest.raises(ValueError):
+        asyncio.run(pool.asubmit("missing.gguf", "bonjour", {}))
+    assert loads == ["missing.gguf"]
+    assert pool.stats() == {}
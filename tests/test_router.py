@@ -0,0 +1,22 @@
+from src.genaiti.router import QuestionRouter
+from src.genaiti.schema import SchemaSnapshot
+
+
+def test_snapshot_labels_reach_the_lexicon():
+    # fresh deployment: no snapshot file yet
+    snapshot = SchemaSnapshot()
+    router = QuestionRouter.from_snapshot(snapshot)
+    assert "pair" not in router.data_vocabulary
+    assert router.lexicon_score("pairs of mbwa") == 0
+
+    # schema read from the graph when the first session attaches it
+    snapshot.update({"node_props": {"NeoNominalPair": [], "NeoRadical": []},
+                     "rel_props": {}, "relationships": []}, save=False)
+    assert router.lexicon_score("pairs of mbwa") == 1
+    assert {"nominal", "pair", "radical"} <= router.data_vocabulary
+
+
+def test_routes_obvious_questions_without_the_checker():
+    router = QuestionRouter()
+    assert router.route("Bonjour, comment tu vas ?") is False
+    assert router.route("Combien de dictionnaires as-tu ?") is True
@@ -0,0 +1,159 @@
+import asyncio
+import time
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+import pytest
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+from src.genaiti.scheduler import (
+    PRIORITY_BATCH,
+    PRIORITY_CHECKER,
+    PRIORITY_INTERACTIVE,
+    LLMScheduler,
+    ScheduledLLM,
+    TokenBucket,
+)
+
+
+class _HTTPError(Exception):
+    """Stands for a requests/huggingface_hub HTTP error."""
+
+    def __init__(self, status: int, retry_after: Optional[str] = None):
+        super().__init__(f"HTTP {status}")
+        headers = {"Retry-After": retry_after} if retry_after is not None else {}
+        self.response = SimpleNamespace(status_code=status, headers=headers)
+
+
+class _RateLimitedLLM(LLM):
+    """Endpoint answering the first `rejections` requests with an HTTP 429."""
+
+    rejections: int = 1
+    retry_after: str = "0.05"
+    status: int = 429
+    requests: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "rate-limited"
+
+    def _admit(self) -> None:
+        self.requests += 1
+        if self.requests <= self.rejections:
+            raise _HTTPError(self.status, self.retry_after)
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, **kwargs: Any) -> str:
+        self._admit()
+        return "mbwa signifie chien"
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None,
+                **kwargs: Any) -> Iterator[GenerationChunk]:
+        self._admit()
+        for word in ("mbwa ", "signifie ", "chien"):
+            yield GenerationChunk(text=word)
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, **kwargs: Any) -> str:
+        return self._call(prompt, stop)
+
+    async def _astream(self, prompt: str, stop: Optional[List[str]] = None,
+                       **kwargs: Any) -> AsyncIterator[GenerationChunk]:
+        for chunk in self._stream(prompt, stop):
+            yield chunk
+
+
+def _scheduled(llm: LLM, streaming: bool = False, **kwargs: Any) -> ScheduledLLM:
+    # the jittered backoff is negligible next to the Retry-After delay
+    scheduler = LLMScheduler(backoff_base=0.001, **kwargs)
+    return ScheduledLLM(llm=llm, endpoint="endpoint", scheduler=scheduler, streaming=streaming)
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_429_is_retried_after_the_retry_after_delay(streaming, asynchronous):
+    endpoint = _RateLimitedLLM(rejections=2)
+    llm = _scheduled(endpoint, streaming)
+    started = time.perf_counter()
+    if asynchronous:
+        answer = asyncio.run(llm.ainvoke("mbwa ?"))
+    else:
+        answer = llm.invoke("mbwa ?")
+    elapsed = time.perf_counter() - started
+    assert answer == "mbwa signifie chien"
+    assert endpoint.requests == 3
+    assert elapsed >= 2 * 0.05
+    stats = llm.scheduler.stats()["endpoint"]
+    assert stats["retries"] == 2 and stats["rate_limited"] == 2 and stats["active"] == 0
+
+
+def test_429_is_raised_after_max_retries():
+    endpoint = _RateLimitedLLM(rejections=10, retry_after="0")
+    llm = _scheduled(endpoint, max_retries=2)
+    with pytest.raises(_HTTPError):
+        llm.invoke("mbwa ?")
+    assert endpoint.requests == 3
+    assert llm.scheduler.stats()["endpoint"]["active"] == 0
+
+
+def test_other_errors_are_not_retried():
+    endpoint = _RateLimitedLLM(status=503)
+    llm = _scheduled(endpoint)
+    with pytest.raises(_HTTPError):
+        llm.invoke("mbwa ?")
+    assert endpoint.requests == 1
+
+
+def test_waiters_are_admitted_by_priority_then_arrival():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1)
+        order = []
+
+        async def call(name, priority):
+            async with scheduler.aadmit("endpoint", priority):
+                order.append(name)
+
+        async with scheduler.aadmit("endpoint"):
+            tasks = []
+            for name, priority in [("batch", PRIORITY_BATCH), ("qa", PRIORITY_INTERACTIVE),
+                                   ("checker", PRIORITY_CHECKER), ("cypher", PRIORITY_INTERACTIVE)]:
+                tasks.append(asyncio.ensure_future(call(name, priority)))
+                # queued in this order
+                await asyncio.sleep(0)
+            assert scheduler.stats()["endpoint"]["queued"] == 4
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == ["checker", "qa", "cypher", "batch"]
+
+
+def test_waiter_cancelled_once_granted_hands_its_slot_over():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1)
+
+        async def call():
+            async with scheduler.aadmit("endpoint"):
+                return True
+
+        holder = scheduler.aadmit("endpoint")
+        await holder.__aenter__()
+        cancelled = asyncio.ensure_future(call())
+        waiting = asyncio.ensure_future(call())
+        await asyncio.sleep(0)
+        # the slot goes to `cancelled`, which is cancelled before it runs again
+        await holder.__aexit__(None, None, None)
+        cancelled.cancel()
+        admitted = await asyncio.wait_for(waiting, timeout=1.0)
+        await asyncio.gather(cancelled, return_exceptions=True)
+        return admitted, cancelled.cancelled(), scheduler.stats()["endpoint"]
+
+    admitted, cancelled, stats = asyncio.run(scenario())
+    assert admitted and cancelled
+    assert stats["active"] == 0 and stats["queued"] == 0
+
+
+def test_token_bucket_spaces_calls_beyond_the_burst():
+    bucket = TokenBucket(rate=10, burst=2)
+    delays = [bucket.reserve() for _ in range(4)]
+    assert delays[:2] == [0.0, 0.0]
+    assert delays[2] == pytest.approx(0.1, abs=0.01)
+    assert delays[3] == pytest.approx(0.2, abs=0.01)
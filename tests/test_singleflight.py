@@ -0,0 +1,48 @@
+import asyncio
+
+from src.genaiti.singleflight import SingleFlight
+
+
+def test_new_caller_after_orphan_cancel_runs_again():
+    async def scenario():
+        single_flight = SingleFlight()
+        started = asyncio.Event()
+        calls = []
+
+        async def answer():
+            calls.append(1)
+            started.set()
+            await asyncio.sleep(0.05)
+            return len(calls)
+
+        waiter = asyncio.ensure_future(single_flight.ado("question", answer))
+        await started.wait()
+        waiter.cancel()
+        # one loop iteration: the waiter leaves and cancels the orphaned task,
+        # which is not done yet (its done callback runs later)
+        await asyncio.sleep(0)
+        assert waiter.done()
+        result, shared = await single_flight.ado("question", answer)
+        return result, shared, single_flight.stats()
+
+    result, shared, stats = asyncio.run(scenario())
+    assert (result, shared) == (2, False)
+    assert stats["orphans"] == 1 and stats["leaders"] == 2 and stats["in_flight"] == 0
+
+
+def test_followers_share_the_result():
+    async def scenario():
+        single_flight = SingleFlight()
+        calls = []
+
+        async def answer():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        results = await asyncio.gather(*(single_flight.ado("question", answer) for _ in range(3)))
+        return results, len(calls)
+
+    results, calls = asyncio.run(scenario())
+    assert calls == 1
+    assert [shared for _, shared in results] == [False, True, True]